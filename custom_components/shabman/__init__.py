@@ -5,16 +5,21 @@
 from __future__ import annotations
 
 import logging
+from functools import partial
 
 import homeassistant.helpers.config_validation as cv
 import voluptuous as vol
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant, ServiceCall
+from homeassistant.core import HomeAssistant, ServiceCall, ServiceResponse, SupportsResponse
+from homeassistant.exceptions import ConfigEntryNotReady, HomeAssistantError
+from homeassistant.helpers.storage import Store
 from homeassistant.helpers.typing import ConfigType
 
-from .const import DOMAIN
+from .const import DEPLOY_MAX_CONCURRENT, DEPLOY_SOAK_TIME, DOMAIN, SNAPSHOT_STORAGE_KEY, SNAPSHOT_STORAGE_VERSION
 from .coordinator import ShABmanCoordinator
 
+# Deployments, sync, bundling and backups are imported by the services on first use
+
 CONFIG_SCHEMA = cv.config_entry_only_config_schema(DOMAIN)
 
 _LOGGER = logging.getLogger(__name__)
@@ -32,12 +37,18 @@ PLATFORMS = ["switch", "sensor"]
 SERVICE_UPLOAD_SCRIPT = "upload_script"
 SERVICE_DELETE_SCRIPT = "delete_script"
 SERVICE_LIST_SCRIPTS = "list_scripts"
+SERVICE_DEPLOY_SCRIPT = "deploy_script"
+SERVICE_SYNC_SCRIPTS = "sync_scripts"
+SERVICE_LIST_BACKUPS = "list_backups"
+SERVICE_RESTORE_SCRIPT = "restore_script"
+SERVICE_ROLLBACK_SCRIPT = "rollback_script"
 
 UPLOAD_SCRIPT_SCHEMA = vol.Schema(
     {
         vol.Required("device_id"): cv.string,
         vol.Required("name"): cv.string,
         vol.Required("code"): cv.string,
+        vol.Optional("force", default=False): cv.boolean,
     }
 )
 
@@ -54,6 +65,65 @@ LIST_SCRIPTS_SCHEMA = vol.Schema(
     }
 )
 
+DEPLOY_SCRIPT_SCHEMA = vol.All(
+    cv.has_at_least_one_key("device_ids", "device_type", "all"),
+    vol.Schema(
+        {
+            vol.Optional("device_ids"): vol.All(cv.ensure_list, [cv.string]),
+            vol.Optional("device_type"): cv.string,
+            vol.Optional("all", default=False): cv.boolean,
+            vol.Required("name"): cv.string,
+            vol.Required("code"): cv.string,
+            vol.Optional("force", default=False): cv.boolean,
+            vol.Optional("max_concurrent", default=DEPLOY_MAX_CONCURRENT): vol.All(
+                vol.Coerce(int), vol.Range(min=1, max=100)
+            ),
+            vol.Optional("canary_percent"): vol.All(vol.Coerce(float), vol.Range(min=0, max=100)),
+            vol.Optional("wave_size"): cv.positive_int,
+            vol.Optional("soak_time", default=DEPLOY_SOAK_TIME): vol.All(vol.Coerce(int), vol.Range(min=0, max=86400)),
+            vol.Optional("max_mem_peak"): cv.positive_int,
+        }
+    ),
+)
+
+
+SYNC_SCRIPTS_SCHEMA = vol.Schema(
+    {
+        vol.Optional("device_ids"): vol.All(cv.ensure_list, [cv.string]),
+        vol.Optional("delete_unmanaged", default=False): cv.boolean,
+        vol.Optional("max_concurrent", default=DEPLOY_MAX_CONCURRENT): vol.All(
+            vol.Coerce(int), vol.Range(min=1, max=100)
+        ),
+    }
+)
+
+
+LIST_BACKUPS_SCHEMA = vol.Schema(
+    {
+        vol.Optional("device_id"): cv.string,
+        vol.Optional("name"): cv.string,
+        vol.Optional("limit", default=50): vol.All(vol.Coerce(int), vol.Range(min=1, max=1000)),
+    }
+)
+
+_RESTORE_FIELDS = {
+    vol.Optional("device_ids"): vol.All(cv.ensure_list, [cv.string]),
+    vol.Optional("device_type"): cv.string,
+    vol.Optional("all", default=False): cv.boolean,
+    vol.Required("name"): cv.string,
+    vol.Optional("max_concurrent", default=DEPLOY_MAX_CONCURRENT): vol.All(vol.Coerce(int), vol.Range(min=1, max=100)),
+}
+
+RESTORE_SCRIPT_SCHEMA = vol.All(
+    cv.has_at_least_one_key("device_ids", "device_type", "all"),
+    vol.Schema({**_RESTORE_FIELDS, vol.Required("version"): vol.All(cv.string, vol.Length(min=6))}),
+)
+
+ROLLBACK_SCRIPT_SCHEMA = vol.All(
+    cv.has_at_least_one_key("device_ids", "device_type", "all"),
+    vol.Schema(_RESTORE_FIELDS),
+)
+
 
 async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
     """Set up the shABman component."""
@@ -72,15 +142,28 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
 
     coordinator = ShABmanCoordinator(hass, entry)
 
-    try:
-        await coordinator.async_config_entry_first_refresh()
+    if await coordinator.async_load_snapshot():
+        # Warm start: entities are created from the saved state, the device is asked in the background
+        entry.async_create_background_task(
+            hass, coordinator.async_refresh(), f"{DOMAIN}_first_refresh_{entry.entry_id}"
+        )
+        _LOGGER.info(
+            "Set up shABman for device %s from the saved state",
+            entry.data.get("device_id"),
+        )
+    else:
+        try:
+            await coordinator.async_config_entry_first_refresh()
+        except ConfigEntryNotReady:
+            await coordinator.async_shutdown()
+            raise
+        except Exception as err:
+            await coordinator.async_shutdown()
+            raise ConfigEntryNotReady(f"Error during first refresh: {err}") from err
         _LOGGER.info(
             "Successfully set up shABman for device %s",
             entry.data.get("device_id"),
         )
-    except Exception as err:
-        _LOGGER.error("Error during first refresh: %s", err, exc_info=True)
-        return False
 
     hass.data[DOMAIN][entry.entry_id] = coordinator
 
@@ -108,13 +191,22 @@ def _register_services(hass: HomeAssistant) -> None:
         device_id = call.data["device_id"]
         name = call.data["name"]
         code = call.data["code"]
+        force = call.data["force"]
 
         coordinator = _find_coordinator_by_device_id(hass, device_id)
         if not coordinator:
             _LOGGER.error("Device %s not found", device_id)
             return
 
-        result = await coordinator.upload_script(name, code)
+        from .bundle import BundleError, get_bundler
+
+        try:
+            bundle = await hass.async_add_executor_job(get_bundler(hass).bundle, code)
+        except BundleError as err:
+            _LOGGER.error("Cannot bundle script '%s': %s", name, err)
+            return
+
+        result = await coordinator.upload_script(name, bundle.code, force=force)
         if result:
             _LOGGER.info("Successfully uploaded script '%s' to device %s", name, device_id)
             await coordinator.async_request_refresh()
@@ -170,6 +262,102 @@ def _register_services(hass: HomeAssistant) -> None:
         schema=DELETE_SCRIPT_SCHEMA,
     )
 
+    async def handle_deploy_script(call: ServiceCall) -> ServiceResponse:
+        """Handle deploy script service call."""
+        coordinators = _select_coordinators(
+            hass, call.data.get("device_ids"), call.data.get("device_type"), call.data["all"]
+        )
+
+        from .backup import get_backup_store
+        from .bundle import BundleError, get_bundler
+        from .deploy import async_deploy_script, async_rollout_script
+
+        try:
+            bundle = await hass.async_add_executor_job(get_bundler(hass).bundle, call.data["code"])
+        except BundleError as err:
+            raise HomeAssistantError(f"Cannot bundle script '{call.data['name']}': {err}") from err
+
+        if "canary_percent" in call.data or "wave_size" in call.data:
+            rollout = await async_rollout_script(
+                hass,
+                list(coordinators.values()),
+                call.data["name"],
+                bundle.code,
+                force=call.data["force"],
+                max_concurrent=call.data["max_concurrent"],
+                canary_percent=call.data.get("canary_percent"),
+                wave_size=call.data.get("wave_size"),
+                soak_time=call.data["soak_time"],
+                max_mem_peak=call.data.get("max_mem_peak"),
+                backup_store=get_backup_store(hass),
+            )
+            response = rollout.as_dict()
+        else:
+            results = await async_deploy_script(
+                hass,
+                list(coordinators.values()),
+                call.data["name"],
+                bundle.code,
+                force=call.data["force"],
+                max_concurrent=call.data["max_concurrent"],
+                backup_store=get_backup_store(hass),
+            )
+            response = {"results": {result.device_id: result.as_dict() for result in results}}
+        response["hash"] = bundle.hash
+
+        _add_unknown_devices(call.data.get("device_ids"), coordinators, response)
+        return response
+
+    async def handle_list_backups(call: ServiceCall) -> ServiceResponse:
+        """Handle list backups service call."""
+        from .backup import get_backup_store
+
+        entries = await hass.async_add_executor_job(
+            partial(get_backup_store(hass).entries, call.data.get("device_id"), search=call.data.get("name"))
+        )
+        return {"backups": [entry.as_dict() for entry in entries[: call.data["limit"]]]}
+
+    async def handle_restore_script(call: ServiceCall) -> ServiceResponse:
+        """Handle restore script and rollback script service calls."""
+        from .backup import get_backup_store
+        from .deploy import async_restore_script
+
+        coordinators = _select_coordinators(
+            hass, call.data.get("device_ids"), call.data.get("device_type"), call.data["all"]
+        )
+
+        results = await async_restore_script(
+            list(coordinators.values()),
+            get_backup_store(hass),
+            call.data["name"],
+            version=call.data.get("version"),
+            max_concurrent=call.data["max_concurrent"],
+        )
+
+        response = {"results": {result.device_id: result.as_dict() for result in results}}
+        _add_unknown_devices(call.data.get("device_ids"), coordinators, response)
+        return response
+
+    async def handle_sync_scripts(call: ServiceCall) -> ServiceResponse:
+        """Handle sync scripts service call."""
+        from .backup import get_backup_store
+        from .bundle import get_bundler
+        from .sync import async_sync_scripts, bundle_sources, get_sync_index
+
+        coordinators = _select_coordinators(hass, call.data.get("device_ids"), None, True)
+        folders = await hass.async_add_executor_job(get_sync_index(hass).scan)
+        folders = await hass.async_add_executor_job(bundle_sources, folders, get_bundler(hass))
+
+        results = await async_sync_scripts(
+            list(coordinators.values()),
+            folders,
+            delete_unmanaged=call.data["delete_unmanaged"],
+            max_concurrent=call.data["max_concurrent"],
+            backup_store=get_backup_store(hass),
+        )
+
+        return {"results": {result.device_id: result.as_dict() for result in results}}
+
     hass.services.async_register(
         DOMAIN,
         SERVICE_LIST_SCRIPTS,
@@ -177,6 +365,46 @@ def _register_services(hass: HomeAssistant) -> None:
         schema=LIST_SCRIPTS_SCHEMA,
     )
 
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_DEPLOY_SCRIPT,
+        handle_deploy_script,
+        schema=DEPLOY_SCRIPT_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_SYNC_SCRIPTS,
+        handle_sync_scripts,
+        schema=SYNC_SCRIPTS_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_LIST_BACKUPS,
+        handle_list_backups,
+        schema=LIST_BACKUPS_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_RESTORE_SCRIPT,
+        handle_restore_script,
+        schema=RESTORE_SCRIPT_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_ROLLBACK_SCRIPT,
+        handle_restore_script,
+        schema=ROLLBACK_SCRIPT_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
     _LOGGER.info("Registered shABman services")
 
 
@@ -192,6 +420,36 @@ def _find_coordinator_by_device_id(hass: HomeAssistant, device_id: str):
     return None
 
 
+def _add_unknown_devices(
+    device_ids: list[str] | None, coordinators: dict[str, ShABmanCoordinator], response: dict
+) -> None:
+    """Add a failed result for every requested device id that is not set up."""
+    from .deploy import DeployResult, DeployStatus
+
+    for device_id in device_ids or []:
+        if device_id not in coordinators:
+            _LOGGER.error("Device %s not found", device_id)
+            response["results"][device_id] = DeployResult(
+                device_id, DeployStatus.FAILED, error="Device not found"
+            ).as_dict()
+
+
+def _select_coordinators(
+    hass: HomeAssistant, device_ids: list[str] | None, device_type: str | None, select_all: bool
+) -> dict[str, ShABmanCoordinator]:
+    """Return the coordinators matching a device id list and/or a device type, keyed by device_id."""
+    selected = {}
+    for coordinator in hass.data[DOMAIN].values():
+        if device_ids is not None and coordinator.device_id not in device_ids:
+            continue
+        if device_type is not None and coordinator.device_type != device_type:
+            continue
+        if device_ids is None and device_type is None and not select_all:
+            continue
+        selected[coordinator.device_id] = coordinator
+    return selected
+
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
     # Check if entry exists in hass.data
@@ -201,13 +459,11 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
 
     coordinator = hass.data[DOMAIN][entry.entry_id]
 
-    # Cancel WebSocket task
-    if hasattr(coordinator, "_ws_task") and coordinator._ws_task:
-        coordinator._ws_task.cancel()
-        try:
-            await coordinator._ws_task
-        except Exception as e:
-            _LOGGER.debug("Error canceling WebSocket task: %s", e)
+    # Stop WebSocket listener and close the pooled HTTP session
+    try:
+        await coordinator.async_shutdown()
+    except Exception as e:
+        _LOGGER.debug("Error shutting down coordinator: %s", e)
 
     # Unload platforms
     unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
@@ -218,6 +474,11 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     return unload_ok
 
 
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Remove the saved state of a deleted config entry."""
+    await Store(hass, SNAPSHOT_STORAGE_VERSION, f"{SNAPSHOT_STORAGE_KEY}.{entry.entry_id}").async_remove()
+
+
 async def async_reload_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
     """Reload config entry."""
     await async_unload_entry(hass, entry)
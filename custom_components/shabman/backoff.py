@@ -0,0 +1,118 @@
+# custom_components\shabman\backoff.py
+
+"""Reconnect backoff and circuit breaker for shABman device connections."""
+
+from __future__ import annotations
+
+import random
+import time
+from collections.abc import Callable
+from enum import StrEnum
+
+
+class ExponentialBackoff:
+    """Exponential backoff with jitter and an upper bound."""
+
+    def __init__(self, base: float, cap: float, jitter: float = 0.5) -> None:
+        """Initialize the backoff.
+
+        The n-th delay is drawn from [(1 - jitter) * d, d] with d = min(cap, base * 2**n),
+        so reconnects of many devices that went offline together spread out.
+        """
+        self._base = base
+        self._cap = cap
+        self._jitter = jitter
+        self.attempts = 0
+
+    def next_delay(self) -> float:
+        """Return the delay before the next attempt and count the attempt."""
+        delay = min(self._cap, self._base * 2**self.attempts)
+        self.attempts += 1
+        return random.uniform(delay * (1 - self._jitter), delay)
+
+    def reset(self) -> None:
+        """Start over with the base delay after a successful attempt."""
+        self.attempts = 0
+
+
+class CircuitState(StrEnum):
+    """State of a circuit breaker."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Circuit breaker for a single device.
+
+    After failure_threshold consecutive connection failures the circuit opens and requests
+    fail fast. Once reset_timeout has passed it is half-open: the next request is a probe,
+    success closes the circuit, failure opens it again with a doubled timeout.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int,
+        reset_timeout: float,
+        max_reset_timeout: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Initialize the circuit breaker."""
+        self._failure_threshold = failure_threshold
+        self._base_reset_timeout = reset_timeout
+        self._max_reset_timeout = max_reset_timeout
+        self._clock = clock
+
+        self._state = CircuitState.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self.reset_timeout = reset_timeout
+
+    @property
+    def state(self) -> CircuitState:
+        """Return the current state, moving from open to half-open once the timeout passed."""
+        if self._state is CircuitState.OPEN and self.retry_in <= 0:
+            self._state = CircuitState.HALF_OPEN
+        return self._state
+
+    @property
+    def is_open(self) -> bool:
+        """Return True while requests should fail fast."""
+        return self.state is CircuitState.OPEN
+
+    @property
+    def retry_in(self) -> float:
+        """Return seconds until the open circuit lets a probe request through."""
+        if self._state is CircuitState.CLOSED:
+            return 0.0
+        return max(0.0, self._opened_at + self.reset_timeout - self._clock())
+
+    def record_success(self) -> None:
+        """Record a successful request and close the circuit."""
+        self._state = CircuitState.CLOSED
+        self._failures = 0
+        self.reset_timeout = self._base_reset_timeout
+
+    def record_failure(self) -> bool:
+        """Record a failed request. Returns True if this failure opened the circuit."""
+        self._failures += 1
+
+        if self.state is CircuitState.HALF_OPEN:
+            # Probe failed, wait longer before the next one
+            self.reset_timeout = min(self.reset_timeout * 2, self._max_reset_timeout)
+        elif self._state is CircuitState.OPEN or self._failures < self._failure_threshold:
+            return False
+
+        self._state = CircuitState.OPEN
+        self._opened_at = self._clock()
+        return True
+
+    def as_dict(self) -> dict[str, float | int | str]:
+        """Return the breaker state for diagnostics."""
+        return {
+            "state": self.state.value,
+            "failures": self._failures,
+            "reset_timeout": self.reset_timeout,
+            "retry_in": round(self.retry_in, 1),
+        }
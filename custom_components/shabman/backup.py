@@ -0,0 +1,337 @@
+# custom_components\shabman\backup.py
+
+"""Content-addressed backup store for script code."""
+
+from __future__ import annotations
+
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.util import dt as dt_util
+
+from .const import BACKUP_DIR, BACKUP_KEEP_PER_SCRIPT, BACKUP_MAX_AGE, BACKUP_MAX_BYTES, DATA_BACKUP_STORE
+from .upload import code_hash
+
+if TYPE_CHECKING:
+    from .coordinator import ShABmanCoordinator
+
+_LOGGER = logging.getLogger(__name__)
+
+INDEX_FILE = "index.json"
+INDEX_VERSION = 1
+
+# Backups of older versions, one script_<id>_<timestamp>.json file per edit, did not record the device
+LEGACY_PATTERN = "script_*.json"
+LEGACY_DEVICE_ID = ""
+
+
+@dataclass(frozen=True, slots=True)
+class BackupEntry:
+    """A backed up version of a script."""
+
+    device_id: str
+    script_id: int
+    name: str
+    timestamp: float
+    hash: str
+    size: int  # Code length in bytes
+    stored: int  # Compressed blob size in bytes
+    by_restore: bool = False  # Replaced by a restore, never the target of a rollback
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the entry for the service response."""
+        return {
+            "device_id": self.device_id,
+            "script_id": self.script_id,
+            "name": self.name,
+            "timestamp": dt_util.utc_from_timestamp(self.timestamp).isoformat(),
+            "version": self.hash,
+            "size": self.size,
+            "by_restore": self.by_restore,
+        }
+
+
+class BackupStore:
+    """Backups of script code, stored once per content hash and gzip compressed.
+
+    A small JSON index maps (device, script, name, timestamp) to the blobs. Backing up
+    a version that matches the newest backup of the script only costs the hash. The
+    index also keeps the unminified source of the code each script holds, by the hash
+    of the code on the device. All methods are blocking, run them in the executor.
+
+    Backups of older versions are imported once, they match every device.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        keep_per_script: int = BACKUP_KEEP_PER_SCRIPT,
+        max_age: float = BACKUP_MAX_AGE,
+        max_bytes: int = BACKUP_MAX_BYTES,
+    ) -> None:
+        """Initialize the store, the index is loaded on first use."""
+        self._root = root
+        self._keep_per_script = keep_per_script
+        self._max_age = max_age
+        self._max_bytes = max_bytes
+        self._entries: list[BackupEntry] | None = None  # Oldest first
+        self._sources: dict[str, dict[str, str]] = {}  # "device/script" -> build and source hash
+        self._legacy_imported = False
+        self._lock = threading.Lock()
+
+    def add(
+        self,
+        device_id: str,
+        script_id: int,
+        name: str,
+        code: str,
+        now: float | None = None,
+        by_restore: bool = False,
+    ) -> BackupEntry:
+        """Back up a version of a script and apply the retention policy."""
+        with self._lock:
+            entries = self._load()
+            digest = code_hash(code)
+
+            latest = next((e for e in reversed(entries) if (e.device_id, e.script_id) == (device_id, script_id)), None)
+            if latest is not None and (latest.hash, latest.name, latest.by_restore) == (digest, name, by_restore):
+                return latest  # Unchanged since the last backup
+
+            data = code.encode("utf-8")
+            entry = BackupEntry(
+                device_id,
+                script_id,
+                name,
+                time.time() if now is None else now,
+                digest,
+                len(data),
+                self._write_blob(digest, data),
+                by_restore,
+            )
+            entries.append(entry)
+
+            self._apply_retention(entry.timestamp)
+            self._write_index()
+            return entry
+
+    def add_source(self, device_id: str, script_id: int, build_hash: str, code: str) -> None:
+        """Keep the source of the code a script holds on the device, replacing the previous one."""
+        with self._lock:
+            self._load()
+            digest = code_hash(code)
+            key = f"{device_id}/{script_id}"
+            previous = self._sources.get(key)
+            if previous == {"build": build_hash, "hash": digest}:
+                return
+
+            self._write_blob(digest, code.encode("utf-8"))
+            self._sources[key] = {"build": build_hash, "hash": digest}
+            if previous is not None and previous["hash"] not in self._referenced():
+                self._blob_path(previous["hash"]).unlink(missing_ok=True)
+            self._write_index()
+
+    def source(self, device_id: str, script_id: int, build_hash: str) -> str | None:
+        """Return the source of the code with this hash on the script, if it was kept."""
+        with self._lock:
+            self._load()
+            source = self._sources.get(f"{device_id}/{script_id}")
+            if source is None or source["build"] != build_hash:
+                return None
+            try:
+                return self.read(source["hash"])
+            except FileNotFoundError:
+                return None
+
+    def read(self, digest: str) -> str:
+        """Return the code of a blob."""
+        return gzip.decompress(self._blob_path(digest).read_bytes()).decode("utf-8")
+
+    def entries(
+        self,
+        device_id: str | None = None,
+        script_id: int | None = None,
+        name: str | None = None,
+        search: str | None = None,
+    ) -> list[BackupEntry]:
+        """Return the backups, newest first.
+
+        Filters by device, script id, exact script name and a case insensitive part of the name.
+        Imported backups of older versions match every device.
+        """
+        search = search.casefold() if search else None
+        with self._lock:
+            return [
+                entry
+                for entry in reversed(self._load())
+                if (device_id is None or entry.device_id in (device_id, LEGACY_DEVICE_ID))
+                and (script_id is None or entry.script_id == script_id)
+                and (name is None or entry.name == name)
+                and (search is None or search in entry.name.casefold())
+            ]
+
+    def _load(self) -> list[BackupEntry]:
+        """Return the index, reading it from disk on first use."""
+        if self._entries is None:
+            self._entries = []
+            try:
+                index = json.loads((self._root / INDEX_FILE).read_text(encoding="utf-8"))
+                self._entries = [BackupEntry(**entry) for entry in index["entries"]]
+                self._sources = dict(index.get("sources", {}))
+                self._legacy_imported = index.get("legacy_imported", False)
+            except FileNotFoundError:
+                pass
+            except (ValueError, KeyError, TypeError) as err:
+                _LOGGER.error(f"Backup index is corrupt, starting a new one: {err}")
+            if not self._legacy_imported:
+                self._import_legacy()
+        return self._entries
+
+    def _import_legacy(self) -> None:
+        """Add the backup files of older versions to the index, once. The files are left in place."""
+        imported = []
+        for path in sorted(self._root.glob(LEGACY_PATTERN)):
+            try:
+                backup = json.loads(path.read_text(encoding="utf-8"))
+                code = backup["code"]
+                script_id = int(backup["id"])
+                timestamp = datetime.strptime(backup["timestamp"], "%Y%m%d_%H%M%S").timestamp()
+            except (OSError, ValueError, KeyError, TypeError) as err:
+                _LOGGER.warning(f"Skipping unreadable backup {path.name}: {err}")
+                continue
+
+            digest = code_hash(code)
+            data = code.encode("utf-8")
+            imported.append(
+                BackupEntry(
+                    LEGACY_DEVICE_ID,
+                    script_id,
+                    str(backup.get("name", "")),
+                    timestamp,
+                    digest,
+                    len(data),
+                    self._write_blob(digest, data),
+                )
+            )
+
+        self._legacy_imported = True
+        if imported:
+            self._entries = sorted([*(self._entries or []), *imported], key=lambda entry: entry.timestamp)
+            self._apply_retention(time.time())
+            self._write_index()
+            _LOGGER.info(f"Imported {len(imported)} backups of an older version")
+
+    def _blob_path(self, digest: str) -> Path:
+        """Return the path of a blob, sharded by the first hash byte."""
+        return self._root / "blobs" / digest[:2] / f"{digest}.js.gz"
+
+    def _write_blob(self, digest: str, data: bytes) -> int:
+        """Write a blob unless it exists. Returns its size."""
+        path = self._blob_path(digest)
+        if path.exists():
+            return path.stat().st_size
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        blob = gzip.compress(data, mtime=0)
+        _write_atomic(path, blob)
+        return len(blob)
+
+    def _write_index(self) -> None:
+        """Write the index."""
+        index = {
+            "version": INDEX_VERSION,
+            "entries": [asdict(entry) for entry in self._entries or []],
+            "sources": self._sources,
+            "legacy_imported": self._legacy_imported,
+        }
+        _write_atomic(self._root / INDEX_FILE, json.dumps(index, ensure_ascii=False).encode("utf-8"))
+
+    def _apply_retention(self, now: float) -> None:
+        """Drop versions beyond the per script limit, expired ones and the oldest above the size limit.
+
+        The newest version of every script is always kept. Blobs no longer referenced are deleted.
+        """
+        entries = self._entries or []
+        newest: dict[tuple[str, int], int] = {}  # Versions seen per script, walking from newest
+        kept = []
+        for entry in reversed(entries):
+            key = (entry.device_id, entry.script_id)
+            newest[key] = newest.get(key, 0) + 1
+            if newest[key] == 1 or (newest[key] <= self._keep_per_script and now - entry.timestamp <= self._max_age):
+                kept.append(entry)
+        kept.reverse()
+
+        # Blobs are shared, the size limit counts every blob once
+        sizes = {entry.hash: entry.stored for entry in kept}
+        references = Counter(entry.hash for entry in kept)
+        latest = {(entry.device_id, entry.script_id): index for index, entry in enumerate(kept)}
+        total = sum(sizes.values())
+        dropped = set()
+        for index, entry in enumerate(kept):
+            if total <= self._max_bytes:
+                break
+            if latest[(entry.device_id, entry.script_id)] == index:
+                continue
+            dropped.add(index)
+            references[entry.hash] -= 1
+            if not references[entry.hash]:
+                total -= sizes[entry.hash]
+        kept = [entry for index, entry in enumerate(kept) if index not in dropped]
+
+        self._entries = kept
+        for digest in {entry.hash for entry in entries} - self._referenced():
+            self._blob_path(digest).unlink(missing_ok=True)
+
+    def _referenced(self) -> set[str]:
+        """Return the hashes of all blobs still in use by a backup or a kept source."""
+        return {entry.hash for entry in self._entries or []} | {source["hash"] for source in self._sources.values()}
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    """Write a file through a temporary file, so it is never left half written."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp = path.with_name(f".{path.name}.tmp")
+    temp.write_bytes(data)
+    os.replace(temp, path)
+
+
+@callback
+def get_backup_store(hass: HomeAssistant) -> BackupStore:
+    """Return the backup store shared by all devices."""
+    if DATA_BACKUP_STORE not in hass.data:
+        hass.data[DATA_BACKUP_STORE] = BackupStore(Path(hass.config.path(BACKUP_DIR)))
+    return hass.data[DATA_BACKUP_STORE]
+
+
+async def async_backup_script(hass: HomeAssistant, device_id: str, script_id: int, name: str, code: str) -> BackupEntry:
+    """Back up a version of a script without blocking the event loop."""
+    return await hass.async_add_executor_job(get_backup_store(hass).add, device_id, script_id, name, code)
+
+
+async def async_back_up_current(
+    store: BackupStore, coordinator: ShABmanCoordinator, script: dict, by_restore: bool = False
+) -> BackupEntry | None:
+    """Back up the code a script holds on the device before it is overwritten.
+
+    by_restore marks code replaced by a restore, a rollback skips it.
+    Returns None if the code could not be backed up, the caller decides whether to go on.
+    """
+    try:
+        code = await coordinator.get_script_source(script["id"])
+        if code is None:
+            raise ValueError("code could not be downloaded")
+        return await coordinator.hass.async_add_executor_job(
+            store.add, coordinator.device_id, script["id"], script.get("name", ""), code, None, by_restore
+        )
+    except Exception as err:
+        _LOGGER.warning(f"Could not back up script {script['id']} on {coordinator.device_id}: {err}")
+        return None
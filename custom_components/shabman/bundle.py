@@ -0,0 +1,121 @@
+# custom_components\shabman\bundle.py
+
+"""Bundler inlining shared library modules into Shelly scripts."""
+
+from __future__ import annotations
+
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+from homeassistant.core import HomeAssistant, callback
+
+from .const import BUNDLE_CACHE_MAX_ENTRIES, DATA_BUNDLER, LIBRARY_DIR
+from .upload import code_hash
+
+# A line "// @include ble/parse" inlines <library folder>/ble/parse.js
+_INCLUDE = re.compile(r"^[ \t]*//[ \t]*@include[ \t]+([\w-]+(?:/[\w-]+)*)[ \t]*$", re.MULTILINE)
+
+
+class BundleError(Exception):
+    """Error to indicate an include could not be resolved."""
+
+
+@dataclass(frozen=True, slots=True)
+class Bundle:
+    """A script with all includes inlined."""
+
+    code: str
+    hash: str
+    modules: tuple[str, ...] = ()
+
+
+class ScriptBundler:
+    """Resolve include directives against a library folder.
+
+    Bundles are cached by the hash of the source they were built from, together with the
+    hashes of the modules they include. A cached bundle is served as long as none of its
+    modules changed, and modules are only read again when their mtime or size changed.
+    All methods are blocking, run them in the executor, they may run concurrently.
+    """
+
+    def __init__(self, root: Path, max_entries: int = BUNDLE_CACHE_MAX_ENTRIES) -> None:
+        """Initialize the bundler."""
+        self._root = root
+        self._max_entries = max_entries
+        self._modules: dict[str, tuple[int, int, str, str]] = {}  # name -> mtime, size, code, hash
+        self._builds: OrderedDict[str, tuple[tuple[tuple[str, str], ...], Bundle]] = OrderedDict()
+        self.stats = {"builds": 0, "hits": 0, "reads": 0}
+        self._lock = threading.Lock()
+
+    def bundle(self, code: str) -> Bundle:
+        """Return the code with every included module inlined once, in include order."""
+        if _INCLUDE.search(code) is None:
+            return Bundle(code, code_hash(code))
+
+        key = code_hash(code)
+        with self._lock:
+            cached = self._builds.get(key)
+            if cached is not None and all(self._module(name)[1] == digest for name, digest in cached[0]):
+                self._builds.move_to_end(key)
+                self.stats["hits"] += 1
+                return cached[1]
+
+            included: dict[str, str] = {}
+            bundled = self._resolve(code, (), included)
+            bundle = Bundle(bundled, code_hash(bundled), tuple(included))
+            self.stats["builds"] += 1
+
+            self._builds[key] = (tuple(included.items()), bundle)
+            self._builds.move_to_end(key)
+            while len(self._builds) > self._max_entries:
+                self._builds.popitem(last=False)
+            return bundle
+
+    def _resolve(self, code: str, stack: tuple[str, ...], included: dict[str, str]) -> str:
+        """Replace the include lines of code by the modules, recursively."""
+        parts = []
+        position = 0
+
+        for match in _INCLUDE.finditer(code):
+            parts.append(code[position : match.start()])
+            position = match.end()
+
+            name = match.group(1)
+            if name in stack:
+                raise BundleError(f"Circular include: {' -> '.join((*stack, name))}")
+            if name in included:
+                continue  # Every module is inlined only once
+
+            module_code, included[name] = self._module(name)
+            parts.append(self._resolve(module_code, (*stack, name), included))
+
+        parts.append(code[position:])
+        return "".join(parts)
+
+    def _module(self, name: str) -> tuple[str, str]:
+        """Return the code and hash of a library module, reading it only if it changed."""
+        path = self._root / f"{name}.js"
+        try:
+            stat = path.stat()
+        except OSError as err:
+            self._modules.pop(name, None)
+            raise BundleError(f"Library module '{name}' not found in {self._root}") from err
+
+        cached = self._modules.get(name)
+        if cached is None or cached[:2] != (stat.st_mtime_ns, stat.st_size):
+            code = path.read_text(encoding="utf-8")
+            cached = self._modules[name] = (stat.st_mtime_ns, stat.st_size, code, code_hash(code))
+            self.stats["reads"] += 1
+
+        return cached[2], cached[3]
+
+
+@callback
+def get_bundler(hass: HomeAssistant) -> ScriptBundler:
+    """Return the bundler shared by all services."""
+    if DATA_BUNDLER not in hass.data:
+        hass.data[DATA_BUNDLER] = ScriptBundler(Path(hass.config.path(LIBRARY_DIR)))
+    return hass.data[DATA_BUNDLER]
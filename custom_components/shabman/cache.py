@@ -0,0 +1,73 @@
+# custom_components\shabman\cache.py
+
+"""Script code cache for shABman."""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+
+
+class CodeCache:
+    """Least recently used cache of script code, bounded by entry count and total code length.
+
+    Every entry remembers the configuration revision it was loaded at and is only
+    served for that revision, so a configuration change on the device invalidates it.
+    """
+
+    def __init__(self, max_entries: int, max_size: int) -> None:
+        """Initialize the cache."""
+        self._max_entries = max_entries
+        self._max_size = max_size
+        self._entries: OrderedDict[int, tuple[int | None, str]] = OrderedDict()
+        self._size = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, script_id: int, version: int | None) -> str | None:
+        """Return the cached code of a script for the given revision, or None."""
+        entry = self._entries.get(script_id)
+        if entry is None or entry[0] != version:
+            self._stats["misses"] += 1
+            return None
+
+        self._entries.move_to_end(script_id)
+        self._stats["hits"] += 1
+        return entry[1]
+
+    def put(self, script_id: int, version: int | None, code: str) -> None:
+        """Store the code of a script, evicting the least recently used entries if needed."""
+        self.invalidate(script_id)
+
+        size = len(code)
+        if size > self._max_size:
+            return  # Would evict everything else
+
+        self._entries[script_id] = (version, code)
+        self._size += size
+
+        while len(self._entries) > self._max_entries or self._size > self._max_size:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+            self._stats["evictions"] += 1
+
+    def invalidate(self, script_id: int) -> None:
+        """Drop the cached code of a script."""
+        entry = self._entries.pop(script_id, None)
+        if entry is not None:
+            self._size -= len(entry[1])
+
+    def clear(self) -> None:
+        """Drop all cached code."""
+        self._entries.clear()
+        self._size = 0
+
+    def __contains__(self, script_id: int) -> bool:
+        """Return True if code of the script is cached (for any revision)."""
+        return script_id in self._entries
+
+    def as_dict(self) -> dict[str, int]:
+        """Return size and hit statistics for diagnostics."""
+        return {
+            "entries": len(self._entries),
+            "size": self._size,
+            **self._stats,
+        }
@@ -6,16 +6,18 @@ from __future__ import annotations
 
 import logging
 from ipaddress import IPv4Address
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
-import aiohttp
 import voluptuous as vol
 from homeassistant import config_entries
 from homeassistant.core import callback
 from homeassistant.data_entry_flow import FlowResult
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
 
 from .const import CONF_DEVICE_IP, CONF_DEVICE_TYPE, DOMAIN
-from .options_flow import ShABmanOptionsFlow
+
+if TYPE_CHECKING:
+    from .options_flow import ShABmanOptionsFlow
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -47,12 +49,12 @@ async def validate_input(hass, data: dict[str, Any]) -> dict[str, Any]:
     url = f"http://{device_ip}/rpc/Shelly.GetDeviceInfo"
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=10) as response:
-                if response.status != 200:
-                    raise CannotConnect
+        session = async_get_clientsession(hass)
+        async with session.get(url, timeout=10) as response:
+            if response.status != 200:
+                raise CannotConnect
 
-                device_info = await response.json()
+            device_info = await response.json()
     except Exception as err:
         _LOGGER.error(f"Connection error: {err}")
         raise CannotConnect from err
@@ -111,4 +113,7 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         config_entry: config_entries.ConfigEntry,
     ) -> ShABmanOptionsFlow:
         """Get the options flow for this handler."""
+        # Only needed once the options are opened, not while HA starts
+        from .options_flow import ShABmanOptionsFlow
+
         return ShABmanOptionsFlow(config_entry)
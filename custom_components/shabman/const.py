@@ -6,8 +6,107 @@ DOMAIN = "shabman"
 CONF_DEVICE_IP = "device_ip"
 CONF_DEVICE_TYPE = "device_type"
 
-# Update interval in seconds
+# Options
+CONF_REFRESH_WINDOW = "refresh_window"
+CONF_POLL_INTERVAL = "poll_interval"
+CONF_POLL_INTERVAL_CONNECTED = "poll_interval_connected"
+CONF_LIVENESS_TIMEOUT = "liveness_timeout"
+CONF_MINIFY = "minify"
+CONF_MINIFY_MANGLE = "minify_mangle"
+
+# Window in seconds in which refreshes requested by WebSocket events are merged
+DEFAULT_REFRESH_WINDOW = 1.0
+
+# Seconds without any WebSocket frame until the connection counts as dead; an idle
+# socket is pinged this many times within the timeout
+DEFAULT_LIVENESS_TIMEOUT = 15
+HEARTBEAT_PER_LIVENESS_TIMEOUT = 3
+
+# Update interval in seconds (without WebSocket / while the WebSocket pushes updates)
 UPDATE_INTERVAL = 30
+UPDATE_INTERVAL_CONNECTED = 600
+
+# Upper bound in seconds for the polling backoff while the device is unreachable
+POLL_INTERVAL_UNREACHABLE_MAX = 300
+
+# WebSocket reconnect backoff in seconds (exponential with jitter)
+WS_RECONNECT_DELAY = 2
+WS_RECONNECT_DELAY_MAX = 300
+
+# Circuit breaker: consecutive connection failures until a device counts as offline,
+# and seconds until the next probe (doubled after every failed probe)
+BREAKER_FAILURE_THRESHOLD = 3
+BREAKER_RESET_TIMEOUT = 30
+BREAKER_RESET_TIMEOUT_MAX = 600
+
+# HTTP connection pool (Shelly Gen2 devices only serve a few parallel connections,
+# one of them is taken by the WebSocket listener)
+HTTP_CONNECTIONS_PER_HOST = 3
+HTTP_KEEPALIVE_TIMEOUT = 15
+
+# Concurrent RPC requests per device (HTTP connections minus the WebSocket)
+RPC_MAX_CONCURRENT = HTTP_CONNECTIONS_PER_HOST - 1
+
+# RPC timeouts in seconds
+RPC_TIMEOUT = 10
+UPLOAD_CHUNK_TIMEOUT = 15
+
+# Script upload: chunk size limits in bytes, the PutCode latency the chunk size is
+# adapted to in seconds, and the base delay before retrying a failed chunk
+UPLOAD_CHUNK_MIN = 512
+UPLOAD_CHUNK_MAX = 4096
+UPLOAD_CHUNK_TARGET_LATENCY = 1.0
+UPLOAD_RETRY_DELAY = 1
+
+# Script download: bytes per Script.GetCode call and requests in flight
+CODE_DOWNLOAD_CHUNK = 2048
+CODE_DOWNLOAD_PIPELINE = RPC_MAX_CONCURRENT
+
+# Fleet deployments: devices updated at once and the progress event fired per device
+DEPLOY_MAX_CONCURRENT = 10
+EVENT_DEPLOY_PROGRESS = f"{DOMAIN}_deploy_progress"
+
+# Rollouts in waves: default time a wave is watched before the next one and the check interval
+DEPLOY_SOAK_TIME = 60
+DEPLOY_SOAK_CHECK_INTERVAL = 5
+
+# Declarative sync: folder in the HA config directory with one subfolder per device id,
+# device type or the group folder applied to all devices
+SYNC_DIR = "shabman_scripts"
+SYNC_GROUP_ALL = "_all"
+DATA_SYNC_INDEX = f"{DOMAIN}_sync_index"
+
+# Script libraries: folder in the HA config directory with modules inlined by
+# "// @include <name>" lines, and the number of bundles kept in the build cache
+LIBRARY_DIR = "shabman_lib"
+BUNDLE_CACHE_MAX_ENTRIES = 128
+DATA_BUNDLER = f"{DOMAIN}_bundler"
+
+# Script backups: folder in the HA config directory holding compressed code blobs by
+# hash and their index, and the retention (versions per script, age, total blob size)
+BACKUP_DIR = "shabman_backups"
+BACKUP_KEEP_PER_SCRIPT = 20
+BACKUP_MAX_AGE = 90 * 24 * 3600
+BACKUP_MAX_BYTES = 10 * 1024 * 1024
+DATA_BACKUP_STORE = f"{DOMAIN}_backup_store"
+
+# Warm start: last good coordinator data per config entry, saved at most every SNAPSHOT_SAVE_DELAY seconds
+SNAPSHOT_STORAGE_KEY = f"{DOMAIN}.snapshot"
+SNAPSHOT_STORAGE_VERSION = 1
+SNAPSHOT_SAVE_DELAY = 30
+
+# Script code cache per device: number of scripts and total code length in characters
+CODE_CACHE_MAX_ENTRIES = 32
+CODE_CACHE_MAX_SIZE = 512 * 1024
+
+# RPC error code for unknown methods (e.g. not supported by older firmware)
+RPC_ERROR_NOT_FOUND = 404
+
+# Script status fields pushed by NotifyStatus and patched into the coordinator data
+SCRIPT_STATUS_FIELDS = ("running", "mem_used", "mem_free", "mem_peak", "errors")
+
+# NotifyEvent events that change the script table and require a full refresh
+SCRIPT_TABLE_EVENTS = ("config_changed", "component_added", "component_removed")
 
 # API endpoints
 RPC_SHELLY_GET_DEVICE_INFO = "/rpc/Shelly.GetDeviceInfo"
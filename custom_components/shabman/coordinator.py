@@ -4,27 +4,163 @@
 
 import asyncio
 import logging
+import math
+import secrets
+import time
+from collections import deque
+from collections.abc import AsyncIterator
+from dataclasses import dataclass, field
 from datetime import timedelta
 
 import aiohttp
 from aiohttp import WSMsgType
+from homeassistant.core import callback
+from homeassistant.helpers.storage import Store
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
-
-from .const import CONF_DEVICE_IP, CONF_DEVICE_TYPE, DOMAIN
+from homeassistant.util.json import json_loads
+
+from .backoff import CircuitBreaker, CircuitState, ExponentialBackoff
+from .cache import CodeCache
+from .const import (
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_RESET_TIMEOUT,
+    BREAKER_RESET_TIMEOUT_MAX,
+    CODE_CACHE_MAX_ENTRIES,
+    CODE_CACHE_MAX_SIZE,
+    CODE_DOWNLOAD_CHUNK,
+    CODE_DOWNLOAD_PIPELINE,
+    CONF_DEVICE_IP,
+    CONF_DEVICE_TYPE,
+    CONF_LIVENESS_TIMEOUT,
+    CONF_MINIFY,
+    CONF_MINIFY_MANGLE,
+    CONF_POLL_INTERVAL,
+    CONF_POLL_INTERVAL_CONNECTED,
+    CONF_REFRESH_WINDOW,
+    DEFAULT_LIVENESS_TIMEOUT,
+    DEFAULT_REFRESH_WINDOW,
+    DOMAIN,
+    HEARTBEAT_PER_LIVENESS_TIMEOUT,
+    HTTP_CONNECTIONS_PER_HOST,
+    HTTP_KEEPALIVE_TIMEOUT,
+    POLL_INTERVAL_UNREACHABLE_MAX,
+    RPC_ERROR_NOT_FOUND,
+    RPC_MAX_CONCURRENT,
+    RPC_TIMEOUT,
+    SCRIPT_STATUS_FIELDS,
+    SCRIPT_TABLE_EVENTS,
+    SNAPSHOT_SAVE_DELAY,
+    SNAPSHOT_STORAGE_KEY,
+    SNAPSHOT_STORAGE_VERSION,
+    UPDATE_INTERVAL,
+    UPDATE_INTERVAL_CONNECTED,
+    UPLOAD_CHUNK_MAX,
+    UPLOAD_CHUNK_MIN,
+    UPLOAD_CHUNK_TARGET_LATENCY,
+    UPLOAD_CHUNK_TIMEOUT,
+    UPLOAD_RETRY_DELAY,
+    WS_RECONNECT_DELAY,
+    WS_RECONNECT_DELAY_MAX,
+)
+from .scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, RpcScheduler
+from .upload import AdaptiveChunkSizer, UploadStats, code_hash, next_chunk
 
 _LOGGER = logging.getLogger(__name__)
 
+# Errors indicating the device could not be reached (as opposed to rejecting a call)
+CONNECTION_ERRORS = (aiohttp.ClientError, OSError, TimeoutError)
+
+
+class ShellyRpcError(Exception):
+    """Error to indicate the device rejected an RPC call."""
+
+    def __init__(self, code: int | None, message: str) -> None:
+        """Initialize the error with the RPC (or HTTP status) code."""
+        super().__init__(f"{code}: {message}")
+        self.code = code
+        self.message = message
+
+
+class DeviceUnavailable(Exception):
+    """Error to indicate the device is considered offline by the circuit breaker."""
+
+
+class _WebSocketUnavailable(Exception):
+    """Error to indicate a frame could not be sent over the WebSocket."""
+
+
+def _component_id(key: str) -> int | None:
+    """Return the numeric id of a component key like "script:3"."""
+    try:
+        return int(key.partition(":")[2])
+    except ValueError:
+        return None
+
+
+def _script_from_component(component: dict) -> dict:
+    """Build a script entry from a "script:<id>" component of Shelly.GetComponents."""
+    config = component.get("config") or {}
+    status = component.get("status") or {}
+
+    return {
+        "id": config.get("id", status.get("id")),
+        "name": config.get("name") or "",
+        "enable": config.get("enable", False),
+        "enabled": config.get("enable", False),
+        "running": status.get("running", False),
+        "mem_used": status.get("mem_used", 0),
+        "mem_free": status.get("mem_free", 0),
+        "mem_peak": status.get("mem_peak", 0),
+        "errors": status.get("errors", []),
+    }
+
+
+@dataclass(frozen=True, slots=True)
+class ScriptRecord:
+    """Compact view of a script for entity lookups by id."""
+
+    id: int
+    name: str
+    enabled: bool = False
+    running: bool = False
+    mem_used: int = 0
+    mem_free: int = 0
+    mem_peak: int = 0
+    errors: list = field(default_factory=list)
+
+    @classmethod
+    def from_script(cls, script: dict) -> "ScriptRecord":
+        """Create a record from a script of the coordinator data."""
+        return cls(
+            script["id"],
+            script.get("name", ""),
+            bool(script.get("enabled", False)),
+            bool(script.get("running", False)),
+            script.get("mem_used", 0),
+            script.get("mem_free", 0),
+            script.get("mem_peak", 0),
+            script.get("errors") or [],
+        )
+
 
 class ShABmanCoordinator(DataUpdateCoordinator):
     """Class to manage fetching data from the Shelly device."""
 
     def __init__(self, hass, config_entry):
         """Initialize the coordinator."""
+        # Adaptive polling: long safety-net interval while the WebSocket pushes updates,
+        # short interval without it, exponential backoff while the device is unreachable
+        self._poll_interval: int = config_entry.options.get(CONF_POLL_INTERVAL, UPDATE_INTERVAL)
+        self._poll_interval_connected: int = config_entry.options.get(
+            CONF_POLL_INTERVAL_CONNECTED, UPDATE_INTERVAL_CONNECTED
+        )
+        self._consecutive_failures = 0
+
         super().__init__(
             hass,
             _LOGGER,
-            name="shabman",
-            update_interval=timedelta(seconds=30),
+            name=DOMAIN,
+            update_interval=timedelta(seconds=self._poll_interval),  # Fallback polling
         )
         self.device_ip = config_entry.data[CONF_DEVICE_IP]
         self.device_type = config_entry.data[CONF_DEVICE_TYPE]
@@ -32,65 +168,273 @@ class ShABmanCoordinator(DataUpdateCoordinator):
         self.config_entry = config_entry
 
         self._ws_task = None  # WebSocket listener task
-        self._ws_session = None
-
-        super().__init__(
-            hass,
-            _LOGGER,
-            name=DOMAIN,
-            update_interval=timedelta(seconds=30),  # Fallback polling
-        )
+        self._session: aiohttp.ClientSession | None = None  # Pooled keep-alive session (HTTP + WebSocket)
+
+        # JSON-RPC over the WebSocket (requests are matched to responses by id)
+        self._ws: aiohttp.ClientWebSocketResponse | None = None
+        self._ws_src = f"{DOMAIN}-{secrets.token_hex(4)}"
+        self._ws_request_id = 0
+        self._ws_pending: dict[int, asyncio.Future] = {}
+
+        # Requests to the device: concurrency cap, interactive calls ahead of polling
+        self._scheduler = RpcScheduler(RPC_MAX_CONCURRENT)
+
+        # Liveness detection: the socket is reconnected if no frame arrives within the timeout
+        self._liveness_timeout: float = config_entry.options.get(CONF_LIVENESS_TIMEOUT, DEFAULT_LIVENESS_TIMEOUT)
+        self._ws_last_frame = 0.0
+
+        # Connection resilience: reconnect backoff and per-device circuit breaker
+        self._ws_backoff = ExponentialBackoff(WS_RECONNECT_DELAY, WS_RECONNECT_DELAY_MAX)
+        self._breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT, BREAKER_RESET_TIMEOUT_MAX)
+
+        # Frame dispatch by notification method and by component ("script:1" -> "script")
+        self._ws_method_handlers = {
+            "NotifyStatus": self._on_notify_status,
+            "NotifyFullStatus": self._on_notify_status,
+            "NotifyEvent": self._on_notify_event,
+        }
+        self._ws_component_handlers = {
+            "script": self._apply_script_status_delta,
+            "sys": self._on_sys_status,
+        }
+        self._ws_stats = {"frames": 0, "ignored": 0}
+        self._cfg_rev: int | None = None
+
+        # Cleared once the firmware turns out not to support Shelly.GetComponents
+        self._bulk_status_supported = True
+
+        # Coalesced refreshes requested by WebSocket events
+        self._refresh_window: float = config_entry.options.get(CONF_REFRESH_WINDOW, DEFAULT_REFRESH_WINDOW)
+        self._pending_refresh: asyncio.TimerHandle | None = None
+        self._refresh_stats = {"requested": 0, "suppressed": 0, "executed": 0}
+
+        # Statistics of the last script upload (diagnostics)
+        self._last_upload: UploadStats | None = None
+
+        # Content hash of the code last uploaded or downloaded per script id
+        self._code_hashes: dict[int, str] = {}
+
+        # Optional minification before upload; the source of minified scripts is kept for editing
+        self._minify: bool = config_entry.options.get(CONF_MINIFY, False)
+        self._minify_mangle: bool = config_entry.options.get(CONF_MINIFY_MANGLE, False)
+        self._sources: dict[int, str] = {}
+
+        # Serializes deployments to this device (see deploy.py)
+        self.deploy_lock = asyncio.Lock()
+
+        # Code of recently edited scripts, valid for the configuration revision it was loaded at
+        self._code_cache = CodeCache(CODE_CACHE_MAX_ENTRIES, CODE_CACHE_MAX_SIZE)
+
+        # Last good data, entities are created from it at startup before the device answers
+        self._snapshot = Store(hass, SNAPSHOT_STORAGE_VERSION, f"{SNAPSHOT_STORAGE_KEY}.{config_entry.entry_id}")
+        self.restored = False  # True while the data comes from the snapshot
 
     async def _async_update_data(self) -> dict[str, any]:
         """Fetch data from the device."""
-        try:
-            scripts = await self.list_scripts()
+        if self._breaker.is_open:
+            # Offline device: fail right away instead of waiting for request timeouts
+            self._update_poll_interval()
+            raise UpdateFailed(f"Device unreachable, next attempt in {self._breaker.retry_in:.0f}s")
 
-            # Load status for all scripts in parallel
-            status_tasks = [self.get_script_status(script["id"]) for script in scripts]
-            statuses = await asyncio.gather(*status_tasks, return_exceptions=True)
-
-            # Process scripts with their status
-            running_count = 0
-            enabled_count = 0
-
-            for script, status in zip(scripts, statuses, strict=False):
-                # "enable" kommt aus Script.List, nicht GetStatus!
-                script_enabled = script.get("enable", False)
-
-                # Handle status (running, mem_used, etc.)
-                if isinstance(status, Exception) or not status:
-                    _LOGGER.warning(f"Failed to load status for script {script['id']}")
-                    script["running"] = False
-                    script["mem_used"] = 0
-                else:
-                    script["running"] = status["running"]
-                    script["mem_used"] = status["mem_used"]
-                    script["mem_free"] = status.get("mem_free", 0)
-                    script["mem_peak"] = status.get("mem_peak", 0)
-
-                # enabled aus Script.List übernehmen!
-                script["enabled"] = script_enabled
+        try:
+            # One bulk call on current firmware, Script.List + GetStatus per script on old firmware
+            scripts = await self.get_script_components()
+            if scripts is None:
+                scripts = await self._load_scripts_legacy()
 
-                if script.get("running"):
-                    running_count += 1
-                if script.get("enabled"):
-                    enabled_count += 1
+            data = self._build_data(scripts)
+            self._forget_removed_scripts(scripts)
 
             _LOGGER.debug(
-                f"Updated data: {len(scripts)} scripts ({running_count} running, {enabled_count} autostart enabled)"
+                f"Updated data: {len(scripts)} scripts ({data['running_count']} running, "
+                f"{data['enabled_count']} autostart enabled)"
             )
 
-            return {
-                "scripts": scripts,
-                "device_type": self.device_type,
-                "running_count": running_count,
-                "enabled_count": enabled_count,
-            }
+            self._consecutive_failures = 0
+            self._update_poll_interval()
+            self.restored = False
+            self._schedule_snapshot_save()
+            return data
         except Exception as err:
             _LOGGER.error(f"Error updating data: {err}")
+            self._consecutive_failures += 1
+            self._update_poll_interval()
             raise UpdateFailed(f"Error communicating with device: {err}") from err
 
+    async def async_load_snapshot(self) -> bool:
+        """Use the data saved by the last run until the first refresh. Returns False if there is none."""
+        try:
+            snapshot = await self._snapshot.async_load()
+        except Exception as err:
+            _LOGGER.warning(f"Could not load the saved state of {self.device_id}: {err}")
+            return False
+        if not snapshot or not isinstance(snapshot.get("scripts"), list):
+            return False
+
+        self.data = self._build_data(snapshot["scripts"])
+        self.restored = True
+        _LOGGER.debug(f"Restored {len(snapshot['scripts'])} scripts of {self.device_id} from the saved state")
+        return True
+
+    @callback
+    def _schedule_snapshot_save(self) -> None:
+        """Save the current data for the next start, debounced."""
+        self._snapshot.async_delay_save(lambda: {"scripts": (self.data or {}).get("scripts", [])}, SNAPSHOT_SAVE_DELAY)
+
+    def _update_poll_interval(self) -> None:
+        """Adapt the polling interval to WebSocket health and device reachability."""
+        if self._breaker.is_open:
+            # No polling while the circuit is open, the next poll is the probe
+            seconds = max(1, math.ceil(self._breaker.retry_in))
+        elif self._consecutive_failures:
+            # Device unreachable: back off, but never poll less often than the safety net
+            seconds = min(
+                self._poll_interval * 2 ** (self._consecutive_failures - 1),
+                max(POLL_INTERVAL_UNREACHABLE_MAX, self._poll_interval),
+            )
+        elif self.websocket_connected:
+            seconds = self._poll_interval_connected
+        else:
+            seconds = self._poll_interval
+
+        interval = timedelta(seconds=seconds)
+        if interval != self.update_interval:
+            _LOGGER.debug(f"Polling interval changed to {seconds}s")
+            self.update_interval = interval
+
+    @property
+    def websocket_connected(self) -> bool:
+        """Return True if the WebSocket to the device is open."""
+        return self._ws is not None and not self._ws.closed
+
+    @property
+    def connection_stats(self) -> dict[str, any]:
+        """Return the state of the circuit breaker and the WebSocket reconnect backoff."""
+        return {
+            "circuit": self._breaker.as_dict(),
+            "websocket_reconnect_attempts": self._ws_backoff.attempts,
+            "websocket_last_frame_age": (
+                round(time.monotonic() - self._ws_last_frame, 1) if self.websocket_connected else None
+            ),
+            "liveness_timeout": self._liveness_timeout,
+            "websocket_frames": dict(self._ws_stats),
+        }
+
+    @property
+    def rpc_stats(self) -> dict[str, any]:
+        """Return queue depth and wait times of the request scheduler."""
+        return self._scheduler.as_dict()
+
+    @property
+    def upload_stats(self) -> dict[str, any] | None:
+        """Return the statistics of the last script upload."""
+        return self._last_upload.as_dict() if self._last_upload else None
+
+    @property
+    def code_cache_stats(self) -> dict[str, int]:
+        """Return size and hit rate of the script code cache."""
+        return self._code_cache.as_dict()
+
+    @property
+    def poll_stats(self) -> dict[str, any]:
+        """Return the current polling state."""
+        return {
+            "interval": self.update_interval.total_seconds(),
+            "websocket_connected": self.websocket_connected,
+            "consecutive_failures": self._consecutive_failures,
+        }
+
+    def _build_data(self, scripts: list[dict]) -> dict[str, any]:
+        """Build the coordinator data (scripts and counters) from a script table."""
+        return {
+            "scripts": scripts,
+            "scripts_by_id": {script["id"]: ScriptRecord.from_script(script) for script in scripts},
+            "device_type": self.device_type,
+            "running_count": sum(1 for script in scripts if script.get("running")),
+            "enabled_count": sum(1 for script in scripts if script.get("enabled")),
+        }
+
+    def _forget_removed_scripts(self, scripts: list[dict]) -> None:
+        """Forget the code of scripts that no longer exist.
+
+        Only a full refresh lists every script, a status push or the snapshot may miss
+        scripts uploaded since.
+        """
+        for script_id in self._code_hashes.keys() - {script["id"] for script in scripts}:
+            del self._code_hashes[script_id]
+            self._code_cache.invalidate(script_id)
+            self._sources.pop(script_id, None)
+
+    async def get_script_components(self) -> list[dict] | None:
+        """Load config and status of all scripts with (paginated) Shelly.GetComponents calls.
+
+        Returns None if the firmware does not support Shelly.GetComponents.
+        """
+        if not self._bulk_status_supported:
+            return None
+
+        scripts = []
+        offset = 0
+
+        while True:
+            try:
+                data = await self._rpc_call(
+                    "Shelly.GetComponents",
+                    {"offset": offset, "include": ["config", "status"]},
+                    priority=PRIORITY_BACKGROUND,
+                )
+            except ShellyRpcError as err:
+                if err.code != RPC_ERROR_NOT_FOUND:
+                    raise
+                _LOGGER.info("Shelly.GetComponents not supported by firmware, loading script status per script")
+                self._bulk_status_supported = False
+                return None
+
+            components = data.get("components", [])
+            for component in components:
+                if component.get("key", "").startswith("script:"):
+                    scripts.append(_script_from_component(component))
+
+            # The device returns components in pages, continue until all are loaded
+            offset += len(components)
+            if not components or offset >= data.get("total", 0):
+                break
+
+        return scripts
+
+    async def _load_scripts_legacy(self) -> list[dict]:
+        """Load scripts with Script.List and one Script.GetStatus call per script.
+
+        Script.List errors are raised, an empty list would look like all scripts were deleted.
+        """
+        data = await self._rpc_call("Script.List", http_get=True, priority=PRIORITY_BACKGROUND)
+        scripts = data.get("scripts", [])
+
+        # Load status for all scripts in parallel
+        status_tasks = [self.get_script_status(script["id"]) for script in scripts]
+        statuses = await asyncio.gather(*status_tasks, return_exceptions=True)
+
+        # Process scripts with their status
+        for script, status in zip(scripts, statuses, strict=False):
+            # "enable" kommt aus Script.List, nicht GetStatus!
+            script_enabled = script.get("enable", False)
+
+            # Handle status (running, mem_used, etc.)
+            if isinstance(status, Exception) or not status:
+                _LOGGER.warning(f"Failed to load status for script {script['id']}")
+                script["running"] = False
+                script["mem_used"] = 0
+            else:
+                script["running"] = status["running"]
+                script["mem_used"] = status["mem_used"]
+                script["mem_free"] = status.get("mem_free", 0)
+                script["mem_peak"] = status.get("mem_peak", 0)
+
+            # enabled aus Script.List übernehmen!
+            script["enabled"] = script_enabled
+
+        return scripts
+
     async def async_start_websocket(self) -> None:
         """Start WebSocket connection for real-time updates."""
         if self._ws_task:
@@ -100,224 +444,763 @@ class ShABmanCoordinator(DataUpdateCoordinator):
         _LOGGER.info("Started WebSocket listener for real-time updates")
 
     async def _websocket_listener(self) -> None:
-        """Listen for WebSocket events from Shelly."""
+        """Listen for WebSocket events and RPC responses from Shelly."""
         ws_url = f"ws://{self.device_ip}/rpc"
+        reconnect = False
 
         while True:
+            if self._breaker.is_open:
+                # Device is considered offline, wait until a probe is allowed
+                await asyncio.sleep(self._breaker.retry_in)
+
             try:
-                self._ws_session = aiohttp.ClientSession()
-                async with self._ws_session.ws_connect(ws_url) as ws:
+                async with self._get_session().ws_connect(ws_url) as ws:
+                    self._ws = ws
                     _LOGGER.info("WebSocket connected to Shelly")
-
-                    async for msg in ws:
-                        if msg.type == WSMsgType.TEXT:
-                            data = msg.json()
-
-                            # Check if it's a script notification
-                            method = data.get("method")
-                            if method == "NotifyStatus":
-                                params = data.get("params", {})
-                                # Script status changed
-                                if "script:id" in str(params):
-                                    _LOGGER.debug(f"Script status changed: {params}")
-                                    await self.async_request_refresh()
-
-                        elif msg.type == WSMsgType.ERROR:
-                            _LOGGER.error("WebSocket error")
-                            break
-                        elif msg.type == WSMsgType.CLOSED:
-                            _LOGGER.warning("WebSocket closed")
-                            break
+                    self._ws_backoff.reset()
+                    self._record_connection_success()
+                    self._update_poll_interval()
+                    if reconnect:
+                        # Notifications may have been missed while disconnected
+                        self.async_schedule_refresh()
+                    reconnect = True
+
+                    # Shelly only pushes notifications to clients that identified
+                    # themselves with a "src" in at least one request
+                    await ws.send_json({"id": 0, "src": self._ws_src, "method": "Shelly.GetDeviceInfo"})
+
+                    self._ws_last_frame = time.monotonic()
+                    heartbeat = self.hass.async_create_background_task(
+                        self._websocket_heartbeat(ws), f"{DOMAIN} {self.device_ip} websocket heartbeat"
+                    )
+                    try:
+                        await self._websocket_reader(ws)
+                    finally:
+                        heartbeat.cancel()
 
             except Exception as err:
-                _LOGGER.error(f"WebSocket error: {err}")
+                if self._ws is None:
+                    # Connecting failed; only the first failure in a row is worth a warning
+                    self._record_connection_failure()
+                    log = _LOGGER.warning if self._ws_backoff.attempts == 0 else _LOGGER.debug
+                    log(f"WebSocket connection to {self.device_ip} failed: {err}")
+                else:
+                    _LOGGER.error(f"WebSocket error: {err}")
 
             finally:
-                if self._ws_session:
-                    await self._ws_session.close()
-                    self._ws_session = None
+                self._fail_pending_ws_calls()
+                if self._ws is not None:
+                    # Lost push updates: poll faster and catch up right away
+                    self._ws = None
+                    self._update_poll_interval()
+                    self.async_schedule_refresh()
+
+            # Reconnect with exponential backoff and jitter
+            await asyncio.sleep(self._ws_backoff.next_delay())
+
+    async def _websocket_reader(self, ws) -> None:
+        """Read frames until the socket closes or the device stops answering."""
+        while True:
+            try:
+                msg = await ws.receive(timeout=self._liveness_timeout)
+            except TimeoutError:
+                # Not even the heartbeat was answered: half-open connection (reboot, Wi-Fi roam)
+                _LOGGER.warning(f"No data from {self.device_ip} for {self._liveness_timeout}s, reconnecting WebSocket")
+                self._record_connection_failure()
+                return
+
+            self._ws_last_frame = time.monotonic()
+
+            if msg.type == WSMsgType.TEXT:
+                self._handle_ws_text(msg.data)
+
+            elif msg.type == WSMsgType.ERROR:
+                _LOGGER.error("WebSocket error")
+                return
+            elif msg.type in (WSMsgType.CLOSE, WSMsgType.CLOSING, WSMsgType.CLOSED):
+                _LOGGER.warning("WebSocket closed")
+                return
+
+    async def _websocket_heartbeat(self, ws) -> None:
+        """Ping the device with a cheap RPC call whenever the socket has been idle."""
+        interval = self._liveness_timeout / HEARTBEAT_PER_LIVENESS_TIMEOUT
+
+        while not ws.closed:
+            await asyncio.sleep(interval)
+            if time.monotonic() - self._ws_last_frame < interval:
+                continue  # Other frames arrived, the connection is alive
 
-            # Reconnect after 5 seconds
-            await asyncio.sleep(5)
+            try:
+                await self._ws_call(ws, "Sys.GetStatus", None, self._liveness_timeout)
+            except Exception as err:
+                # The reader notices the missing frames and reconnects
+                _LOGGER.debug(f"WebSocket heartbeat to {self.device_ip} failed: {err}")
+
+    def _handle_ws_text(self, text: str) -> None:
+        """Handle a raw WebSocket text frame."""
+        self._ws_stats["frames"] += 1
+
+        # Cheap early-out before parsing: notifications about components we don't track
+        # (e.g. switch/em power metering, many per second). A literal "method":"Notify can
+        # only be JSON structure, inside strings the quotes would be escaped.
+        if '"method":"Notify' in text and '"script:' not in text and '"sys"' not in text:
+            self._ws_stats["ignored"] += 1
+            return
+
+        self._handle_ws_message(json_loads(text))
+
+    def _handle_ws_message(self, data: dict) -> None:
+        """Route a parsed WebSocket frame (RPC response or notification) to its handler."""
+        method = data.get("method")
+
+        # RPC response to one of our requests
+        if method is None:
+            if "id" in data:
+                self._resolve_ws_call(data)
+            return
+
+        handler = self._ws_method_handlers.get(method)
+        if handler is not None:
+            handler(data.get("params") or {})
+
+    def _on_notify_status(self, params: dict) -> None:
+        """Route the components of a NotifyStatus frame to their handlers."""
+        routed: dict[str, dict] = {}
+        for key, value in params.items():
+            component = key.partition(":")[0]
+            if component in self._ws_component_handlers:
+                routed.setdefault(component, {})[key] = value
+
+        for component, values in routed.items():
+            self._ws_component_handlers[component](values)
+
+    def _on_notify_event(self, params: dict) -> None:
+        """Handle a NotifyEvent frame."""
+        self._handle_script_events(params.get("events", []))
+
+    def _on_sys_status(self, values: dict) -> None:
+        """Refresh when the configuration revision changed (script renamed, enabled, ...)."""
+        cfg_rev = (values.get("sys") or {}).get("cfg_rev")
+        if cfg_rev is None or cfg_rev == self._cfg_rev:
+            return
+
+        if self._cfg_rev is not None:
+            _LOGGER.debug(f"Configuration revision changed to {cfg_rev}, requesting full refresh")
+            self._schedule_refresh_from_push()
+        self._cfg_rev = cfg_rev
+
+    def _apply_script_status_delta(self, deltas: dict) -> None:
+        """Patch "script:<id>" status changes from a NotifyStatus frame into the coordinator data."""
+        if self.data is None:
+            self._schedule_refresh_from_push()
+            return
+
+        scripts_by_id = {script["id"]: script for script in self.data.get("scripts", [])}
+        patched = {}
+
+        for key, delta in deltas.items():
+            script_id = _component_id(key)
+            if script_id not in scripts_by_id or not isinstance(delta, dict):
+                # Unknown script (created meanwhile?) - only a full refresh can tell
+                _LOGGER.debug(f"Ambiguous status change for {key}, requesting full refresh")
+                self._schedule_refresh_from_push()
+                return
+
+            changes = {field: delta[field] for field in SCRIPT_STATUS_FIELDS if field in delta}
+            patched[script_id] = {**scripts_by_id[script_id], **changes}
+            _LOGGER.debug(f"Script {script_id} status changed: {changes}")
+
+        scripts = [patched.get(script["id"], script) for script in self.data["scripts"]]
+        self.async_set_updated_data({**self.data, **self._build_data(scripts)})
+        self._schedule_snapshot_save()
+
+    def _handle_script_events(self, events: list[dict]) -> None:
+        """Refresh the script table when scripts were created, deleted or reconfigured."""
+        changed = False
+        for event in events:
+            component = event.get("target") or event.get("component") or ""
+            if component.startswith("script:") and event.get("event") in SCRIPT_TABLE_EVENTS:
+                _LOGGER.debug(f"Script table changed ({event.get('event')} {component}), requesting full refresh")
+                self._code_cache.invalidate(_component_id(component))
+                changed = True
+
+        if changed:
+            self._schedule_refresh_from_push()
+
+    def _schedule_refresh_from_push(self) -> None:
+        """Request a full refresh without blocking the WebSocket reader."""
+        # Never await the refresh here: it is served by this very socket
+        self.async_schedule_refresh()
+
+    @callback
+    def async_schedule_refresh(self) -> None:
+        """Schedule a full refresh, merging bursts of requests within the refresh window.
+
+        Returns immediately; requests arriving while a refresh is pending are counted as suppressed.
+        """
+        self._refresh_stats["requested"] += 1
+
+        if self._pending_refresh is not None:
+            self._refresh_stats["suppressed"] += 1
+            return
+
+        self._pending_refresh = self.hass.loop.call_later(self._refresh_window, self._run_scheduled_refresh)
+
+    @callback
+    def _run_scheduled_refresh(self) -> None:
+        """Run the pending refresh in the background."""
+        self._pending_refresh = None
+        self._refresh_stats["executed"] += 1
+        self.hass.async_create_task(self.async_refresh())
+
+    @property
+    def refresh_stats(self) -> dict[str, any]:
+        """Return statistics of the push-triggered refresh scheduler."""
+        return {"window": self._refresh_window, **self._refresh_stats}
+
+    def _resolve_ws_call(self, data: dict) -> None:
+        """Complete the pending RPC call matching the response id."""
+        future = self._ws_pending.pop(data["id"], None)
+        if future is None or future.done():
+            return  # Response to a fire-and-forget frame or a call that timed out
+
+        if "error" in data:
+            error = data["error"] or {}
+            future.set_exception(ShellyRpcError(error.get("code"), error.get("message", "")))
+        else:
+            future.set_result(data.get("result") or {})
+
+    def _fail_pending_ws_calls(self) -> None:
+        """Fail all RPC calls still waiting for a response on a closed socket."""
+        pending, self._ws_pending = self._ws_pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("WebSocket connection closed"))
 
     async def async_shutdown(self) -> None:
         """Shutdown coordinator and WebSocket."""
+        if self._pending_refresh:
+            self._pending_refresh.cancel()
+            self._pending_refresh = None
+
         if self._ws_task:
             self._ws_task.cancel()
             try:
                 await self._ws_task
             except asyncio.CancelledError:
                 pass
+            self._ws_task = None
+
+        if self._session:
+            await self._session.close()
+            self._session = None
 
-        if self._ws_session:
-            await self._ws_session.close()
+        await super().async_shutdown()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Return the pooled session shared by all requests to this device.
+
+        Connections are kept alive between requests and capped per host, because the
+        HTTP server of Shelly Gen2 devices only handles a few parallel connections.
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=HTTP_CONNECTIONS_PER_HOST,
+                keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def _rpc_call(
+        self,
+        method: str,
+        params: dict | None = None,
+        *,
+        timeout: float = RPC_TIMEOUT,
+        http_get: bool = False,
+        priority: int = PRIORITY_INTERACTIVE,
+    ) -> dict:
+        """Call an RPC method on the device.
+
+        Calls wait for a slot of the per-device scheduler, interactive calls ahead of polling.
+        The open WebSocket is used when available, otherwise the call falls back to HTTP.
+        Raises ShellyRpcError if the device rejects the call and DeviceUnavailable without
+        any I/O while the circuit breaker considers the device offline.
+        """
+        if self._breaker.is_open:
+            raise DeviceUnavailable(f"Device unreachable, next attempt in {self._breaker.retry_in:.0f}s")
+
+        try:
+            async with self._scheduler.slot(priority):
+                ws = self._ws
+                if ws is not None and not ws.closed:
+                    try:
+                        result = await self._ws_call(ws, method, params, timeout)
+                    except _WebSocketUnavailable:
+                        _LOGGER.debug(f"WebSocket unavailable, sending {method} via HTTP")
+                        result = await self._http_call(method, params, timeout, http_get)
+                else:
+                    result = await self._http_call(method, params, timeout, http_get)
+        except ShellyRpcError:
+            self._record_connection_success()  # The device answered
+            raise
+        except CONNECTION_ERRORS:
+            self._record_connection_failure()
+            raise
+
+        self._record_connection_success()
+        return result
+
+    def _record_connection_success(self) -> None:
+        """Close the circuit breaker after the device answered."""
+        if self._breaker.state is not CircuitState.CLOSED:
+            _LOGGER.info(f"Device {self.device_ip} is reachable again")
+        self._breaker.record_success()
+
+    def _record_connection_failure(self) -> None:
+        """Count a failed connection and mark entities unavailable once the circuit opens."""
+        if not self._breaker.record_failure():
+            return
+
+        _LOGGER.warning(f"Device {self.device_ip} unreachable, pausing requests for {self._breaker.reset_timeout:.0f}s")
+        self._update_poll_interval()
+        if self.last_update_success:
+            self.async_set_update_error(DeviceUnavailable(f"Device {self.device_ip} unreachable"))
+
+    async def _ws_call(self, ws, method: str, params: dict | None, timeout: float) -> dict:
+        """Send an id-tagged JSON-RPC frame and wait for the matching response."""
+        self._ws_request_id += 1
+        request_id = self._ws_request_id
+
+        frame = {"id": request_id, "src": self._ws_src, "method": method}
+        if params:
+            frame["params"] = params
+
+        future = self.hass.loop.create_future()
+        self._ws_pending[request_id] = future
+        try:
+            try:
+                await ws.send_json(frame)
+            except Exception as err:
+                raise _WebSocketUnavailable from err
+
+            async with asyncio.timeout(timeout):
+                return await future
+        finally:
+            self._ws_pending.pop(request_id, None)
+
+    async def _http_call(self, method: str, params: dict | None, timeout: float, http_get: bool) -> dict:
+        """Send an RPC call as a plain HTTP request."""
+        url = f"http://{self.device_ip}/rpc/{method}"
+        session = self._get_session()
+
+        if http_get:
+            request = session.get(url, params=params, timeout=timeout)
+        else:
+            request = session.post(url, json=params or {}, timeout=timeout)
+
+        async with request as response:
+            if response.status != 200:
+                raise ShellyRpcError(response.status, f"HTTP {response.status}")
+            return await response.json()
 
     async def list_scripts(self) -> list:
         """List all scripts on the device."""
         try:
-            url = f"http://{self.device_ip}/rpc/Script.List"
-
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=10) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        scripts = data.get("scripts", [])
-                        _LOGGER.info(f"Found {len(scripts)} scripts on device")
-                        return scripts
-                    else:
-                        _LOGGER.error(f"Failed to list scripts: {response.status}")
-                        return []
+            data = await self._rpc_call("Script.List", http_get=True, priority=PRIORITY_BACKGROUND)
+            scripts = data.get("scripts", [])
+            _LOGGER.info(f"Found {len(scripts)} scripts on device")
+            return scripts
+        except ShellyRpcError as err:
+            _LOGGER.error(f"Failed to list scripts: {err}")
+            return []
         except Exception as err:
             _LOGGER.error(f"Error listing scripts: {err}")
             return []
 
     async def get_script_code(self, script_id: int) -> str | None:
-        """Get the code of a specific script."""
+        """Get the code of a specific script, from the code cache if possible."""
+        code = self._code_cache.get(script_id, self._cfg_rev)
+        if code is not None:
+            return code
+
         try:
-            url = f"http://{self.device_ip}/rpc/Script.GetCode"
-            params = {"id": script_id}
-
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params, timeout=10) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return data.get("data", "")
-                    else:
-                        _LOGGER.error(f"Failed to get script code: {response.status}")
-                        return None
+            code = "".join([chunk async for chunk in self.iter_script_code(script_id)])
+            self._code_hashes[script_id] = code_hash(code)
+            self._code_cache.put(script_id, self._cfg_rev, code)
+            return code
+        except ShellyRpcError as err:
+            _LOGGER.error(f"Failed to get script code: {err}")
+            return None
         except Exception as err:
             _LOGGER.error(f"Error getting script code: {err}")
             return None
 
+    async def get_script_source(self, script_id: int) -> str | None:
+        """Get the code of a script for editing: the unminified source if it is known.
+
+        Sources of minified uploads are kept in the backup store, so they survive a restart.
+        """
+        source = self._sources.get(script_id)
+        if source is not None and self.code_unchanged(script_id, source):
+            return source
+
+        code = await self.get_script_code(script_id)
+        if code is None:
+            return None
+
+        from .backup import get_backup_store
+
+        try:
+            store = get_backup_store(self.hass)
+            source = await self.hass.async_add_executor_job(store.source, self.device_id, script_id, code_hash(code))
+        except Exception as err:
+            _LOGGER.warning(f"Could not read the source of script {script_id}: {err}")
+            return code
+
+        if source is None:
+            return code
+        self._sources[script_id] = source
+        return source
+
+    async def iter_script_code(self, script_id: int) -> AsyncIterator[str]:
+        """Stream the code of a script in chunks of whole characters, e.g. to write it to disk.
+
+        The first Script.GetCode call returns the head of the code and the number of bytes left.
+        The rest is requested with offset/len, up to CODE_DOWNLOAD_PIPELINE calls at a time.
+        Offsets count bytes, so a requested range may end inside a multibyte character. The
+        device then returns a little less or more than requested, and "left" tells where the
+        chunk really ended. The pipeline is restarted from there, the requests already sent
+        would start inside that character.
+
+        Raises ShellyRpcError if the device returns less code than it announced.
+        """
+        data = await self._rpc_call("Script.GetCode", {"id": script_id}, http_get=True)
+        head = data.get("data", "")
+        offset = len(head.encode("utf-8"))
+        total = offset + data.get("left", 0)
+        yield head
+
+        pending: deque[tuple[int, int, asyncio.Task]] = deque()
+        requested = offset
+
+        async def cancel_pending() -> None:
+            for _, _, task in pending:
+                task.cancel()
+            await asyncio.gather(*(task for _, _, task in pending), return_exceptions=True)
+            pending.clear()
+
+        try:
+            while offset < total:
+                while len(pending) < CODE_DOWNLOAD_PIPELINE and requested < total:
+                    length = min(CODE_DOWNLOAD_CHUNK, total - requested)
+                    request = self._rpc_call(
+                        "Script.GetCode", {"id": script_id, "offset": requested, "len": length}, http_get=True
+                    )
+                    pending.append((requested, length, asyncio.create_task(request)))
+                    requested += length
+
+                start, length, task = pending.popleft()
+                data = await task
+                chunk = data.get("data", "")
+                size = len(chunk.encode("utf-8"))
+                if not size or start + size + data.get("left", 0) != total:
+                    raise ShellyRpcError(None, f"Script {script_id} changed or was truncated during download")
+
+                offset = start + size
+                yield chunk
+
+                if size != length:
+                    # The chunk ended on the nearest character boundary instead
+                    await cancel_pending()
+                    requested = offset
+        finally:
+            await cancel_pending()
+
     async def get_script_status(self, script_id: int) -> dict | None:
         """Get detailed script status."""
         try:
-            url = f"http://{self.device_ip}/rpc/Script.GetStatus"
-            params = {"id": script_id}
-
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params, timeout=10) as response:
-                    if response.status == 200:
-                        data = await response.json()
-
-                        status = {
-                            "id": data.get("id"),
-                            "running": data.get("running", False),
-                            "enabled": data.get("enabled", False),
-                            "mem_used": data.get("mem_used", 0),
-                            "mem_free": data.get("mem_free", 0),
-                            "mem_peak": data.get("mem_peak", 0),
-                        }
-
-                        _LOGGER.debug(
-                            f"Script {script_id} status: running={status['running']}, enabled={status['enabled']}"
-                        )
-
-                        return status
-                    else:
-                        _LOGGER.error(f"Failed to get script status: {response.status}")
-                        return None
+            data = await self._rpc_call(
+                "Script.GetStatus", {"id": script_id}, http_get=True, priority=PRIORITY_BACKGROUND
+            )
+
+            status = {
+                "id": data.get("id"),
+                "running": data.get("running", False),
+                "enabled": data.get("enabled", False),
+                "mem_used": data.get("mem_used", 0),
+                "mem_free": data.get("mem_free", 0),
+                "mem_peak": data.get("mem_peak", 0),
+            }
+
+            _LOGGER.debug(f"Script {script_id} status: running={status['running']}, enabled={status['enabled']}")
+
+            return status
+        except ShellyRpcError as err:
+            _LOGGER.error(f"Failed to get script status: {err}")
+            return None
         except Exception as err:
             _LOGGER.error(f"Error getting script status {script_id}: {err}")
             return None
 
-    async def upload_script(self, name: str, code: str, retry_count: int = 3) -> bool:
-        """Upload a new script to the device with chunking and retry logic."""
+    async def upload_script(self, name: str, code: str, retry_count: int = 3, force: bool = False) -> bool:
+        """Upload a new script to the device with chunking and retry logic.
+
+        Nothing is sent if a script with this name already holds the same code, unless force is set.
+        """
+        existing = self.find_script(name)
+        if not force and existing and self.code_unchanged(existing["id"], code):
+            _LOGGER.info(f"Script '{name}' (ID {existing['id']}) is unchanged, skipping upload")
+            return True
 
         for attempt in range(retry_count):
             try:
-                url = f"http://{self.device_ip}/rpc/Script.Create"
-                payload = {"name": name}
-
-                async with aiohttp.ClientSession() as session:
-                    # First create the script
-                    async with session.post(url, json=payload, timeout=10) as response:
-                        if response.status != 200:
-                            _LOGGER.error(
-                                f"Failed to create script (attempt {attempt + 1}/{retry_count}): {response.status}"
-                            )
-                            if attempt < retry_count - 1:
-                                await asyncio.sleep(1)
-                                continue
-                            return False
-
-                        data = await response.json()
-                        script_id = data.get("id")
-
-                        if not script_id:
-                            _LOGGER.error("No script ID returned")
-                            return False
-
-                    _LOGGER.info(f"Created script '{name}' with ID {script_id}")
-
-                    # Upload code in chunks
-                    chunk_size = 4096
-                    code_bytes = code.encode("utf-8")
-                    code_length = len(code_bytes)
-                    offset = 0
-
-                    while offset < code_length:
-                        chunk_bytes = code_bytes[offset : offset + chunk_size]
-                        chunk = chunk_bytes.decode("utf-8", errors="ignore")
-                        append = offset > 0
-
-                        url = f"http://{self.device_ip}/rpc/Script.PutCode"
-                        payload = {
-                            "id": script_id,
-                            "code": chunk,
-                            "append": append,
-                        }
-
-                        async with session.post(url, json=payload, timeout=15) as response:
-                            if response.status != 200:
-                                _LOGGER.error(
-                                    f"Failed to upload chunk at offset {offset} "
-                                    f"(attempt {attempt + 1}/{retry_count}): {response.status}"
-                                )
-                                await self.delete_script(script_id)
-
-                                if attempt < retry_count - 1:
-                                    await asyncio.sleep(2)
-                                    break
-                                return False
-
-                        _LOGGER.debug(
-                            f"Uploaded chunk {offset}-{offset + len(chunk_bytes)} of {code_length} bytes "
-                            f"({int((offset + len(chunk_bytes)) / code_length * 100)}%)"
-                        )
-                        offset += len(chunk_bytes)
-                        await asyncio.sleep(0.1)
-
-                    chunk_count = (code_length // chunk_size) + 1
-                    _LOGGER.info(
-                        f"Successfully uploaded script '{name}' with ID {script_id} "
-                        f"({code_length} bytes in {chunk_count} chunks)"
-                    )
-                    return True
-
+                data = await self._rpc_call("Script.Create", {"name": name})
+                break
             except Exception as err:
-                _LOGGER.error(f"Error uploading script (attempt {attempt + 1}/{retry_count}): {err}")
+                _LOGGER.error(f"Failed to create script (attempt {attempt + 1}/{retry_count}): {err}")
                 if attempt < retry_count - 1:
-                    await asyncio.sleep(2)
-                else:
-                    return False
+                    await asyncio.sleep(UPLOAD_RETRY_DELAY)
+        else:
+            return False
+
+        script_id = data.get("id")
+
+        if not script_id:
+            _LOGGER.error("No script ID returned")
+            return False
+
+        _LOGGER.info(f"Created script '{name}' with ID {script_id}")
+
+        stats = await self._put_source(script_id, code, retry_count)
+        if stats is None:
+            self._code_hashes.pop(script_id, None)
+            # Do not leave a half uploaded script behind
+            await self.delete_script(script_id)
+            return False
+
+        _LOGGER.info(f"Successfully uploaded script '{name}' with ID {script_id} ({stats.summary()})")
+        return True
+
+    def build_code(self, code: str) -> str:
+        """Return the code as it is uploaded, minified if enabled in the options."""
+        if not self._minify:
+            return code
+
+        from .minify import MinifyError, minify
+
+        try:
+            return minify(code, self._minify_mangle)
+        except MinifyError as err:
+            _LOGGER.warning(f"Uploading script unminified: {err}")
+            return code
+
+    async def _put_source(self, script_id: int, code: str, retry_count: int = 3) -> UploadStats | None:
+        """Build the code and write it to the script, keeping the source if it was minified."""
+        built = self.build_code(code)
+        stats = await self._put_code(script_id, built, retry_count)
+        if stats is None:
+            return None
+
+        stats.source_bytes = len(code.encode("utf-8")) if built != code else stats.bytes
+        if built != code:
+            self._sources[script_id] = code
+            await self._async_save_source(script_id, built, code)
+        return stats
+
+    async def _async_save_source(self, script_id: int, built: str, code: str) -> None:
+        """Keep the source of minified code in the backup store, to edit it after a restart."""
+        from .backup import get_backup_store
+
+        try:
+            store = get_backup_store(self.hass)
+            await self.hass.async_add_executor_job(store.add_source, self.device_id, script_id, code_hash(built), code)
+        except Exception as err:
+            _LOGGER.warning(f"Could not save the source of script {script_id}: {err}")
+
+    async def _put_code(self, script_id: int, code: str, retry_count: int = 3) -> UploadStats | None:
+        """Write the code of a script in chunks. Returns None if a chunk failed retry_count times.
+
+        Chunks end on UTF-8 character boundaries and their size follows the PutCode latency.
+        A failed chunk is retried from the last acknowledged offset instead of starting over.
+        """
+        # The code on the device is unknown until the upload completes
+        self._code_hashes.pop(script_id, None)
+        self._code_cache.invalidate(script_id)
+        self._sources.pop(script_id, None)
+
+        code_bytes = code.encode("utf-8")
+        code_length = len(code_bytes)
+        sizer = AdaptiveChunkSizer(UPLOAD_CHUNK_MIN, UPLOAD_CHUNK_MAX, UPLOAD_CHUNK_TARGET_LATENCY)
+        stats = UploadStats(bytes=code_length, source_bytes=code_length)
+        self._last_upload = stats
+        start = time.monotonic()
+        offset = 0
+        failures = 0
+
+        while offset < code_length:
+            chunk, end = next_chunk(code_bytes, offset, sizer.size)
+            payload = {"id": script_id, "code": chunk, "append": offset > 0}
+            sent = time.monotonic()
+
+            try:
+                await self._rpc_call("Script.PutCode", payload, timeout=UPLOAD_CHUNK_TIMEOUT)
+            except Exception as err:
+                failures += 1
+                _LOGGER.warning(f"Failed to upload chunk at offset {offset} (attempt {failures}/{retry_count}): {err}")
+                if failures >= retry_count:
+                    stats.duration = time.monotonic() - start
+                    return None
+
+                sizer.record_failure()
+                stats.retries += 1
+                await asyncio.sleep(UPLOAD_RETRY_DELAY * 2 ** (failures - 1))
+
+                if not isinstance(err, ShellyRpcError):
+                    # The chunk may have arrived even though the response got lost
+                    offset = await self._resume_offset(script_id, offset, end)
+                    stats.resumed += 1
+                continue
+
+            latency = time.monotonic() - sent
+            failures = 0
+            sizer.record_latency(latency)
+            stats.chunks += 1
+            offset = end
+            _LOGGER.debug(
+                f"Uploaded chunk {offset}/{code_length} bytes ({int(offset / code_length * 100)}%) in {latency:.2f}s"
+            )
+
+        stats.duration = time.monotonic() - start
+        self._code_hashes[script_id] = code_hash(code)
+        self._code_cache.put(script_id, self._cfg_rev, code)
+        return stats
+
+    def get_script(self, script_id: int) -> ScriptRecord | None:
+        """Return the script with this id from the current data."""
+        data = self.data or {}
+        scripts_by_id = data.get("scripts_by_id")
+        if scripts_by_id is None:
+            # Data not built by _build_data, e.g. passed to async_set_updated_data directly
+            script = next((script for script in data.get("scripts", []) if script["id"] == script_id), None)
+            return ScriptRecord.from_script(script) if script else None
+        return scripts_by_id.get(script_id)
+
+    def find_script(self, name: str) -> dict | None:
+        """Return the script with this name from the coordinator data."""
+        scripts = self.data.get("scripts", []) if self.data else []
+        return next((script for script in scripts if script.get("name") == name), None)
+
+    def get_code_hash(self, script_id: int) -> str | None:
+        """Return the content hash of the code the script is known to hold."""
+        return self._code_hashes.get(script_id)
+
+    def code_unchanged(self, script_id: int, code: str) -> bool:
+        """Return True if the script is known to hold this code (after minification)."""
+        return self._code_hashes.get(script_id) == code_hash(self.build_code(code))
+
+    async def _resume_offset(self, script_id: int, acked: int, end: int) -> int:
+        """Return the offset to continue an upload at after a chunk ended without a response.
+
+        The code length on the device tells whether the chunk [acked, end) was applied.
+        If the length matches neither, the upload starts over from offset 0.
+        """
+        try:
+            data = await self._rpc_call("Script.GetCode", {"id": script_id, "offset": acked, "len": 1}, http_get=True)
+        except Exception as err:
+            _LOGGER.debug(f"Could not read back code of script {script_id}, restarting upload: {err}")
+            return 0
+
+        length = acked + len(data.get("data", "").encode("utf-8")) + data.get("left", 0)
+        if length in (acked, end):
+            return length
+        return 0
+
+    async def update_script(self, script_id: int, name: str, code: str, force: bool = False) -> bool:
+        """Replace the code and name of an existing script, keeping its id.
+
+        A running script is stopped for the upload and started again afterwards.
+        Unchanged code is not sent again, unless force is set. If the upload fails, the
+        previous code is written back so the script is not left with partial code.
+        A failed rename does not fail the update, the script holds the new code either way.
+        """
+        try:
+            if not force and self.code_unchanged(script_id, code):
+                await self._rename_script(script_id, name)
+                _LOGGER.info(f"Code of script {script_id} is unchanged, skipping upload")
+                return True
+
+            previous = await self.get_script_code(script_id)
+            source = self._sources.get(script_id)
+
+            data = await self._rpc_call("Script.Stop", {"id": script_id})
+            was_running = data.get("was_running", False)
+
+            stats = await self._put_source(script_id, code)
+            if stats is None:
+                _LOGGER.error(f"Failed to write code of script {script_id}")
+                await self._restore_code(script_id, previous, source, was_running)
+                return False
+
+            try:
+                await self._rename_script(script_id, name)
+            finally:
+                if was_running:
+                    await self._rpc_call("Script.Start", {"id": script_id})
+
+            _LOGGER.info(f"Successfully updated script '{name}' with ID {script_id} ({stats.summary()})")
+            return True
+        except ShellyRpcError as err:
+            _LOGGER.error(f"Failed to update script {script_id}: {err}")
+            return False
+        except Exception as err:
+            _LOGGER.error(f"Error updating script {script_id}: {err}")
+            return False
 
-        return False
+    async def _rename_script(self, script_id: int, name: str) -> bool:
+        """Set the name of a script unless it already has it. Returns False if the rename failed.
+
+        Every Script.SetConfig bumps cfg_rev, which invalidates the code cache of the device.
+        """
+        script = self.get_script(script_id)
+        if script is not None and script.name == name:
+            return True
+
+        try:
+            await self._rpc_call("Script.SetConfig", {"id": script_id, "config": {"name": name}})
+            return True
+        except Exception as err:
+            _LOGGER.warning(f"Could not rename script {script_id} to '{name}': {err}")
+            return False
+
+    async def _restore_code(self, script_id: int, code: str | None, source: str | None, was_running: bool) -> None:
+        """Write back the code a failed update replaced and start the script again if it was running."""
+        if code is None:
+            _LOGGER.error(f"Previous code of script {script_id} is unknown, leaving the script stopped")
+            return
+
+        if await self._put_code(script_id, code) is None:
+            _LOGGER.error(f"Failed to restore the previous code of script {script_id}")
+            return
+
+        if source is not None:
+            self._sources[script_id] = source
+        if was_running:
+            await self._rpc_call("Script.Start", {"id": script_id})
+        _LOGGER.info(f"Restored the previous code of script {script_id}")
 
     async def delete_script(self, script_id: int) -> bool:
         """Delete a script from the device."""
         try:
-            url = f"http://{self.device_ip}/rpc/Script.Delete"
-            payload = {"id": script_id}
-
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=payload, timeout=10) as response:
-                    if response.status == 200:
-                        _LOGGER.info(f"Successfully deleted script {script_id}")
-                        return True
-                    else:
-                        _LOGGER.error(f"Failed to delete script: {response.status}")
-                        return False
+            await self._rpc_call("Script.Delete", {"id": script_id})
+            self._code_hashes.pop(script_id, None)
+            self._code_cache.invalidate(script_id)
+            self._sources.pop(script_id, None)
+            _LOGGER.info(f"Successfully deleted script {script_id}")
+            return True
+        except ShellyRpcError as err:
+            _LOGGER.error(f"Failed to delete script: {err}")
+            return False
         except Exception as err:
             _LOGGER.error(f"Error deleting script: {err}")
             return False
@@ -325,24 +1208,18 @@ class ShABmanCoordinator(DataUpdateCoordinator):
     async def start_script(self, script_id: int) -> bool:
         """Start a script on the device."""
         try:
-            url = f"http://{self.device_ip}/rpc/Script.Start"
-            payload = {"id": script_id}
-
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=payload, timeout=10) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        was_running = data.get("was_running", False)
-
-                        if was_running:
-                            _LOGGER.info(f"Script {script_id} was already running")
-                        else:
-                            _LOGGER.info(f"Successfully started script {script_id}")
-
-                        return True
-                    else:
-                        _LOGGER.error(f"Failed to start script: {response.status}")
-                        return False
+            data = await self._rpc_call("Script.Start", {"id": script_id})
+            was_running = data.get("was_running", False)
+
+            if was_running:
+                _LOGGER.info(f"Script {script_id} was already running")
+            else:
+                _LOGGER.info(f"Successfully started script {script_id}")
+
+            return True
+        except ShellyRpcError as err:
+            _LOGGER.error(f"Failed to start script: {err}")
+            return False
         except Exception as err:
             _LOGGER.error(f"Error starting script {script_id}: {err}")
             return False
@@ -350,24 +1227,18 @@ class ShABmanCoordinator(DataUpdateCoordinator):
     async def stop_script(self, script_id: int) -> bool:
         """Stop a script on the device."""
         try:
-            url = f"http://{self.device_ip}/rpc/Script.Stop"
-            payload = {"id": script_id}
-
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=payload, timeout=10) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        was_running = data.get("was_running", False)
-
-                        if not was_running:
-                            _LOGGER.info(f"Script {script_id} was not running")
-                        else:
-                            _LOGGER.info(f"Successfully stopped script {script_id}")
-
-                        return True
-                    else:
-                        _LOGGER.error(f"Failed to stop script: {response.status}")
-                        return False
+            data = await self._rpc_call("Script.Stop", {"id": script_id})
+            was_running = data.get("was_running", False)
+
+            if not was_running:
+                _LOGGER.info(f"Script {script_id} was not running")
+            else:
+                _LOGGER.info(f"Successfully stopped script {script_id}")
+
+            return True
+        except ShellyRpcError as err:
+            _LOGGER.error(f"Failed to stop script: {err}")
+            return False
         except Exception as err:
             _LOGGER.error(f"Error stopping script {script_id}: {err}")
             return False
@@ -375,17 +1246,12 @@ class ShABmanCoordinator(DataUpdateCoordinator):
     async def set_script_config(self, script_id: int, enabled: bool) -> bool:
         """Enable or disable script autostart."""
         try:
-            url = f"http://{self.device_ip}/rpc/Script.SetConfig"
-            payload = {"id": script_id, "config": {"enable": enabled}}
-
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=payload, timeout=10) as response:
-                    if response.status == 200:
-                        _LOGGER.info(f"Script {script_id} autostart {'enabled' if enabled else 'disabled'}")
-                        return True
-                    else:
-                        _LOGGER.error(f"Failed to set script config: {response.status}")
-                        return False
+            await self._rpc_call("Script.SetConfig", {"id": script_id, "config": {"enable": enabled}})
+            _LOGGER.info(f"Script {script_id} autostart {'enabled' if enabled else 'disabled'}")
+            return True
+        except ShellyRpcError as err:
+            _LOGGER.error(f"Failed to set script config: {err}")
+            return False
         except Exception as err:
             _LOGGER.error(f"Error setting script config {script_id}: {err}")
             return False
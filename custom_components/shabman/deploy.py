@@ -0,0 +1,446 @@
+# custom_components\shabman\deploy.py
+
+"""Deploy a script to many shABman devices at once."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import time
+import uuid
+from dataclasses import dataclass
+from enum import StrEnum
+from typing import TYPE_CHECKING, Any
+
+from homeassistant.core import HomeAssistant
+
+from .backup import async_back_up_current
+from .const import DEPLOY_SOAK_CHECK_INTERVAL, EVENT_DEPLOY_PROGRESS
+
+if TYPE_CHECKING:
+    from .backup import BackupStore
+    from .coordinator import ShABmanCoordinator
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class DeployStatus(StrEnum):
+    """Outcome of a deployment to a single device."""
+
+    OK = "ok"
+    SKIPPED = "skipped"  # The device already holds the same code
+    FAILED = "failed"
+    ROLLED_BACK = "rolled_back"  # Deployed, then restored after a halted rollout
+    CANCELLED = "cancelled"  # Not deployed because the rollout halted before its wave
+
+
+@dataclass
+class DeployResult:
+    """Result of a deployment to a single device."""
+
+    device_id: str
+    status: DeployStatus
+    duration: float = 0.0
+    bytes: int = 0
+    error: str | None = None
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the result for the service response."""
+        return {
+            "status": self.status.value,
+            "duration": round(self.duration, 3),
+            "bytes": self.bytes,
+            "error": self.error,
+        }
+
+
+async def async_deploy_to_device(
+    coordinator: ShABmanCoordinator,
+    name: str,
+    code: str,
+    force: bool,
+    backup_store: BackupStore | None = None,
+    by_restore: bool = False,
+) -> DeployResult:
+    """Create or update the script with this name on one device.
+
+    If a backup store is given, the code an existing script holds is backed up before it is replaced,
+    marked with by_restore for a restore.
+    """
+    start = time.monotonic()
+
+    # One deployment per device at a time, the device serves only a few requests in parallel
+    async with coordinator.deploy_lock:
+        script = coordinator.find_script(name)
+
+        if not force and script is not None and coordinator.code_unchanged(script["id"], code):
+            status = DeployStatus.SKIPPED
+        elif script is not None:
+            if backup_store is not None:
+                await async_back_up_current(backup_store, coordinator, script, by_restore)
+            ok = await coordinator.update_script(script["id"], name, code, force=True)
+            status = DeployStatus.OK if ok else DeployStatus.FAILED
+        else:
+            ok = await coordinator.upload_script(name, code)
+            status = DeployStatus.OK if ok else DeployStatus.FAILED
+
+    result = DeployResult(coordinator.device_id, status, time.monotonic() - start)
+    if status is DeployStatus.OK:
+        result.bytes = len(code.encode("utf-8"))
+        await coordinator.async_request_refresh()
+    elif status is DeployStatus.FAILED:
+        result.error = f"Upload of script '{name}' failed"
+    return result
+
+
+class Deployment:
+    """A script deployment to a set of devices, possibly in several waves."""
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        name: str,
+        code: str,
+        total: int,
+        *,
+        force: bool = False,
+        deploy_id: str | None = None,
+        backup_store: BackupStore | None = None,
+    ) -> None:
+        """Initialize the deployment."""
+        self.hass = hass
+        self.name = name
+        self.code = code
+        self.force = force
+        self.backup_store = backup_store
+        self.deploy_id = deploy_id or uuid.uuid4().hex
+        self._total = total
+        self._completed = 0
+
+    async def async_deploy(
+        self, coordinators: list[ShABmanCoordinator], max_concurrent: int, wave: int | None = None
+    ) -> list[DeployResult]:
+        """Deploy the script to the devices concurrently, at most max_concurrent at once.
+
+        A progress event is fired on the bus for every finished device.
+        """
+        semaphore = asyncio.Semaphore(max_concurrent)
+
+        async def deploy(coordinator: ShABmanCoordinator) -> DeployResult:
+            async with semaphore:
+                try:
+                    result = await async_deploy_to_device(
+                        coordinator, self.name, self.code, self.force, self.backup_store
+                    )
+                except Exception as err:  # A single device must not abort the whole deployment
+                    _LOGGER.error(f"Error deploying script '{self.name}' to {coordinator.device_id}: {err}")
+                    result = DeployResult(coordinator.device_id, DeployStatus.FAILED, error=str(err))
+
+            self._completed += 1
+            self.fire_progress(result, wave)
+            return result
+
+        return await asyncio.gather(*(deploy(coordinator) for coordinator in coordinators))
+
+    def fire_progress(self, result: DeployResult, wave: int | None = None) -> None:
+        """Fire a progress event for a device."""
+        self.hass.bus.async_fire(
+            EVENT_DEPLOY_PROGRESS,
+            {
+                "deploy_id": self.deploy_id,
+                "name": self.name,
+                "device_id": result.device_id,
+                "status": result.status.value,
+                "wave": wave,
+                "completed": self._completed,
+                "total": self._total,
+            },
+        )
+
+
+async def async_deploy_script(
+    hass: HomeAssistant,
+    coordinators: list[ShABmanCoordinator],
+    name: str,
+    code: str,
+    *,
+    force: bool = False,
+    max_concurrent: int,
+    deploy_id: str | None = None,
+    backup_store: BackupStore | None = None,
+) -> list[DeployResult]:
+    """Deploy a script to several devices concurrently, at most max_concurrent at once."""
+    deployment = Deployment(
+        hass, name, code, len(coordinators), force=force, deploy_id=deploy_id, backup_store=backup_store
+    )
+    _LOGGER.info(f"Deploying script '{name}' to {len(coordinators)} devices ({deployment.deploy_id})")
+    return await deployment.async_deploy(coordinators, max_concurrent)
+
+
+@dataclass
+class RolloutResult:
+    """Result of a rollout in waves."""
+
+    results: list[DeployResult]
+    halted: bool = False
+    reason: str | None = None
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the result for the service response."""
+        return {
+            "results": {result.device_id: result.as_dict() for result in self.results},
+            "halted": self.halted,
+            "reason": self.reason,
+        }
+
+
+def plan_waves(
+    coordinators: list[ShABmanCoordinator], canary_percent: float | None, wave_size: int | None
+) -> list[list[ShABmanCoordinator]]:
+    """Split the devices into a canary wave (at least one device) and waves of wave_size devices."""
+    canary = max(1, math.ceil(len(coordinators) * canary_percent / 100)) if canary_percent and coordinators else 0
+    waves = [coordinators[:canary]] if canary else []
+
+    rest = coordinators[canary:]
+    size = wave_size or len(rest) or 1
+    waves.extend(rest[index : index + size] for index in range(0, len(rest), size))
+    return waves
+
+
+def script_health_problem(script: dict | None, was_running: bool, max_mem_peak: int | None) -> str | None:
+    """Return why a deployed script looks unhealthy, or None if it looks fine."""
+    if script is None:
+        return "script missing"
+    if script.get("errors"):
+        return f"script errors: {', '.join(map(str, script['errors']))}"
+    if was_running and not script.get("running"):
+        return "script stopped"
+    if max_mem_peak and (script.get("mem_peak") or 0) > max_mem_peak:
+        return f"mem_peak {script['mem_peak']} above {max_mem_peak}"
+    return None
+
+
+async def async_rollout_script(
+    hass: HomeAssistant,
+    coordinators: list[ShABmanCoordinator],
+    name: str,
+    code: str,
+    *,
+    force: bool = False,
+    max_concurrent: int,
+    canary_percent: float | None = None,
+    wave_size: int | None = None,
+    soak_time: float = 0,
+    max_mem_peak: int | None = None,
+    deploy_id: str | None = None,
+    backup_store: BackupStore | None = None,
+) -> RolloutResult:
+    """Deploy a script in waves, starting with a canary group.
+
+    After each wave the updated scripts are watched for soak_time seconds. If a device of the
+    wave fails to deploy, or its script stops, reports errors or exceeds max_mem_peak, the
+    rollout halts and every device updated so far is rolled back to its previous code.
+    """
+    deployment = Deployment(
+        hass, name, code, len(coordinators), force=force, deploy_id=deploy_id, backup_store=backup_store
+    )
+    waves = plan_waves(coordinators, canary_percent, wave_size)
+    results: dict[str, DeployResult] = {}
+    backups: dict[str, tuple[str | None, bool]] = {}  # Previous code (None = new script) and running state
+    reason = None
+
+    _LOGGER.info(
+        f"Rolling out script '{name}' to {len(coordinators)} devices in {len(waves)} waves ({deployment.deploy_id})"
+    )
+
+    semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def back_up(coordinator: ShABmanCoordinator) -> bool:
+        """Remember the current code and running state to roll back to."""
+        script = coordinator.find_script(name)
+        async with semaphore:
+            previous = await coordinator.get_script_code(script["id"]) if script else None
+        if script and previous is None:
+            results[coordinator.device_id] = DeployResult(
+                coordinator.device_id, DeployStatus.FAILED, error="Could not back up the current code"
+            )
+            return False
+        backups[coordinator.device_id] = (previous, bool(script and script.get("running")))
+        return True
+
+    for number, wave in enumerate(waves):
+        backed_up = await asyncio.gather(*(back_up(coordinator) for coordinator in wave))
+        deployable = [coordinator for coordinator, ok in zip(wave, backed_up, strict=True) if ok]
+
+        for result in await deployment.async_deploy(deployable, max_concurrent, wave=number):
+            results[result.device_id] = result
+
+        failed = [
+            coordinator.device_id
+            for coordinator in wave
+            if results[coordinator.device_id].status is DeployStatus.FAILED
+        ]
+        if failed:
+            reason = f"Wave {number} failed on {', '.join(failed)}"
+        elif soak_time:
+            deployed = [c for c in wave if results[c.device_id].status is DeployStatus.OK]
+            if problem := await _async_soak(deployed, name, soak_time, max_mem_peak):
+                reason = f"Wave {number} unhealthy: {problem}"
+
+        if reason:
+            break
+
+    if reason:
+        _LOGGER.error(f"Rollout of script '{name}' halted: {reason}")
+        await _async_roll_back(deployment, coordinators, results, backups)
+
+    for coordinator in coordinators:
+        results.setdefault(coordinator.device_id, DeployResult(coordinator.device_id, DeployStatus.CANCELLED))
+
+    return RolloutResult([results[coordinator.device_id] for coordinator in coordinators], bool(reason), reason)
+
+
+async def _async_soak(
+    coordinators: list[ShABmanCoordinator], name: str, soak_time: float, max_mem_peak: int | None
+) -> str | None:
+    """Watch the deployed scripts for soak_time seconds. Returns the first problem found."""
+    running = {c.device_id: bool((c.find_script(name) or {}).get("running")) for c in coordinators}
+    deadline = time.monotonic() + soak_time
+
+    while True:
+        remaining = deadline - time.monotonic()
+        await asyncio.sleep(max(0.0, min(DEPLOY_SOAK_CHECK_INTERVAL, remaining)))
+
+        scripts = await asyncio.gather(*(_async_read_script(coordinator, name) for coordinator in coordinators))
+        for coordinator, script in zip(coordinators, scripts, strict=True):
+            if problem := script_health_problem(script, running[coordinator.device_id], max_mem_peak):
+                return f"{coordinator.device_id}: {problem}"
+
+        if remaining <= DEPLOY_SOAK_CHECK_INTERVAL:
+            return None
+
+
+async def _async_read_script(coordinator: ShABmanCoordinator, name: str) -> dict | None:
+    """Return the script with its current status read from the device.
+
+    Connected devices are polled rarely and pushes do not carry the memory usage, so the
+    coordinator data alone would only show the values from right after the deployment.
+    """
+    script = coordinator.find_script(name)
+    if script is None:
+        return None
+
+    status = await coordinator.get_script_status(script["id"])
+    if status is None:
+        return script  # Judge by the coordinator data
+    return {**script, **{key: status[key] for key in ("running", "mem_used", "mem_peak")}}
+
+
+async def _async_roll_back(
+    deployment: Deployment,
+    coordinators: list[ShABmanCoordinator],
+    results: dict[str, DeployResult],
+    backups: dict[str, tuple[str | None, bool]],
+) -> None:
+    """Restore the previous code on all devices the rollout touched.
+
+    Devices whose deployment failed are rolled back as well, the failed update may have
+    stopped the script and partly overwritten its code.
+    """
+
+    async def roll_back(coordinator: ShABmanCoordinator) -> None:
+        previous, was_running = backups[coordinator.device_id]
+        try:
+            async with coordinator.deploy_lock:
+                script = coordinator.find_script(deployment.name)
+                if script is None:
+                    ok = previous is None
+                elif previous is None:
+                    ok = await coordinator.delete_script(script["id"])
+                else:
+                    ok = await coordinator.update_script(script["id"], deployment.name, previous, force=True)
+                    if ok and was_running:
+                        ok = await coordinator.start_script(script["id"])
+            await coordinator.async_request_refresh()
+        except Exception as err:
+            _LOGGER.error(f"Error rolling back script '{deployment.name}' on {coordinator.device_id}: {err}")
+            ok = False
+
+        result = results[coordinator.device_id]
+        if ok:
+            result.status = DeployStatus.ROLLED_BACK  # The error of a failed deployment is kept
+        else:
+            result.status = DeployStatus.FAILED
+            result.error = "Rollback failed"
+        deployment.fire_progress(result)
+
+    touched = [
+        coordinator
+        for coordinator in coordinators
+        if coordinator.device_id in backups
+        and coordinator.device_id in results
+        and results[coordinator.device_id].status not in (DeployStatus.SKIPPED, DeployStatus.CANCELLED)
+    ]
+    await asyncio.gather(*(roll_back(coordinator) for coordinator in touched))
+
+
+async def async_restore_to_device(
+    coordinator: ShABmanCoordinator, store: BackupStore, name: str, version: str | None = None
+) -> DeployResult:
+    """Restore a backed up version of a script on one device.
+
+    Restores the backup whose hash starts with version, or without a version the newest
+    backup that differs from the code on the device (a rollback). The code on the device
+    is backed up first, marked as replaced by a restore.
+
+    A rollback skips those marked backups. If the newest backup is one, the device was
+    rolled back before and the rollback target is picked as it was then, so running a
+    rollback again leaves the devices that already rolled back unchanged.
+    """
+    hass = coordinator.hass
+    entries = await hass.async_add_executor_job(store.entries, coordinator.device_id, None, name)
+    if version:
+        entries = [entry for entry in entries if entry.hash.startswith(version)][:1]
+
+    script = coordinator.find_script(name)
+    if not version and script is not None and coordinator.get_code_hash(script["id"]) is None:
+        # Unknown after a restart, the download records the hash
+        await coordinator.get_script_code(script["id"])
+
+    replaced = entries[0].hash if not version and entries and entries[0].by_restore else None
+    for entry in entries:
+        if not version and entry.by_restore:
+            continue
+        if replaced is not None and entry.hash == replaced:
+            continue
+
+        code = await hass.async_add_executor_job(store.read, entry.hash)
+        if replaced is not None or version or script is None or not coordinator.code_unchanged(script["id"], code):
+            # A device that already holds the code is skipped by the deployment
+            _LOGGER.info(f"Restoring script '{name}' on {coordinator.device_id} to version {entry.hash[:12]}")
+            return await async_deploy_to_device(coordinator, name, code, False, store, by_restore=True)
+
+    return DeployResult(coordinator.device_id, DeployStatus.FAILED, error="No backup to restore")
+
+
+async def async_restore_script(
+    coordinators: list[ShABmanCoordinator],
+    store: BackupStore,
+    name: str,
+    *,
+    version: str | None = None,
+    max_concurrent: int,
+) -> list[DeployResult]:
+    """Restore a script from the backups on several devices, at most max_concurrent at once."""
+    semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def restore(coordinator: ShABmanCoordinator) -> DeployResult:
+        async with semaphore:
+            try:
+                return await async_restore_to_device(coordinator, store, name, version)
+            except Exception as err:  # A single device must not abort the whole restore
+                _LOGGER.error(f"Error restoring script '{name}' on {coordinator.device_id}: {err}")
+                return DeployResult(coordinator.device_id, DeployStatus.FAILED, error=str(err))
+
+    return await asyncio.gather(*(restore(coordinator) for coordinator in coordinators))
@@ -0,0 +1,33 @@
+# custom_components\shabman\diagnostics.py
+
+"""Diagnostics support for shABman."""
+
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+from .coordinator import ShABmanCoordinator
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    coordinator: ShABmanCoordinator = hass.data[DOMAIN][entry.entry_id]
+
+    return {
+        "entry": {
+            "data": dict(entry.data),
+            "options": dict(entry.options),
+        },
+        "refresh": coordinator.refresh_stats,
+        "polling": coordinator.poll_stats,
+        "connection": coordinator.connection_stats,
+        "rpc_queue": coordinator.rpc_stats,
+        "last_upload": coordinator.upload_stats,
+        "code_cache": coordinator.code_cache_stats,
+        # The id index only duplicates the script list
+        "data": {key: value for key, value in (coordinator.data or {}).items() if key != "scripts_by_id"},
+    }
@@ -0,0 +1,170 @@
+# custom_components\shabman\minify.py
+
+"""Minifier for Shelly scripts (JavaScript)."""
+
+from __future__ import annotations
+
+import itertools
+import re
+import string
+from functools import lru_cache
+
+_TOKEN = re.compile(
+    r"""
+    (?P<space>[ \t\f\v\r\n\u00a0\ufeff]+)
+  | (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<string>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+  | (?P<template>`(?:[^`\\]|\\.)*`)
+  | (?P<number>0[xXoObB][0-9a-fA-F_]+|(?:\d[\d_]*\.?[\d_]*|\.\d[\d_]*)(?:[eE][+-]?\d+)?)
+  | (?P<name>(?:[^\W\d]|\$)[\w$]*)
+  | (?P<punct>>>>=|\.\.\.|===|!==|\*\*=|<<=|>>=|>>>|=>|==|!=|<=|>=|&&|\|\||\?\?|\?\.|\+\+|--
+      |\+=|-=|\*=|/=|%=|&=|\|=|\^=|<<|>>|\*\*|[{}()\[\];,.<>+\-*/%&|^!~?:=@#])
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+_REGEX = re.compile(r"/(?:[^/\\\[\n]|\\.|\[(?:[^\]\\\n]|\\.)*\])+/[a-z]*")
+
+# A "/" after these tokens starts a regular expression literal, not a division
+_REGEX_AFTER_KEYWORDS = {"return", "typeof", "case", "do", "else", "in", "of", "new", "delete", "void", "throw"}
+
+# After these tokens a line break can never end a statement (no automatic semicolon)
+_JOINS_NEXT_LINE = {
+    "{", "(", "[", ",", ";", ":", ".", "?", "=", "=>", "&&", "||", "??", "!", "~", "+=", "-=", "*=", "/=", "%=",
+    "&=", "|=", "^=", "==", "!=", "===", "!==", "<", ">", "<=", ">=",
+}  # fmt: skip
+# Before these tokens a line break can be dropped as well
+_JOINS_PREVIOUS_LINE = {"}", ")", "]", ";", ",", ".", ":", "?", "=", "==", "===", "!=", "!==", "&&", "||", "??"}
+
+_DECLARATIONS = {"let", "const", "var", "function"}
+
+_IDENTIFIER_CHARS = string.ascii_letters + "_$"
+
+_RESERVED = {
+    "break", "case", "catch", "class", "const", "continue", "debugger", "default", "delete", "do", "else",
+    "export", "extends", "false", "finally", "for", "function", "if", "import", "in", "instanceof", "let",
+    "new", "null", "of", "return", "super", "switch", "this", "throw", "true", "try", "typeof", "undefined",
+    "var", "void", "while", "with", "yield", "NaN", "Infinity", "arguments",
+}  # fmt: skip
+
+# Globals of the Shelly script runtime, never renamed even if a script declares a local of that name
+_GLOBALS = {
+    "Shelly", "Timer", "MQTT", "BLE", "HTTPServer", "Virtual", "KVS", "Script", "JSON", "Math", "String",
+    "Number", "Object", "Array", "Date", "Boolean", "Function", "ArrayBuffer", "Uint8Array", "DataView",
+    "print", "console", "die", "abs", "chr", "btoa", "atob", "isNaN", "parseInt", "parseFloat",
+}  # fmt: skip
+
+
+class MinifyError(Exception):
+    """Error to indicate the code could not be tokenized."""
+
+
+def _tokenize(code: str) -> list[tuple[str, str, bool]]:
+    """Split code into (kind, text, line break before) tokens without whitespace and comments."""
+    tokens: list[tuple[str, str, bool]] = []
+    position = 0
+    newline = False
+
+    while position < len(code):
+        previous = tokens[-1] if tokens else None
+        if (
+            code[position] == "/"
+            and code[position + 1 : position + 2] not in ("/", "*")
+            and (
+                previous is None
+                or (previous[0] == "punct" and previous[1] not in (")", "]", "}"))
+                or (previous[0] == "name" and previous[1] in _REGEX_AFTER_KEYWORDS)
+            )
+        ):
+            if match := _REGEX.match(code, position):
+                tokens.append(("regex", match.group(), newline))
+                newline = False
+                position = match.end()
+                continue
+
+        match = _TOKEN.match(code, position)
+        if match is None:
+            raise MinifyError(f"Unexpected character {code[position]!r} at offset {position}")
+
+        kind = match.lastgroup
+        if kind in ("space", "comment"):
+            newline = newline or "\n" in match.group()
+        else:
+            tokens.append((kind, match.group(), newline))
+            newline = False
+        position = match.end()
+
+    return tokens
+
+
+def _short_names(taken: set[str]):
+    """Yield short identifiers that do not clash with names used in the code."""
+    for length in itertools.count(1):
+        for chars in itertools.product(_IDENTIFIER_CHARS, repeat=length):
+            name = "".join(chars)
+            if name not in taken and name not in _RESERVED:
+                yield name
+
+
+def _mangle(tokens: list[tuple[str, str, bool]]) -> list[tuple[str, str, bool]]:
+    """Rename declared variables and functions to short names throughout the file.
+
+    Names that are also used as property names or object keys, or that appear in template
+    literals, keep their name since the rename could not be applied consistently there.
+    """
+    if any(kind == "template" and "${" in text for kind, text, _ in tokens):
+        return tokens
+
+    declared = set()
+    unsafe = set()
+    for index, (kind, text, _) in enumerate(tokens):
+        if kind != "name":
+            continue
+        before = tokens[index - 1][1] if index else None
+        after = tokens[index + 1][1] if index + 1 < len(tokens) else None
+        if before in _DECLARATIONS:
+            declared.add(text)
+        if before in (".", "?.") or after == ":" or (before in ("{", ",") and after in ("}", ",")):
+            unsafe.add(text)
+
+    candidates = sorted(declared - unsafe - _RESERVED - _GLOBALS)
+    names = _short_names({text for kind, text, _ in tokens if kind == "name"} | _GLOBALS)
+    renames = {}
+    for name in candidates:
+        short = next(names)
+        if len(short) < len(name):
+            renames[name] = short
+
+    return [(kind, renames.get(text, text) if kind == "name" else text, newline) for kind, text, newline in tokens]
+
+
+def _needs_space(previous: str, text: str) -> bool:
+    """Return True if two tokens would merge without a space between them."""
+    if (previous[-1].isalnum() or previous[-1] in "_$") and (text[0].isalnum() or text[0] in "_$"):
+        return True
+    if text == "." and previous[0].isdigit():
+        return not any(char in previous for char in ".eExXoObB")  # "1 .toString()"
+    return previous[-1] in "+-" and text[0] == previous[-1]
+
+
+@lru_cache(maxsize=256)
+def minify(code: str, mangle: bool = False) -> str:
+    """Remove comments and whitespace, optionally shortening variable and function names.
+
+    Line breaks are kept where removing them could change automatic semicolon insertion.
+    """
+    tokens = _tokenize(code)
+    if mangle:
+        tokens = _mangle(tokens)
+
+    parts = []
+    previous = None
+    for _, text, newline in tokens:
+        if previous is not None:
+            if newline and previous not in _JOINS_NEXT_LINE and text not in _JOINS_PREVIOUS_LINE:
+                parts.append("\n")
+            elif _needs_space(previous, text):
+                parts.append(" ")
+        parts.append(text)
+        previous = text
+
+    return "".join(parts)
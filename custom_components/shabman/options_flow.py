@@ -13,11 +13,26 @@ from homeassistant import config_entries
 from homeassistant.data_entry_flow import FlowResult
 from homeassistant.helpers import selector
 
-from .const import DOMAIN
+from .const import (
+    CONF_LIVENESS_TIMEOUT,
+    CONF_MINIFY,
+    CONF_MINIFY_MANGLE,
+    CONF_POLL_INTERVAL,
+    CONF_POLL_INTERVAL_CONNECTED,
+    CONF_REFRESH_WINDOW,
+    DEFAULT_LIVENESS_TIMEOUT,
+    DEFAULT_REFRESH_WINDOW,
+    DOMAIN,
+    UPDATE_INTERVAL,
+    UPDATE_INTERVAL_CONNECTED,
+)
 from .coordinator import ShABmanCoordinator
 
 _LOGGER = logging.getLogger(__name__)
 
+# Shown in the editor when the script code could not be loaded, never backed up or restored
+CODE_NOT_LOADED = "// Could not load script code"
+
 
 class ShABmanOptionsFlow(config_entries.OptionsFlow):
     """Handle options flow for shABman."""
@@ -32,7 +47,40 @@ class ShABmanOptionsFlow(config_entries.OptionsFlow):
         """Manage the options - main menu."""
         return self.async_show_menu(
             step_id="init",
-            menu_options=["create_script", "manage_scripts", "delete_script"],
+            menu_options=["create_script", "manage_scripts", "delete_script", "settings"],
+        )
+
+    async def async_step_settings(self, user_input: dict[str, Any] | None = None) -> FlowResult:
+        """Configure how the integration talks to the device."""
+        if user_input is not None:
+            return self.async_create_entry(title="", data={**self._config_entry.options, **user_input})
+
+        options = self._config_entry.options
+
+        return self.async_show_form(
+            step_id="settings",
+            data_schema=vol.Schema(
+                {
+                    vol.Required(
+                        CONF_REFRESH_WINDOW,
+                        default=options.get(CONF_REFRESH_WINDOW, DEFAULT_REFRESH_WINDOW),
+                    ): vol.All(vol.Coerce(float), vol.Range(min=0, max=60)),
+                    vol.Required(
+                        CONF_POLL_INTERVAL,
+                        default=options.get(CONF_POLL_INTERVAL, UPDATE_INTERVAL),
+                    ): vol.All(vol.Coerce(int), vol.Range(min=5, max=300)),
+                    vol.Required(
+                        CONF_POLL_INTERVAL_CONNECTED,
+                        default=options.get(CONF_POLL_INTERVAL_CONNECTED, UPDATE_INTERVAL_CONNECTED),
+                    ): vol.All(vol.Coerce(int), vol.Range(min=30, max=3600)),
+                    vol.Required(
+                        CONF_LIVENESS_TIMEOUT,
+                        default=options.get(CONF_LIVENESS_TIMEOUT, DEFAULT_LIVENESS_TIMEOUT),
+                    ): vol.All(vol.Coerce(int), vol.Range(min=3, max=300)),
+                    vol.Required(CONF_MINIFY, default=options.get(CONF_MINIFY, False)): bool,
+                    vol.Required(CONF_MINIFY_MANGLE, default=options.get(CONF_MINIFY_MANGLE, False)): bool,
+                }
+            ),
         )
 
     async def async_step_create_script(self, user_input: dict[str, Any] | None = None) -> FlowResult:
@@ -48,7 +96,7 @@ class ShABmanOptionsFlow(config_entries.OptionsFlow):
             result = await coordinator.upload_script(name, code)
             if result:
                 await coordinator.async_request_refresh()
-                return self.async_create_entry(title="", data={})
+                return self.async_create_entry(title="", data=dict(self._config_entry.options))
             else:
                 errors["base"] = "upload_failed"
 
@@ -117,36 +165,33 @@ class ShABmanOptionsFlow(config_entries.OptionsFlow):
             backup_code = self._current_script_code  # Use cached original code
             backup_id = self._current_script_id
 
-            _LOGGER.info(f"Editing script '{backup_name}' (ID: {backup_id}). Creating backup...")
-
-            # Save backup to file (persistent)
-            try:
-                import json
-                from datetime import datetime
-                from pathlib import Path
-
-                backup_dir = Path(self.hass.config.path("shabman_backups"))
-                backup_dir.mkdir(exist_ok=True)
+            if backup_code is None:
+                _LOGGER.warning(f"Editing script '{backup_name}' (ID: {backup_id}) without backup, code not loaded")
+            else:
+                _LOGGER.info(f"Editing script '{backup_name}' (ID: {backup_id}). Creating backup...")
 
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                backup_file = backup_dir / f"script_{backup_id}_{timestamp}.json"
+                # Save backup to file (persistent), in the executor
+                from .backup import async_backup_script
 
-                backup_data = {
-                    "id": backup_id,
-                    "name": backup_name,
-                    "code": backup_code,
-                    "timestamp": timestamp,
-                }
-
-                with open(backup_file, "w", encoding="utf-8") as f:
-                    json.dump(backup_data, f, indent=2, ensure_ascii=False)
+                try:
+                    entry = await async_backup_script(
+                        self.hass, coordinator.device_id, backup_id, backup_name, backup_code
+                    )
+                    _LOGGER.info(f"Created persistent backup of script {backup_id} ({entry.hash[:12]})")
+                except Exception as err:
+                    _LOGGER.error(f"Failed to create persistent backup: {err}")
 
-                _LOGGER.info(f"Created persistent backup: {backup_file}")
-            except Exception as err:
-                _LOGGER.error(f"Failed to create persistent backup: {err}")
+            # Update in place, the script keeps its id and its entities
+            if await coordinator.update_script(self._current_script_id, name, code):
+                await coordinator.async_request_refresh()
+                self._current_script_code = None  # Clear cache
+                return self.async_create_entry(title="", data=dict(self._config_entry.options))
 
-            # Delete old script
-            delete_success = await coordinator.delete_script(self._current_script_id)
+            # Fallback: delete and re-create the script, only if the original code can be restored
+            delete_success = False
+            if backup_code is not None:
+                _LOGGER.warning(f"In-place update of script {backup_id} failed, re-creating it")
+                delete_success = await coordinator.delete_script(self._current_script_id)
 
             if not delete_success:
                 errors = {"base": "update_failed"}
@@ -176,7 +221,7 @@ class ShABmanOptionsFlow(config_entries.OptionsFlow):
                 _LOGGER.info(f"Successfully updated script '{name}'")
                 await coordinator.async_request_refresh()
                 self._current_script_code = None  # Clear cache
-                return self.async_create_entry(title="", data={})
+                return self.async_create_entry(title="", data=dict(self._config_entry.options))
             else:
                 # ROLLBACK: Restore original script
                 _LOGGER.error(f"Failed to upload new version! Attempting rollback to '{backup_name}'...")
@@ -221,13 +266,12 @@ class ShABmanOptionsFlow(config_entries.OptionsFlow):
         # 🔥 Load script code on-demand (only when opening the form)
         if self._current_script_code is None:
             _LOGGER.debug(f"Loading code for script {self._current_script_id}")
-            self._current_script_code = await coordinator.get_script_code(self._current_script_id)
+            self._current_script_code = await coordinator.get_script_source(self._current_script_id)
 
             if self._current_script_code is None:
-                self._current_script_code = "// Could not load script code"
                 _LOGGER.warning(f"Failed to load code for script {self._current_script_id}")
 
-        script_code = self._current_script_code
+        script_code = self._current_script_code if self._current_script_code is not None else CODE_NOT_LOADED
 
         return self.async_show_form(
             step_id="edit_script",
@@ -292,7 +336,7 @@ class ShABmanOptionsFlow(config_entries.OptionsFlow):
             result = await coordinator.delete_script(self._current_script_id)
             if result:
                 await coordinator.async_request_refresh()
-                return self.async_create_entry(title="", data={})
+                return self.async_create_entry(title="", data=dict(self._config_entry.options))
             else:
                 return self.async_abort(reason="delete_failed")
 
@@ -0,0 +1,103 @@
+# custom_components\shabman\scheduler.py
+
+"""Per-device request scheduler for shABman."""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+# Priority classes, lower values are served first
+PRIORITY_INTERACTIVE = 0  # Switch toggles, services, options flow
+PRIORITY_BACKGROUND = 1  # Polling
+
+_PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BACKGROUND: "background"}
+
+
+class RpcScheduler:
+    """Limit concurrent requests to a device and serve interactive requests first.
+
+    Requests of the same priority are served in arrival order.
+    """
+
+    def __init__(self, max_concurrent: int) -> None:
+        """Initialize the scheduler."""
+        self._max_concurrent = max_concurrent
+        self._active = 0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._stats = {
+            priority: {"requests": 0, "queued": 0, "total_wait": 0.0, "max_wait": 0.0} for priority in _PRIORITY_NAMES
+        }
+
+    @asynccontextmanager
+    async def slot(self, priority: int) -> AsyncIterator[None]:
+        """Wait for a free request slot and hold it while the context is active."""
+        start = time.monotonic()
+        queued = await self._acquire(priority)
+        self._record_wait(priority, queued, time.monotonic() - start)
+        try:
+            yield
+        finally:
+            self._release()
+
+    @property
+    def queue_depth(self) -> int:
+        """Return the number of requests waiting for a slot."""
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    async def _acquire(self, priority: int) -> bool:
+        """Take a slot, waiting in the queue if none is free. Returns True if it had to wait."""
+        if self._active < self._max_concurrent and not self._waiters:
+            self._active += 1
+            return False
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over right before the cancellation
+                self._release()
+            raise
+        return True
+
+    def _release(self) -> None:
+        """Hand the slot over to the next waiter or free it."""
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():  # Skip waiters that were cancelled meanwhile
+                future.set_result(None)
+                return
+        self._active -= 1
+
+    def _record_wait(self, priority: int, queued: bool, wait: float) -> None:
+        """Update the wait time statistics of a priority class."""
+        stats = self._stats[priority]
+        stats["requests"] += 1
+        if queued:
+            stats["queued"] += 1
+            stats["total_wait"] += wait
+            stats["max_wait"] = max(stats["max_wait"], wait)
+
+    def as_dict(self) -> dict:
+        """Return queue depth and wait times for diagnostics."""
+        result = {
+            "max_concurrent": self._max_concurrent,
+            "active": self._active,
+            "queue_depth": self.queue_depth,
+        }
+        for priority, name in _PRIORITY_NAMES.items():
+            stats = self._stats[priority]
+            result[name] = {
+                "requests": stats["requests"],
+                "queued": stats["queued"],
+                "avg_wait": round(stats["total_wait"] / stats["queued"], 3) if stats["queued"] else 0.0,
+                "max_wait": round(stats["max_wait"], 3),
+            }
+        return result
@@ -85,25 +85,26 @@ class ScriptStatusSwitch(CoordinatorEntity, SwitchEntity):
     @property
     def is_on(self) -> bool:
         """Return if script is running."""
-        scripts = self.coordinator.data.get("scripts", [])
-        for script in scripts:
-            if script["id"] == self._script_id:
-                return script.get("running", False)
-        return False
+        script = self.coordinator.get_script(self._script_id)
+        return script.running if script else False
 
     @property
     def extra_state_attributes(self) -> dict:
         """Return additional attributes."""
-        scripts = self.coordinator.data.get("scripts", [])
-        for script in scripts:
-            if script["id"] == self._script_id:
-                return {
-                    "script_id": script["id"],
-                    "memory_used": script.get("mem_used", 0),
-                    "memory_free": script.get("mem_free", 0),
-                    "memory_peak": script.get("mem_peak", 0),
-                }
-        return {}
+        script = self.coordinator.get_script(self._script_id)
+        if script is None:
+            return {}
+
+        attributes = {
+            "script_id": script.id,
+            "memory_used": script.mem_used,
+            "memory_free": script.mem_free,
+            "memory_peak": script.mem_peak,
+        }
+        if self.coordinator.restored:
+            # State saved by the last run, the device has not answered yet
+            attributes["restored"] = True
+        return attributes
 
     @property
     def icon(self) -> str:
@@ -121,8 +122,7 @@ class ScriptStatusSwitch(CoordinatorEntity, SwitchEntity):
         """Return if entity is available (script still exists)."""
         if not self.coordinator.last_update_success:
             return False
-        scripts = self.coordinator.data.get("scripts", [])
-        return any(script["id"] == self._script_id for script in scripts)
+        return self.coordinator.get_script(self._script_id) is not None
 
     async def async_turn_off(self, **kwargs) -> None:
         """Stop the script."""
@@ -160,11 +160,8 @@ class ScriptAutostartSwitch(CoordinatorEntity, SwitchEntity):
     @property
     def is_on(self) -> bool:
         """Return if script autostart is enabled."""
-        scripts = self.coordinator.data.get("scripts", [])
-        for script in scripts:
-            if script["id"] == self._script_id:
-                return script.get("enabled", False)
-        return False
+        script = self.coordinator.get_script(self._script_id)
+        return script.enabled if script else False
 
     @property
     def icon(self) -> str:
@@ -181,8 +178,7 @@ class ScriptAutostartSwitch(CoordinatorEntity, SwitchEntity):
         """Return if entity is available (script still exists)."""
         if not self.coordinator.last_update_success:
             return False
-        scripts = self.coordinator.data.get("scripts", [])
-        return any(script["id"] == self._script_id for script in scripts)
+        return self.coordinator.get_script(self._script_id) is not None
 
     async def async_turn_on(self, **kwargs) -> None:
         """Enable script autostart."""
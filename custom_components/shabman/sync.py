@@ -0,0 +1,268 @@
+# custom_components\shabman\sync.py
+
+"""Declarative sync of scripts from the HA config folder to shABman devices."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from homeassistant.core import HomeAssistant, callback
+
+from .backup import async_back_up_current
+from .bundle import BundleError, ScriptBundler
+from .const import DATA_SYNC_INDEX, SYNC_DIR, SYNC_GROUP_ALL
+from .upload import code_hash
+
+if TYPE_CHECKING:
+    from .backup import BackupStore
+    from .coordinator import ShABmanCoordinator
+
+_LOGGER = logging.getLogger(__name__)
+
+# Header comment with the desired state, e.g. "// shabman: enable=true running=false"
+_DIRECTIVE = re.compile(r"//\s*shabman:(.*)")
+_SETTING = re.compile(r"(enable|running)\s*=\s*(true|false)", re.IGNORECASE)
+
+
+@dataclass(slots=True)
+class SourceScript:
+    """A script file from the sync folder."""
+
+    name: str
+    code: str
+    hash: str
+    enable: bool | None = None  # None = leave as it is on the device
+    running: bool | None = None
+    error: str | None = None  # Set if the includes could not be resolved
+
+
+def load_source(name: str, code: str) -> SourceScript:
+    """Build a source script, reading the desired state from its leading comment lines."""
+    source = SourceScript(name, code, code_hash(code))
+
+    for line in code.splitlines():
+        line = line.strip()
+        if line and not line.startswith("//"):
+            break  # Directives are only read from the header
+        if match := _DIRECTIVE.match(line):
+            for key, value in _SETTING.findall(match.group(1)):
+                setattr(source, key.lower(), value.lower() == "true")
+
+    return source
+
+
+class ScriptDirectoryIndex:
+    """Index of the sync folder that only reads files whose mtime or size changed."""
+
+    def __init__(self, root: Path) -> None:
+        """Initialize the index."""
+        self._root = root
+        self._files: dict[str, tuple[int, int, SourceScript]] = {}
+        self.stats = {"scans": 0, "reads": 0}
+        self._lock = threading.Lock()
+
+    def scan(self) -> dict[str, dict[str, SourceScript]]:
+        """Return the scripts of each subfolder by name. Blocking, run in the executor."""
+        with self._lock:
+            self.stats["scans"] += 1
+            folders: dict[str, dict[str, SourceScript]] = {}
+            seen = set()
+
+            if self._root.is_dir():
+                for folder in os.scandir(self._root):
+                    if not folder.is_dir():
+                        continue
+
+                    scripts = folders[folder.name] = {}
+                    for entry in os.scandir(folder.path):
+                        if not entry.name.endswith(".js") or not entry.is_file():
+                            continue
+
+                        stat = entry.stat()
+                        seen.add(entry.path)
+                        cached = self._files.get(entry.path)
+                        if cached is None or cached[:2] != (stat.st_mtime_ns, stat.st_size):
+                            code = Path(entry.path).read_text(encoding="utf-8")
+                            cached = (stat.st_mtime_ns, stat.st_size, load_source(entry.name[:-3], code))
+                            self._files[entry.path] = cached
+                            self.stats["reads"] += 1
+                        scripts[cached[2].name] = cached[2]
+
+            for path in self._files.keys() - seen:
+                del self._files[path]
+
+            return folders
+
+
+def bundle_sources(
+    folders: dict[str, dict[str, SourceScript]], bundler: ScriptBundler
+) -> dict[str, dict[str, SourceScript]]:
+    """Return the folders with the includes of every script inlined. Blocking, run in the executor."""
+    bundled = {}
+    for folder, scripts in folders.items():
+        bundled[folder] = {}
+        for name, source in scripts.items():
+            try:
+                bundle = bundler.bundle(source.code)
+            except BundleError as err:
+                _LOGGER.error(f"Cannot bundle script '{name}' in {folder}: {err}")
+                bundled[folder][name] = replace(source, error=str(err))
+                continue
+            bundled[folder][name] = replace(source, code=bundle.code, hash=bundle.hash)
+    return bundled
+
+
+@callback
+def get_sync_index(hass: HomeAssistant) -> ScriptDirectoryIndex:
+    """Return the index of the sync folder, only files changed since the last sync are read again."""
+    if DATA_SYNC_INDEX not in hass.data:
+        hass.data[DATA_SYNC_INDEX] = ScriptDirectoryIndex(Path(hass.config.path(SYNC_DIR)))
+    return hass.data[DATA_SYNC_INDEX]
+
+
+def desired_scripts(folders: dict[str, dict[str, SourceScript]], coordinator: ShABmanCoordinator) -> dict:
+    """Return the scripts a device should hold: group folder, then device type, then device id."""
+    desired = {}
+    for folder in (SYNC_GROUP_ALL, coordinator.device_type, coordinator.device_id):
+        desired.update(folders.get(folder, {}))
+    return desired
+
+
+@dataclass
+class SyncResult:
+    """Changes made to a single device."""
+
+    device_id: str
+    created: list[str] = field(default_factory=list)
+    updated: list[str] = field(default_factory=list)
+    deleted: list[str] = field(default_factory=list)
+    state_changed: list[str] = field(default_factory=list)
+    failed: list[str] = field(default_factory=list)
+    unchanged: int = 0
+
+    @property
+    def changed(self) -> bool:
+        """Return True if anything on the device was changed."""
+        return bool(self.created or self.updated or self.deleted or self.state_changed)
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the result for the service response."""
+        return {
+            "created": self.created,
+            "updated": self.updated,
+            "deleted": self.deleted,
+            "state_changed": self.state_changed,
+            "failed": self.failed,
+            "unchanged": self.unchanged,
+        }
+
+
+async def async_sync_device(
+    coordinator: ShABmanCoordinator,
+    desired: dict[str, SourceScript],
+    delete_unmanaged: bool,
+    backup_store: BackupStore | None = None,
+) -> SyncResult:
+    """Reconcile the scripts of a device with the desired scripts."""
+    result = SyncResult(coordinator.device_id)
+
+    async with coordinator.deploy_lock:
+        for source in desired.values():
+            try:
+                await _async_sync_script(coordinator, source, result, backup_store)
+            except Exception as err:
+                _LOGGER.error(f"Error syncing script '{source.name}' to {coordinator.device_id}: {err}")
+                result.failed.append(source.name)
+
+        # Devices without any sync folder are not managed at all
+        if delete_unmanaged and desired:
+            scripts = coordinator.data.get("scripts", []) if coordinator.data else []
+            for script in [script for script in scripts if script.get("name") not in desired]:
+                if await coordinator.delete_script(script["id"]):
+                    result.deleted.append(script["name"])
+                else:
+                    result.failed.append(script["name"])
+
+    if result.changed:
+        await coordinator.async_request_refresh()
+    return result
+
+
+async def _async_sync_script(
+    coordinator: ShABmanCoordinator, source: SourceScript, result: SyncResult, backup_store: BackupStore | None
+) -> None:
+    """Bring a single script of a device in line with its source file."""
+    if source.error:
+        result.failed.append(source.name)  # Kept as desired so it is not deleted as unmanaged
+        return
+
+    script = coordinator.find_script(source.name)
+
+    if script is None:
+        if not await coordinator.upload_script(source.name, source.code):
+            result.failed.append(source.name)
+            return
+        result.created.append(source.name)
+
+        if source.enable is None and source.running is None:
+            return
+        # The id of the new script is only known after a refresh
+        await coordinator.async_refresh()
+        if (script := coordinator.find_script(source.name)) is None:
+            return
+
+    else:
+        if coordinator.get_code_hash(script["id"]) is None:
+            # Unknown after a restart, the download records the hash
+            await coordinator.get_script_code(script["id"])
+
+        if coordinator.code_unchanged(script["id"], source.code):
+            result.unchanged += 1
+        else:
+            if backup_store is not None:
+                await async_back_up_current(backup_store, coordinator, script)
+            if not await coordinator.update_script(script["id"], source.name, source.code, force=True):
+                result.failed.append(source.name)
+                return
+            result.updated.append(source.name)
+
+    if source.enable is not None and bool(script.get("enabled")) != source.enable:
+        if not await coordinator.set_script_config(script["id"], source.enable):
+            result.failed.append(source.name)
+            return
+        result.state_changed.append(source.name)
+
+    if source.running is not None and bool(script.get("running")) != source.running:
+        toggle = coordinator.start_script if source.running else coordinator.stop_script
+        if not await toggle(script["id"]):
+            result.failed.append(source.name)
+            return
+        if source.name not in result.state_changed:
+            result.state_changed.append(source.name)
+
+
+async def async_sync_scripts(
+    coordinators: list[ShABmanCoordinator],
+    folders: dict[str, dict[str, SourceScript]],
+    *,
+    delete_unmanaged: bool = False,
+    max_concurrent: int,
+    backup_store: BackupStore | None = None,
+) -> list[SyncResult]:
+    """Reconcile several devices with the sync folder, at most max_concurrent at once."""
+    semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def sync(coordinator: ShABmanCoordinator) -> SyncResult:
+        async with semaphore:
+            return await async_sync_device(
+                coordinator, desired_scripts(folders, coordinator), delete_unmanaged, backup_store
+            )
+
+    return await asyncio.gather(*(sync(coordinator) for coordinator in coordinators))
@@ -0,0 +1,89 @@
+# custom_components\shabman\upload.py
+
+"""Helpers for chunked script uploads."""
+
+from __future__ import annotations
+
+import hashlib
+from dataclasses import dataclass
+
+
+def code_hash(code: str) -> str:
+    """Return the content hash of script code."""
+    return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+
+def next_chunk(data: bytes, offset: int, max_bytes: int) -> tuple[str, int]:
+    """Return the next chunk of UTF-8 encoded code and the offset after it.
+
+    The chunk holds at most max_bytes bytes and never ends inside a multibyte character.
+    """
+    end = min(offset + max_bytes, len(data))
+
+    # Move back while the byte at the boundary is a UTF-8 continuation byte (10xxxxxx)
+    while offset < end < len(data) and data[end] & 0xC0 == 0x80:
+        end -= 1
+
+    return data[offset:end].decode("utf-8"), end
+
+
+class AdaptiveChunkSizer:
+    """Pick the chunk size from the observed PutCode latency.
+
+    The size doubles while the device answers well within the target latency and is
+    halved when it answers slowly or a chunk fails, always within the device limits.
+    """
+
+    def __init__(self, min_size: int, max_size: int, target_latency: float) -> None:
+        """Initialize the sizer, starting in the middle of the allowed range."""
+        self._min_size = min_size
+        self._max_size = max_size
+        self._target_latency = target_latency
+        self.size = max(min_size, max_size // 2)
+
+    def record_latency(self, latency: float) -> None:
+        """Adapt the chunk size to the latency of an acknowledged chunk."""
+        if latency < self._target_latency / 2:
+            self.size = min(self._max_size, self.size * 2)
+        elif latency > self._target_latency:
+            self.size = max(self._min_size, self.size // 2)
+
+    def record_failure(self) -> None:
+        """Shrink the chunk size after a failed chunk."""
+        self.size = max(self._min_size, self.size // 2)
+
+
+@dataclass
+class UploadStats:
+    """Statistics of a single script upload."""
+
+    bytes: int = 0
+    source_bytes: int = 0  # Before minification
+    chunks: int = 0
+    retries: int = 0
+    resumed: int = 0
+    duration: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Return the upload throughput in bytes per second."""
+        return self.bytes / self.duration if self.duration else 0.0
+
+    def summary(self) -> str:
+        """Return a one-line summary for the log."""
+        size = f"{self.bytes} bytes"
+        if self.source_bytes != self.bytes:
+            size += f" (minified from {self.source_bytes})"
+        return f"{size} in {self.chunks} chunks, {self.throughput:.0f} bytes/s"
+
+    def as_dict(self) -> dict[str, float | int]:
+        """Return the statistics for diagnostics and service responses."""
+        return {
+            "bytes": self.bytes,
+            "source_bytes": self.source_bytes,
+            "chunks": self.chunks,
+            "retries": self.retries,
+            "resumed": self.resumed,
+            "duration": round(self.duration, 3),
+            "throughput": round(self.throughput, 1),
+        }
@@ -12,7 +12,8 @@ from homeassistant.config_entries import ConfigEntryState
 from homeassistant.core import HomeAssistant
 from pytest_homeassistant_custom_component.common import MockConfigEntry
 
-from custom_components.shabman.const import CONF_DEVICE_IP, CONF_DEVICE_TYPE, DOMAIN
+from custom_components.shabman.backup import BackupStore
+from custom_components.shabman.const import CONF_DEVICE_IP, CONF_DEVICE_TYPE, DATA_BACKUP_STORE, DOMAIN
 
 # Configure logging for tests
 logging.getLogger("asyncio").setLevel(logging.WARNING)
@@ -97,7 +98,15 @@ def mock_script_code():
 
 
 @pytest.fixture
-async def setup_integration(hass: HomeAssistant, mock_scripts_list):
+def backup_store(hass: HomeAssistant, tmp_path):
+    """Keep backups out of the shared testing config folder."""
+    store = BackupStore(tmp_path / "backups")
+    hass.data[DATA_BACKUP_STORE] = store
+    return store
+
+
+@pytest.fixture
+async def setup_integration(hass: HomeAssistant, mock_scripts_list, backup_store):
     """Set up the shabman integration."""
     # Create unique ID for each test
     unique_id = str(uuid.uuid4())
@@ -0,0 +1,82 @@
+# tests/test_backoff.py
+
+"""Test the shABman reconnect backoff and circuit breaker."""
+
+from custom_components.shabman.backoff import CircuitBreaker, CircuitState, ExponentialBackoff
+
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+
+    def __init__(self) -> None:
+        """Initialize the clock."""
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        """Return the current time."""
+        return self.now
+
+
+def test_backoff_grows_with_jitter_and_cap():
+    """Test that delays double, stay within the jitter range and are capped."""
+    backoff = ExponentialBackoff(base=2, cap=30, jitter=0.5)
+
+    delays = [backoff.next_delay() for _ in range(6)]
+
+    for delay, upper in zip(delays, [2, 4, 8, 16, 30, 30], strict=True):
+        assert upper * 0.5 <= delay <= upper
+    assert backoff.attempts == 6
+
+    backoff.reset()
+    assert backoff.attempts == 0
+    assert backoff.next_delay() <= 2
+
+
+def test_circuit_opens_after_threshold():
+    """Test that the circuit opens after consecutive failures."""
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, max_reset_timeout=120, clock=clock)
+
+    assert breaker.record_failure() is False
+    assert breaker.record_failure() is False
+    assert breaker.state is CircuitState.CLOSED
+    assert breaker.record_failure() is True
+    assert breaker.is_open
+    assert breaker.retry_in == 30
+
+    # Further failures while open do not re-open it
+    assert breaker.record_failure() is False
+
+
+def test_circuit_success_resets_failures():
+    """Test that a success in between resets the failure count."""
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, max_reset_timeout=120, clock=FakeClock())
+
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+
+    assert breaker.state is CircuitState.CLOSED
+
+
+def test_circuit_half_open_probe():
+    """Test half-open probing: failed probes double the timeout, success closes the circuit."""
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, max_reset_timeout=50, clock=clock)
+    breaker.record_failure()
+
+    clock.now += 30
+    assert breaker.state is CircuitState.HALF_OPEN
+    assert not breaker.is_open
+
+    assert breaker.record_failure() is True
+    assert breaker.is_open
+    assert breaker.reset_timeout == 50  # Doubled, but capped
+
+    clock.now += 50
+    assert breaker.state is CircuitState.HALF_OPEN
+    breaker.record_success()
+
+    assert breaker.state is CircuitState.CLOSED
+    assert breaker.reset_timeout == 30
+    assert breaker.as_dict() == {"state": "closed", "failures": 0, "reset_timeout": 30, "retry_in": 0.0}
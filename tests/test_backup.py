@@ -0,0 +1,122 @@
+# tests/test_backup.py
+
+"""Test the shABman backup store."""
+
+import gzip
+import json
+
+from custom_components.shabman.backup import BackupStore
+from custom_components.shabman.upload import code_hash
+
+DAY = 24 * 3600
+
+
+def test_backup_store_deduplicates(tmp_path):
+    """Test blobs are stored once per content and unchanged versions are not recorded again."""
+    store = BackupStore(tmp_path)
+
+    first = store.add("device1", 1, "heating", "let a = 1;", now=1000)
+    assert store.add("device1", 1, "heating", "let a = 1;", now=2000) == first
+    store.add("device2", 1, "heating", "let a = 1;", now=3000)
+
+    blobs = list((tmp_path / "blobs").rglob("*.js.gz"))
+    assert len(blobs) == 1
+    assert gzip.decompress(blobs[0].read_bytes()) == b"let a = 1;"
+    assert first.hash == code_hash("let a = 1;")
+    assert [entry.timestamp for entry in store.entries()] == [3000, 1000]
+
+
+def test_backup_store_index_survives_restart(tmp_path):
+    """Test the index is persisted and entries are listed newest first per script."""
+    store = BackupStore(tmp_path)
+    store.add("device1", 1, "heating", "v1", now=1000)
+    store.add("device1", 1, "heating", "v2", now=2000)
+    store.add("device1", 2, "light", "other", now=3000)
+
+    store = BackupStore(tmp_path)
+    entries = store.entries("device1", 1)
+
+    assert [store.read(entry.hash) for entry in entries] == ["v2", "v1"]
+
+
+def test_backup_store_retention(tmp_path):
+    """Test versions beyond the limit and expired ones are dropped, but never the newest one."""
+    store = BackupStore(tmp_path, keep_per_script=3, max_age=30 * DAY)
+    for version in range(5):
+        store.add("device1", 1, "heating", f"v{version}", now=version * DAY)
+
+    assert [store.read(entry.hash) for entry in store.entries()] == ["v4", "v3", "v2"]
+    assert len(list((tmp_path / "blobs").rglob("*.js.gz"))) == 3
+
+    store.add("device1", 2, "light", "new", now=100 * DAY)
+
+    assert [store.read(entry.hash) for entry in store.entries()] == ["new", "v4"]
+
+
+def test_backup_store_size_limit(tmp_path):
+    """Test the oldest versions are dropped when the blobs exceed the size limit."""
+    store = BackupStore(tmp_path, max_bytes=100)
+    store.add("device1", 1, "a", "a" * 10, now=1)
+    for version in range(10):
+        store.add("device1", 2, "b", f"version {version} " * 5, now=version + 2)
+
+    entries = store.entries()
+    assert sum(entry.stored for entry in entries) <= 100
+    assert entries[0].timestamp == 11
+    assert any(entry.script_id == 1 for entry in entries)  # Newest version of every script is kept
+
+
+def test_backup_store_search(tmp_path):
+    """Test backups can be listed by device and searched by name."""
+    store = BackupStore(tmp_path)
+    store.add("device1", 1, "Heating Control", "a", now=1000)
+    store.add("device1", 2, "light", "b", now=2000)
+    store.add("device2", 1, "heating control", "c", now=3000)
+
+    assert [entry.device_id for entry in store.entries(search="HEATING")] == ["device2", "device1"]
+    assert [entry.name for entry in store.entries("device1")] == ["light", "Heating Control"]
+    assert store.entries(name="heating control")[0].as_dict() == {
+        "device_id": "device2",
+        "script_id": 1,
+        "name": "heating control",
+        "timestamp": "1970-01-01T00:50:00+00:00",
+        "version": code_hash("c"),
+        "size": 1,
+        "by_restore": False,
+    }
+
+
+def test_source_replaced_and_kept_through_retention(tmp_path):
+    """Test the kept source of a script is replaced on upload and survives backup retention."""
+    store = BackupStore(tmp_path, keep_per_script=1)
+    store.add_source("dev", 1, "built1", "source 1")
+    assert store.source("dev", 1, "built1") == "source 1"
+    assert store.source("dev", 1, "other") is None
+    assert store.source("dev", 2, "built1") is None
+
+    store.add_source("dev", 1, "built2", "source 2")
+    assert store.source("dev", 1, "built1") is None
+    assert not store._blob_path(code_hash("source 1")).exists()
+
+    store.add("dev", 1, "test", "source 2")
+    store.add("dev", 1, "test", "newer")  # Retention drops the backup, the source blob stays
+
+    reloaded = BackupStore(tmp_path)
+    assert reloaded.source("dev", 1, "built2") == "source 2"
+
+
+def test_backup_store_imports_legacy_files(tmp_path):
+    """Test the backup files of older versions are imported once and match every device."""
+    backup = {"id": 3, "name": "heating", "code": "let old = 1;", "timestamp": "20240102_030405"}
+    (tmp_path / "script_3_20240102_030405.json").write_text(json.dumps(backup), encoding="utf-8")
+    (tmp_path / "script_4_broken.json").write_text("{", encoding="utf-8")
+
+    store = BackupStore(tmp_path, max_age=float("inf"))
+    entries = store.entries("device1", name="heating")
+
+    assert [(entry.script_id, entry.name) for entry in entries] == [(3, "heating")]
+    assert store.read(entries[0].hash) == "let old = 1;"
+    assert (tmp_path / "script_3_20240102_030405.json").exists()  # Left in place
+
+    store.add("device1", 3, "heating", "let new = 1;")
+    assert len(BackupStore(tmp_path, max_age=float("inf")).entries(name="heating")) == 2  # Not imported again
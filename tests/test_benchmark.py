@@ -0,0 +1,119 @@
+# tests/test_benchmark.py
+
+"""Micro-benchmarks for shABman hot paths."""
+
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from homeassistant.core import HomeAssistant
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.shabman.const import CONF_DEVICE_IP, CONF_DEVICE_TYPE, DOMAIN
+from custom_components.shabman.coordinator import ShABmanCoordinator
+from custom_components.shabman.sync import ScriptDirectoryIndex, async_sync_scripts
+from custom_components.shabman.upload import code_hash
+
+FRAMES = 20000
+
+# Modules only needed once a service is called or the options are opened
+LAZY_MODULES = ("options_flow", "deploy", "sync", "bundle", "backup", "minify")
+
+# Power metering push of a Pro 4PM, the most frequent frame on the socket
+METERING_FRAME = (
+    '{"src":"shellypro4pm-a8032ab1e2c4","dst":"shabman-1a2b3c4d","method":"NotifyStatus",'
+    '"params":{"ts":1700000000.12,"switch:0":{"id":0,"apower":23.4,"current":0.112,'
+    '"aenergy":{"by_minute":[381.2,389.1,379.9],"minute_ts":1700000000,"total":12345.678}}}}'
+)
+SCRIPT_FRAME = (
+    '{"src":"shellypro4pm-a8032ab1e2c4","dst":"shabman-1a2b3c4d","method":"NotifyStatus",'
+    '"params":{"ts":1700000000.12,"script:1":{"id":1,"running":true,"mem_used":1024,"mem_peak":2048}}}'
+)
+
+
+def _frames_per_second(handler, frame: str) -> float:
+    """Feed the same frame to the handler and return the throughput."""
+    start = time.perf_counter()
+    for _ in range(FRAMES):
+        handler(frame)
+    return FRAMES / (time.perf_counter() - start)
+
+
+async def test_benchmark_ws_dispatch(hass: HomeAssistant):
+    """Measure WebSocket dispatch throughput for ignored and script frames."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={CONF_DEVICE_IP: "192.168.1.100", CONF_DEVICE_TYPE: "SPSW-104PE16EU", "device_id": "bench"},
+    )
+    coordinator = ShABmanCoordinator(hass, entry)
+    coordinator.data = coordinator._build_data([{"id": 1, "name": "bench", "running": True}])
+
+    ignored_fps = _frames_per_second(coordinator._handle_ws_text, METERING_FRAME)
+    script_fps = _frames_per_second(coordinator._handle_ws_text, SCRIPT_FRAME)
+
+    print(f"\nWebSocket dispatch: ignored frames {ignored_fps:,.0f}/s, script frames {script_fps:,.0f}/s")
+
+    # The early-out must stay far ahead of parsing and patching script frames
+    assert ignored_fps > 5 * script_fps
+    assert ignored_fps > 100_000
+
+
+async def test_benchmark_sync_without_changes(hass: HomeAssistant, tmp_path):
+    """Measure a sync pass over 80 devices with 20 unchanged scripts each."""
+    group = tmp_path / "_all"
+    group.mkdir()
+    for number in range(20):
+        (group / f"script_{number}.js").write_text(f"// Script {number}\n" + "let value = 1;\n" * 300)
+
+    index = ScriptDirectoryIndex(tmp_path)
+    folders = index.scan()
+
+    coordinators = []
+    for device in range(80):
+        entry = MockConfigEntry(
+            domain=DOMAIN,
+            data={CONF_DEVICE_IP: f"192.168.1.{device}", CONF_DEVICE_TYPE: "SNSW-001P16EU", "device_id": f"d{device}"},
+        )
+        coordinator = ShABmanCoordinator(hass, entry)
+        scripts = [{"id": n + 1, "name": f"script_{n}", "running": False} for n in range(20)]
+        coordinator.data = coordinator._build_data(scripts)
+        for script in scripts:
+            coordinator._code_hashes[script["id"]] = code_hash(folders["_all"][script["name"]].code)
+        coordinators.append(coordinator)
+
+    start = time.perf_counter()
+    folders = index.scan()
+    results = await async_sync_scripts(coordinators, folders, max_concurrent=10)
+    elapsed = time.perf_counter() - start
+
+    print(f"\nSync of 80 unchanged devices: {elapsed * 1000:.1f} ms")
+
+    assert all(result.unchanged == 20 and not result.changed for result in results)
+    assert index.stats["reads"] == 20
+    assert elapsed < 1.0
+
+
+def test_benchmark_import_time():
+    """Measure the import time of the integration as HA loads it at startup (python -X importtime)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import custom_components.shabman.config_flow"],
+        cwd=Path(__file__).parent.parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    # "import time: self [us] | cumulative | imported package"
+    modules = {}
+    for line in result.stderr.splitlines():
+        parts = line.removeprefix("import time:").split("|")
+        if len(parts) == 3 and parts[2].strip().startswith("custom_components.shabman"):
+            modules[parts[2].strip()] = int(parts[0])
+    own_time = sum(modules.values()) / 1_000_000
+
+    print(f"\nImport of {len(modules)} shABman modules: {own_time * 1000:.1f} ms (without dependencies)")
+
+    assert "custom_components.shabman.coordinator" in modules
+    assert not [name for name in modules if name.rsplit(".", 1)[-1] in LAZY_MODULES]
+    assert own_time < 0.25
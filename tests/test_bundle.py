@@ -0,0 +1,82 @@
+# tests/test_bundle.py
+
+"""Test the shABman script bundler."""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from custom_components.shabman.bundle import BundleError, ScriptBundler
+from custom_components.shabman.upload import code_hash
+
+
+def test_bundle_inlines_modules_once(tmp_path):
+    """Test includes are inlined recursively and every module only once."""
+    (tmp_path / "ble").mkdir()
+    (tmp_path / "ble" / "parse.js").write_text("// @include util\nfunction parse() {}\n")
+    (tmp_path / "util.js").write_text("function util() {}\n")
+
+    bundler = ScriptBundler(tmp_path)
+    bundle = bundler.bundle("// @include ble/parse\n  // @include util\nparse();\n")
+
+    assert bundle.code == "function util() {}\n\nfunction parse() {}\n\n\nparse();\n"
+    assert bundle.hash == code_hash(bundle.code)
+    assert bundle.modules == ("ble/parse", "util")
+
+
+def test_bundle_without_includes_is_unchanged(tmp_path):
+    """Test code without includes is returned as it is, without touching the cache."""
+    bundler = ScriptBundler(tmp_path / "missing")
+    bundle = bundler.bundle("print(1); // @include is only a directive on its own line")
+
+    assert bundle.code == "print(1); // @include is only a directive on its own line"
+    assert bundler.stats == {"builds": 0, "hits": 0, "reads": 0}
+
+
+def test_bundle_cache_follows_module_changes(tmp_path):
+    """Test unchanged bundles come from the cache and a changed module triggers a rebuild."""
+    module = tmp_path / "mqtt.js"
+    module.write_text("let v = 1;\n")
+    bundler = ScriptBundler(tmp_path)
+    code = "// @include mqtt\nprint(v);\n"
+
+    first = bundler.bundle(code)
+    for _ in range(80):
+        assert bundler.bundle(code) is first
+    assert bundler.stats == {"builds": 1, "hits": 80, "reads": 1}
+
+    module.write_text("let v = 22;\n")
+    stat = module.stat()
+    os.utime(module, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    second = bundler.bundle(code)
+    assert second.code == "let v = 22;\n\nprint(v);\n"
+    assert second.hash != first.hash
+    assert bundler.stats == {"builds": 2, "hits": 80, "reads": 2}
+
+
+def test_bundle_errors(tmp_path):
+    """Test missing modules and circular includes raise BundleError."""
+    (tmp_path / "a.js").write_text("// @include b\n")
+    (tmp_path / "b.js").write_text("// @include a\n")
+    bundler = ScriptBundler(tmp_path)
+
+    with pytest.raises(BundleError, match="not found"):
+        bundler.bundle("// @include missing\n")
+    with pytest.raises(BundleError, match="Circular include: a -> b -> a"):
+        bundler.bundle("// @include a\n")
+
+
+def test_bundle_concurrent(tmp_path):
+    """Test bundles built from several executor threads at once share the cache safely."""
+    (tmp_path / "util.js").write_text("function util() {}\n")
+    bundler = ScriptBundler(tmp_path, max_entries=4)
+    sources = [f"// @include util\nprint({i});\n" for i in range(16)] * 20
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        bundles = list(executor.map(bundler.bundle, sources))
+
+    assert [bundle.code for bundle in bundles] == [f"function util() {{}}\n\nprint({i});\n" for i in range(16)] * 20
+    assert bundler.stats["builds"] + bundler.stats["hits"] == len(sources)
+    assert len(bundler._builds) == 4
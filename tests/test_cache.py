@@ -0,0 +1,50 @@
+# tests/test_cache.py
+
+"""Test the shABman script code cache."""
+
+from custom_components.shabman.cache import CodeCache
+
+
+def test_code_cache_hit_and_version():
+    """Test entries are only served for the revision they were loaded at."""
+    cache = CodeCache(max_entries=4, max_size=100)
+    cache.put(1, 5, "code")
+
+    assert cache.get(1, 5) == "code"
+    assert cache.get(1, 6) is None
+    assert cache.get(2, 5) is None
+    assert cache.as_dict() == {"entries": 1, "size": 4, "hits": 1, "misses": 2, "evictions": 0}
+
+
+def test_code_cache_evicts_least_recently_used():
+    """Test the least recently used entries are evicted by count and by size."""
+    cache = CodeCache(max_entries=2, max_size=10)
+    cache.put(1, None, "aaa")
+    cache.put(2, None, "bbb")
+    cache.get(1, None)
+    cache.put(3, None, "ccc")  # Evicts 2, 1 was used more recently
+
+    assert 1 in cache
+    assert 2 not in cache
+
+    cache.put(4, None, "dddddddd")  # Too large together with 3 and 1
+
+    assert 4 in cache
+    assert 1 not in cache
+    assert 3 not in cache
+    assert cache.as_dict()["size"] == 8
+
+
+def test_code_cache_skips_oversized_and_invalidates():
+    """Test oversized code is not cached and invalidation frees the size."""
+    cache = CodeCache(max_entries=2, max_size=10)
+    cache.put(1, None, "x" * 11)
+    assert 1 not in cache
+
+    cache.put(2, None, "code")
+    cache.invalidate(2)
+    assert cache.as_dict()["size"] == 0
+
+    cache.put(3, None, "code")
+    cache.clear()
+    assert 3 not in cache
@@ -11,7 +11,9 @@ from pytest_homeassistant_custom_component.common import MockConfigEntry
 
 # Importiere die Exception direkt aus dem Modul
 import custom_components.shabman.config_flow as config_flow
+from custom_components.shabman.backup import get_backup_store
 from custom_components.shabman.const import DOMAIN
+from custom_components.shabman.upload import code_hash
 
 
 async def test_form(hass: HomeAssistant) -> None:
@@ -103,3 +105,89 @@ async def test_form_already_configured(hass: HomeAssistant) -> None:
 
     assert result2["type"] == FlowResultType.ABORT
     assert result2["reason"] == "already_configured"
+
+
+async def test_options_flow_settings(hass: HomeAssistant, setup_integration) -> None:
+    """Test the settings step stores the refresh window in the entry options."""
+    entry = setup_integration
+
+    result = await hass.config_entries.options.async_init(entry.entry_id)
+    assert result["type"] == FlowResultType.MENU
+
+    result = await hass.config_entries.options.async_configure(result["flow_id"], {"next_step_id": "settings"})
+    assert result["type"] == FlowResultType.FORM
+    assert result["step_id"] == "settings"
+
+    result = await hass.config_entries.options.async_configure(result["flow_id"], {"refresh_window": 2.5})
+    await hass.async_block_till_done()
+
+    assert result["type"] == FlowResultType.CREATE_ENTRY
+    assert entry.options["refresh_window"] == 2.5
+
+
+async def test_options_flow_edit_script_in_place(hass: HomeAssistant, setup_integration) -> None:
+    """Test editing a script updates it in place instead of re-creating it."""
+    entry = setup_integration
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+
+    with (
+        patch.object(coordinator, "get_script_code", return_value="old code"),
+        patch.object(coordinator, "update_script", return_value=True) as mock_update,
+        patch.object(coordinator, "delete_script") as mock_delete,
+        patch.object(coordinator, "upload_script") as mock_upload,
+    ):
+        result = await hass.config_entries.options.async_init(entry.entry_id)
+        result = await hass.config_entries.options.async_configure(
+            result["flow_id"], {"next_step_id": "manage_scripts"}
+        )
+        result = await hass.config_entries.options.async_configure(result["flow_id"], {"script": "1"})
+        assert result["step_id"] == "edit_script"
+
+        result = await hass.config_entries.options.async_configure(
+            result["flow_id"], {"name": "renamed", "code": "new code"}
+        )
+        await hass.async_block_till_done()
+
+    assert result["type"] == FlowResultType.CREATE_ENTRY
+    mock_update.assert_called_once_with(1, "renamed", "new code")
+    mock_delete.assert_not_called()
+    mock_upload.assert_not_called()
+
+    # The original code was backed up before the update
+    store = get_backup_store(hass)
+    backups = await hass.async_add_executor_job(store.entries, coordinator.device_id, 1)
+    assert [backup.hash for backup in backups] == [code_hash("old code")]
+    assert await hass.async_add_executor_job(store.read, backups[0].hash) == "old code"
+
+
+async def test_options_flow_edit_script_code_not_loaded(hass: HomeAssistant, setup_integration) -> None:
+    """Test the placeholder for code that could not be loaded is never backed up or restored."""
+    entry = setup_integration
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+
+    with (
+        patch.object(coordinator, "get_script_source", return_value=None),
+        patch.object(coordinator, "update_script", return_value=False) as mock_update,
+        patch.object(coordinator, "delete_script") as mock_delete,
+        patch.object(coordinator, "upload_script") as mock_upload,
+    ):
+        result = await hass.config_entries.options.async_init(entry.entry_id)
+        result = await hass.config_entries.options.async_configure(
+            result["flow_id"], {"next_step_id": "manage_scripts"}
+        )
+        result = await hass.config_entries.options.async_configure(result["flow_id"], {"script": "1"})
+        assert result["step_id"] == "edit_script"
+
+        result = await hass.config_entries.options.async_configure(
+            result["flow_id"], {"name": "renamed", "code": "new code"}
+        )
+        await hass.async_block_till_done()
+
+    assert result["type"] == FlowResultType.FORM
+    assert result["errors"] == {"base": "update_failed"}
+    mock_update.assert_called_once_with(1, "renamed", "new code")
+    mock_delete.assert_not_called()  # The original could not be restored after a delete
+    mock_upload.assert_not_called()
+
+    store = get_backup_store(hass)
+    assert await hass.async_add_executor_job(store.entries, coordinator.device_id, 1) == []
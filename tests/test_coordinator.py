@@ -1,17 +1,35 @@
 """Test the shABman coordinator."""
 
 import asyncio
+import math
+import re
+import time
+from datetime import timedelta
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 from aiohttp import WSMsgType
-from aioresponses import aioresponses
+from aioresponses import CallbackResult, aioresponses
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers.update_coordinator import UpdateFailed
 from pytest_homeassistant_custom_component.common import MockConfigEntry
-
-from custom_components.shabman.const import CONF_DEVICE_IP, CONF_DEVICE_TYPE, DOMAIN
+from yarl import URL
+
+from custom_components.shabman.const import (
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_RESET_TIMEOUT,
+    CODE_DOWNLOAD_CHUNK,
+    CONF_DEVICE_IP,
+    CONF_DEVICE_TYPE,
+    DOMAIN,
+    HTTP_CONNECTIONS_PER_HOST,
+    POLL_INTERVAL_UNREACHABLE_MAX,
+    RPC_MAX_CONCURRENT,
+    UPDATE_INTERVAL,
+    UPDATE_INTERVAL_CONNECTED,
+)
 from custom_components.shabman.coordinator import ShABmanCoordinator
+from custom_components.shabman.upload import code_hash
 
 
 @pytest.fixture
@@ -32,7 +50,7 @@ def mock_config_entry(hass):
 
 
 @pytest.fixture
-def mock_coordinator(hass, mock_config_entry):
+def mock_coordinator(hass, mock_config_entry, backup_store):
     """Create a coordinator."""
     coordinator = ShABmanCoordinator(hass, mock_config_entry)
     return coordinator
@@ -279,6 +297,26 @@ async def test_set_script_config_exception(hass: HomeAssistant, mock_coordinator
         assert result is False
 
 
+async def test_requests_share_pooled_session(hass: HomeAssistant, mock_coordinator):
+    """Test that all RPC calls reuse one keep-alive session."""
+    with aioresponses() as m:
+        m.get("http://192.168.1.100/rpc/Script.List", payload={"scripts": []})
+        m.post("http://192.168.1.100/rpc/Script.Start", payload={"was_running": False})
+
+        await mock_coordinator.list_scripts()
+        session = mock_coordinator._session
+        await mock_coordinator.start_script(1)
+
+        assert session is not None
+        assert mock_coordinator._session is session
+        assert session.connector.limit_per_host == HTTP_CONNECTIONS_PER_HOST
+
+    await mock_coordinator.async_shutdown()
+
+    assert session.closed
+    assert mock_coordinator._session is None
+
+
 # ===== Upload Script with Chunking =====
 
 
@@ -349,12 +387,598 @@ async def test_upload_script_exception_with_retry(hass: HomeAssistant, mock_coor
         assert result is False
 
 
+async def test_upload_script_utf8_chunks(hass: HomeAssistant, mock_coordinator):
+    """Test chunks end on character boundaries and only the first one replaces the code."""
+    code = "€" * 3000  # 9000 bytes, chunk sizes are not a multiple of 3
+
+    with aioresponses() as m:
+        m.post("http://192.168.1.100/rpc/Script.Create", payload={"id": 1})
+        m.post("http://192.168.1.100/rpc/Script.PutCode", payload={}, repeat=True)
+
+        result = await mock_coordinator.upload_script("euro", code)
+
+        payloads = [
+            call.kwargs["json"] for call in m.requests[("POST", URL("http://192.168.1.100/rpc/Script.PutCode"))]
+        ]
+
+    assert result is True
+    assert "".join(payload["code"] for payload in payloads) == code
+    assert [payload["append"] for payload in payloads] == [False] + [True] * (len(payloads) - 1)
+    assert mock_coordinator.upload_stats["bytes"] == 9000
+    assert mock_coordinator.upload_stats["chunks"] == len(payloads)
+
+
+async def test_upload_script_retries_failed_chunk(hass: HomeAssistant, mock_coordinator):
+    """Test a rejected chunk is sent again without recreating the script."""
+    with (
+        patch("custom_components.shabman.coordinator.UPLOAD_RETRY_DELAY", 0),
+        aioresponses() as m,
+    ):
+        m.post("http://192.168.1.100/rpc/Script.Create", payload={"id": 1})
+        m.post("http://192.168.1.100/rpc/Script.PutCode", status=500)
+        m.post("http://192.168.1.100/rpc/Script.PutCode", payload={})
+
+        result = await mock_coordinator.upload_script("test", "code")
+
+        assert len(m.requests[("POST", URL("http://192.168.1.100/rpc/Script.Create"))]) == 1
+
+    assert result is True
+    assert mock_coordinator.upload_stats["retries"] == 1
+    assert mock_coordinator.upload_stats["resumed"] == 0
+
+
+async def test_upload_script_resumes_after_lost_response(hass: HomeAssistant, mock_coordinator):
+    """Test a chunk that arrived without a response is not appended twice."""
+    code = "x" * 5000
+
+    with (
+        patch("custom_components.shabman.coordinator.UPLOAD_RETRY_DELAY", 0),
+        aioresponses() as m,
+    ):
+        m.post("http://192.168.1.100/rpc/Script.Create", payload={"id": 1})
+        m.post("http://192.168.1.100/rpc/Script.PutCode", payload={})
+        m.post("http://192.168.1.100/rpc/Script.PutCode", exception=TimeoutError())
+        # The device already holds the whole code
+        m.get(
+            "http://192.168.1.100/rpc/Script.GetCode?id=1&len=1&offset=2048",
+            payload={"data": "x", "left": 2951},
+        )
+
+        result = await mock_coordinator.upload_script("test", code)
+
+        assert len(m.requests[("POST", URL("http://192.168.1.100/rpc/Script.PutCode"))]) == 2
+
+    assert result is True
+    assert mock_coordinator.upload_stats["resumed"] == 1
+
+
+async def test_upload_script_restarts_on_unknown_device_state(hass: HomeAssistant, mock_coordinator):
+    """Test the upload starts over if the code on the device cannot be read back."""
+    with (
+        patch("custom_components.shabman.coordinator.UPLOAD_RETRY_DELAY", 0),
+        aioresponses() as m,
+    ):
+        m.post("http://192.168.1.100/rpc/Script.Create", payload={"id": 1})
+        m.post("http://192.168.1.100/rpc/Script.PutCode", payload={})
+        m.post("http://192.168.1.100/rpc/Script.PutCode", exception=TimeoutError())
+        m.post("http://192.168.1.100/rpc/Script.PutCode", payload={}, repeat=True)
+
+        result = await mock_coordinator.upload_script("test", "x" * 5000)
+
+        payloads = [
+            call.kwargs["json"] for call in m.requests[("POST", URL("http://192.168.1.100/rpc/Script.PutCode"))]
+        ]
+
+    assert result is True
+    assert payloads[2]["append"] is False
+    assert "".join(payload["code"] for payload in payloads[2:]) == "x" * 5000
+
+
+async def test_update_script_in_place(hass: HomeAssistant, mock_coordinator):
+    """Test updating a running script keeps its id and restarts it."""
+    with aioresponses() as m:
+        m.post("http://192.168.1.100/rpc/Script.Stop", payload={"was_running": True})
+        m.post("http://192.168.1.100/rpc/Script.PutCode", payload={})
+        m.post("http://192.168.1.100/rpc/Script.SetConfig", payload={"restart_required": False})
+        m.post("http://192.168.1.100/rpc/Script.Start", payload={"was_running": False})
+
+        result = await mock_coordinator.update_script(3, "renamed", "new code")
+
+        put_code = m.requests[("POST", URL("http://192.168.1.100/rpc/Script.PutCode"))][0].kwargs["json"]
+        set_config = m.requests[("POST", URL("http://192.168.1.100/rpc/Script.SetConfig"))][0].kwargs["json"]
+
+    assert result is True
+    assert put_code == {"id": 3, "code": "new code", "append": False}
+    assert set_config == {"id": 3, "config": {"name": "renamed"}}
+    assert ("POST", URL("http://192.168.1.100/rpc/Script.Create")) not in m.requests
+    assert ("POST", URL("http://192.168.1.100/rpc/Script.Delete")) not in m.requests
+
+
+async def test_update_script_stopped_stays_stopped(hass: HomeAssistant, mock_coordinator):
+    """Test updating a stopped script does not start it."""
+    with aioresponses() as m:
+        m.post("http://192.168.1.100/rpc/Script.Stop", payload={"was_running": False})
+        m.post("http://192.168.1.100/rpc/Script.PutCode", payload={})
+        m.post("http://192.168.1.100/rpc/Script.SetConfig", payload={})
+
+        result = await mock_coordinator.update_script(3, "name", "code")
+
+    assert result is True
+    assert ("POST", URL("http://192.168.1.100/rpc/Script.Start")) not in m.requests
+
+
+async def test_update_script_rename_fails(hass: HomeAssistant, mock_coordinator):
+    """Test a failed rename after the code was written keeps the script and restarts it."""
+    with aioresponses() as m:
+        m.get("http://192.168.1.100/rpc/Script.GetCode?id=3", payload={"data": "old code"})
+        m.post("http://192.168.1.100/rpc/Script.Stop", payload={"was_running": True})
+        m.post("http://192.168.1.100/rpc/Script.PutCode", payload={})
+        m.post("http://192.168.1.100/rpc/Script.SetConfig", status=400)
+        m.post("http://192.168.1.100/rpc/Script.Start", payload={"was_running": False})
+
+        result = await mock_coordinator.update_script(3, "renamed", "new code")
+
+        assert ("POST", URL("http://192.168.1.100/rpc/Script.Start")) in m.requests
+
+    assert result is True
+    assert mock_coordinator.get_code_hash(3) == code_hash("new code")
+
+
+async def test_update_script_same_name_not_renamed(hass: HomeAssistant, mock_coordinator):
+    """Test the name is only sent if it changed, SetConfig would invalidate the code cache."""
+    _set_scripts(mock_coordinator, [{"id": 3, "name": "name", "running": True}])
+
+    with aioresponses() as m:
+        m.get("http://192.168.1.100/rpc/Script.GetCode?id=3", payload={"data": "old code"})
+        m.post("http://192.168.1.100/rpc/Script.Stop", payload={"was_running": True})
+        m.post("http://192.168.1.100/rpc/Script.PutCode", payload={})
+        m.post("http://192.168.1.100/rpc/Script.Start", payload={"was_running": False})
+
+        assert await mock_coordinator.update_script(3, "name", "new code") is True
+
+        assert ("POST", URL("http://192.168.1.100/rpc/Script.SetConfig")) not in m.requests
+
+
+async def test_update_script_put_code_fails(hass: HomeAssistant, mock_coordinator):
+    """Test a failed in-place update reports failure and restores the previous code."""
+    with (
+        patch("custom_components.shabman.coordinator.UPLOAD_RETRY_DELAY", 0),
+        aioresponses() as m,
+    ):
+        m.get("http://192.168.1.100/rpc/Script.GetCode?id=3", payload={"data": "old code"})
+        m.post("http://192.168.1.100/rpc/Script.Stop", payload={"was_running": True})
+        m.post("http://192.168.1.100/rpc/Script.PutCode", status=500, repeat=3)
+        m.post("http://192.168.1.100/rpc/Script.PutCode", payload={})
+        m.post("http://192.168.1.100/rpc/Script.Start", payload={"was_running": False})
+
+        result = await mock_coordinator.update_script(3, "name", "code")
+
+        put_calls = m.requests[("POST", URL("http://192.168.1.100/rpc/Script.PutCode"))]
+        assert put_calls[-1].kwargs["json"] == {"id": 3, "code": "old code", "append": False}
+        assert ("POST", URL("http://192.168.1.100/rpc/Script.Start")) in m.requests
+
+    assert result is False
+    assert mock_coordinator.get_code_hash(3) == code_hash("old code")
+
+
+async def test_update_script_put_code_fails_previous_unknown(hass: HomeAssistant, mock_coordinator):
+    """Test a failed in-place update leaves the script stopped if the previous code could not be read."""
+    with (
+        patch("custom_components.shabman.coordinator.UPLOAD_RETRY_DELAY", 0),
+        aioresponses() as m,
+    ):
+        m.get("http://192.168.1.100/rpc/Script.GetCode?id=3", status=500)
+        m.post("http://192.168.1.100/rpc/Script.Stop", payload={"was_running": True})
+        m.post("http://192.168.1.100/rpc/Script.PutCode", status=500, repeat=True)
+
+        result = await mock_coordinator.update_script(3, "name", "code")
+
+    assert result is False
+    assert ("POST", URL("http://192.168.1.100/rpc/Script.Start")) not in m.requests
+
+
+# ===== Content Hash Change Detection =====
+
+
+async def test_update_script_skips_unchanged_code(hass: HomeAssistant, mock_coordinator):
+    """Test code that was downloaded unchanged is not uploaded again."""
+    _set_scripts(mock_coordinator, [{"id": 1, "name": "test", "running": True}])
+
+    with aioresponses() as m:
+        m.get("http://192.168.1.100/rpc/Script.GetCode?id=1", payload={"data": "code"})
+
+        assert await mock_coordinator.get_script_code(1) == "code"
+        assert await mock_coordinator.update_script(1, "test", "code") is True
+
+        assert len(m.requests) == 1  # Only the download
+
+
+async def test_update_script_unchanged_code_renames(hass: HomeAssistant, mock_coordinator):
+    """Test a rename of a script with unchanged code only sends the new name."""
+    _set_scripts(mock_coordinator, [{"id": 1, "name": "test", "running": True}])
+    mock_coordinator._code_hashes[1] = code_hash("code")
+
+    with aioresponses() as m:
+        m.post("http://192.168.1.100/rpc/Script.SetConfig", payload={})
+
+        assert await mock_coordinator.update_script(1, "renamed", "code") is True
+
+        assert list(m.requests) == [("POST", URL("http://192.168.1.100/rpc/Script.SetConfig"))]
+
+
+async def test_update_script_force(hass: HomeAssistant, mock_coordinator):
+    """Test force uploads unchanged code."""
+    _set_scripts(mock_coordinator, [{"id": 1, "name": "test", "running": False}])
+    mock_coordinator._code_hashes[1] = code_hash("code")
+
+    with aioresponses() as m:
+        m.post("http://192.168.1.100/rpc/Script.Stop", payload={"was_running": False})
+        m.post("http://192.168.1.100/rpc/Script.PutCode", payload={})
+        m.post("http://192.168.1.100/rpc/Script.SetConfig", payload={})
+
+        assert await mock_coordinator.update_script(1, "test", "code", force=True) is True
+
+        assert ("POST", URL("http://192.168.1.100/rpc/Script.PutCode")) in m.requests
+
+
+async def test_upload_script_skips_unchanged_script(hass: HomeAssistant, mock_coordinator):
+    """Test uploading a script that exists with the same code is a no-op."""
+    with aioresponses() as m:
+        m.post("http://192.168.1.100/rpc/Script.Create", payload={"id": 1})
+        m.post("http://192.168.1.100/rpc/Script.PutCode", payload={})
+
+        assert await mock_coordinator.upload_script("test", "code") is True
+
+    _set_scripts(mock_coordinator, [{"id": 1, "name": "test"}])
+
+    with aioresponses() as m:
+        assert await mock_coordinator.upload_script("test", "code") is True
+        assert not m.requests
+
+    with aioresponses() as m:
+        m.post("http://192.168.1.100/rpc/Script.Create", payload={"id": 2})
+        m.post("http://192.168.1.100/rpc/Script.PutCode", payload={})
+
+        assert await mock_coordinator.upload_script("test", "changed") is True
+        assert ("POST", URL("http://192.168.1.100/rpc/Script.Create")) in m.requests
+
+
+async def test_code_hashes_forget_removed_scripts(hass: HomeAssistant, mock_coordinator):
+    """Test hashes of deleted or vanished scripts are dropped."""
+    mock_coordinator._code_hashes.update({1: code_hash("a"), 2: code_hash("b")})
+
+    with aioresponses() as m:
+        m.post("http://192.168.1.100/rpc/Script.Delete", payload={})
+        await mock_coordinator.delete_script(1)
+
+    assert 1 not in mock_coordinator._code_hashes
+
+    with patch.object(mock_coordinator, "get_script_components", return_value=[{"id": 3, "name": "other"}]):
+        await mock_coordinator._async_update_data()
+
+    assert not mock_coordinator._code_hashes
+
+
+async def test_status_push_keeps_code_of_new_script(hass: HomeAssistant, mock_coordinator):
+    """Test a status push before the next refresh does not forget a just uploaded script."""
+    _set_scripts(mock_coordinator, [{"id": 1, "name": "a", "running": False}])
+
+    with aioresponses() as m:
+        m.post("http://192.168.1.100/rpc/Script.Create", payload={"id": 2})
+        m.post("http://192.168.1.100/rpc/Script.PutCode", payload={})
+        assert await mock_coordinator.upload_script("new", "code") is True
+
+    with patch.object(mock_coordinator, "async_refresh"):
+        mock_coordinator._handle_ws_message({"method": "NotifyStatus", "params": {"script:1": {"running": True}}})
+        await _run_scheduled_refreshes(hass)
+
+    assert mock_coordinator.data["scripts"][0]["running"] is True
+    assert mock_coordinator.get_code_hash(2) == code_hash("code")
+    assert 2 in mock_coordinator._code_cache
+
+
+async def test_script_index(hass: HomeAssistant, mock_coordinator):
+    """Test the data holds an id index of script records next to the list."""
+    data = mock_coordinator._build_data(
+        [{"id": 1, "name": "a", "enabled": True, "running": False, "mem_peak": 10}, {"id": 5, "name": "b"}]
+    )
+    mock_coordinator.data = data
+
+    assert set(data["scripts_by_id"]) == {1, 5}
+    record = mock_coordinator.get_script(1)
+    assert (record.name, record.enabled, record.running, record.mem_peak) == ("a", True, False, 10)
+    assert mock_coordinator.get_script(2) is None
+
+    # Data set without the index is still searched
+    mock_coordinator.data = {"scripts": data["scripts"]}
+    assert mock_coordinator.get_script(5).name == "b"
+
+
+# ===== Minification =====
+
+
+async def test_upload_script_minified(hass: HomeAssistant, backup_store):
+    """Test scripts are minified when enabled and the source is kept for editing."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={CONF_DEVICE_IP: "192.168.1.100", CONF_DEVICE_TYPE: "SNSW-001X16EU", "device_id": "test123"},
+        options={"minify": True},
+    )
+    coordinator = ShABmanCoordinator(hass, entry)
+    source = "// Say hello\nlet greeting = 'hello';\n\nprint(greeting);\n"
+
+    with aioresponses() as m:
+        m.post("http://192.168.1.100/rpc/Script.Create", payload={"id": 1})
+        m.post("http://192.168.1.100/rpc/Script.PutCode", payload={})
+
+        assert await coordinator.upload_script("test", source) is True
+
+        payload = m.requests[("POST", URL("http://192.168.1.100/rpc/Script.PutCode"))][0].kwargs["json"]
+
+    assert payload["code"] == "let greeting='hello';print(greeting);"
+    assert coordinator.upload_stats["source_bytes"] == len(source)
+    assert coordinator.upload_stats["bytes"] == len(payload["code"])
+    assert coordinator.code_unchanged(1, source)
+
+    with aioresponses() as m:
+        assert await coordinator.get_script_source(1) == source
+        assert not m.requests
+
+
+async def test_get_script_source_after_restart(hass: HomeAssistant, backup_store):
+    """Test the source of minified code is found again by a new coordinator."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={CONF_DEVICE_IP: "192.168.1.100", CONF_DEVICE_TYPE: "SNSW-001X16EU", "device_id": "test123"},
+        options={"minify": True},
+    )
+    source = "// Say hello\nlet greeting = 'hello';\n\nprint(greeting);\n"
+    minified = "let greeting='hello';print(greeting);"
+
+    with aioresponses() as m:
+        m.post("http://192.168.1.100/rpc/Script.Create", payload={"id": 1})
+        m.post("http://192.168.1.100/rpc/Script.PutCode", payload={})
+
+        assert await ShABmanCoordinator(hass, entry).upload_script("test", source) is True
+
+    restarted = ShABmanCoordinator(hass, entry)
+    with aioresponses() as m:
+        m.get("http://192.168.1.100/rpc/Script.GetCode?id=1", payload={"data": minified})
+
+        assert await restarted.get_script_source(1) == source
+
+    # Code changed on the device, the kept source no longer applies
+    restarted = ShABmanCoordinator(hass, entry)
+    with aioresponses() as m:
+        m.get("http://192.168.1.100/rpc/Script.GetCode?id=1", payload={"data": "let a=2;"})
+
+        assert await restarted.get_script_source(1) == "let a=2;"
+
+
+async def test_get_script_source_after_device_change(hass: HomeAssistant, backup_store):
+    """Test the kept source is not returned once the code on the device changed."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={CONF_DEVICE_IP: "192.168.1.100", CONF_DEVICE_TYPE: "SNSW-001X16EU", "device_id": "test123"},
+        options={"minify": True},
+    )
+    coordinator = ShABmanCoordinator(hass, entry)
+    coordinator._sources[1] = "let a = 1;"
+    coordinator._code_hashes[1] = code_hash("let a=2;")
+
+    with aioresponses() as m:
+        m.get("http://192.168.1.100/rpc/Script.GetCode?id=1", payload={"data": "let a=2;"})
+
+        assert await coordinator.get_script_source(1) == "let a=2;"
+
+
+# ===== Chunked Script Download =====
+
+
+def _mock_get_code(m, code: str, head: int = 1000, truncate: bool = False, extend: bool = False) -> None:
+    """Mock Script.GetCode of a device that returns code in offset/len chunks.
+
+    Chunks hold whole characters: one split by the requested range is left out, or with
+    extend returned completely. With truncate the data misses a byte "left" accounts for.
+    """
+    data = code.encode("utf-8")
+
+    def callback(url, **kwargs):
+        params = kwargs["params"]
+        start = params.get("offset", 0)
+        end = min(start + params.get("len", head), len(data))
+        while 0 < end < len(data) and data[end] & 0xC0 == 0x80:  # UTF-8 continuation byte
+            end += 1 if extend else -1
+        chunk = data[start : end - (1 if truncate and start else 0)]
+        return CallbackResult(payload={"data": chunk.decode("utf-8"), "left": len(data) - end})
+
+    m.get(re.compile(r"http://192\.168\.1\.100/rpc/Script\.GetCode.*"), callback=callback, repeat=True)
+
+
+async def test_get_script_code_chunked(hass: HomeAssistant, mock_coordinator):
+    """Test large scripts are downloaded completely in offset/len chunks."""
+    code = "".join(f"print({i});\n" for i in range(1000))  # ~12 kB
+
+    with aioresponses() as m:
+        _mock_get_code(m, code)
+
+        assert await mock_coordinator.get_script_code(1) == code
+
+        calls = [call for calls in m.requests.values() for call in calls]
+
+    assert len(calls) == 1 + math.ceil((len(code) - 1000) / CODE_DOWNLOAD_CHUNK)
+    assert calls[0].kwargs["params"] == {"id": 1}
+
+
+async def test_iter_script_code(hass: HomeAssistant, mock_coordinator):
+    """Test the streaming download yields the code in order."""
+    code = "// line\n" * 2000
+
+    with aioresponses() as m:
+        _mock_get_code(m, code, head=1500)
+
+        chunks = [chunk async for chunk in mock_coordinator.iter_script_code(1)]
+
+    assert len(chunks) > 1
+    assert "".join(chunks) == code
+
+
+@pytest.mark.parametrize("extend", [False, True])
+async def test_get_script_code_multibyte_chunk_boundaries(hass: HomeAssistant, mock_coordinator, extend):
+    """Test characters split by the byte offsets of the chunks are downloaded intact."""
+    code = "// Grüße, 5 € 🙂\n" * 1000  # Chunk boundaries fall inside characters
+
+    with aioresponses() as m:
+        _mock_get_code(m, code, extend=extend)
+
+        assert await mock_coordinator.get_script_code(1) == code
+
+    mock_coordinator._code_cache.invalidate(1)
+    with aioresponses() as m:
+        _mock_get_code(m, code, head=1001, extend=extend)
+
+        chunks = [chunk async for chunk in mock_coordinator.iter_script_code(1)]
+
+    assert "".join(chunks) == code
+
+
+async def test_get_script_code_truncated(hass: HomeAssistant, mock_coordinator):
+    """Test a download that returns less code than announced fails instead of losing code."""
+    with aioresponses() as m:
+        _mock_get_code(m, "x" * 5000, truncate=True)
+
+        assert await mock_coordinator.get_script_code(1) is None
+
+    assert 1 not in mock_coordinator._code_cache
+
+
+# ===== Script Code Cache =====
+
+
+async def test_get_script_code_cached(hass: HomeAssistant, mock_coordinator):
+    """Test re-reading a script is served from the code cache."""
+    with aioresponses() as m:
+        m.get("http://192.168.1.100/rpc/Script.GetCode?id=1", payload={"data": "code"})
+
+        assert await mock_coordinator.get_script_code(1) == "code"
+        assert await mock_coordinator.get_script_code(1) == "code"
+
+        assert len(m.requests[("GET", URL("http://192.168.1.100/rpc/Script.GetCode?id=1"))]) == 1
+
+    assert mock_coordinator.code_cache_stats["hits"] == 1
+
+
+async def test_code_cache_follows_uploads_and_deletes(hass: HomeAssistant, mock_coordinator):
+    """Test uploaded code is cached and deleted scripts are dropped."""
+    with aioresponses() as m:
+        m.post("http://192.168.1.100/rpc/Script.Create", payload={"id": 1})
+        m.post("http://192.168.1.100/rpc/Script.PutCode", payload={})
+        m.post("http://192.168.1.100/rpc/Script.Delete", payload={})
+
+        await mock_coordinator.upload_script("test", "uploaded")
+        assert await mock_coordinator.get_script_code(1) == "uploaded"
+
+        await mock_coordinator.delete_script(1)
+        assert 1 not in mock_coordinator._code_cache
+
+
+async def test_code_cache_invalidated_by_websocket(hass: HomeAssistant, mock_coordinator):
+    """Test configuration changes pushed by the device invalidate cached code."""
+    _set_scripts(mock_coordinator, [{"id": 1, "name": "a"}, {"id": 2, "name": "b"}])
+    mock_coordinator._on_sys_status({"sys": {"cfg_rev": 7}})
+    mock_coordinator._code_cache.put(1, 7, "one")
+    mock_coordinator._code_cache.put(2, 7, "two")
+
+    mock_coordinator._handle_script_events([{"component": "script:1", "event": "config_changed"}])
+    assert 1 not in mock_coordinator._code_cache
+    assert mock_coordinator._code_cache.get(2, 7) == "two"
+
+    mock_coordinator._on_sys_status({"sys": {"cfg_rev": 8}})
+    with aioresponses() as m:
+        m.get("http://192.168.1.100/rpc/Script.GetCode?id=2", payload={"data": "two v2"})
+
+        assert await mock_coordinator.get_script_code(2) == "two v2"
+
+    await mock_coordinator.async_shutdown()
+
+
 # ===== Update Coordinator Data =====
 
 
+async def test_coordinator_update_data_bulk(hass: HomeAssistant, mock_coordinator):
+    """Test coordinator data update from a single Shelly.GetComponents call."""
+    with aioresponses() as m:
+        m.post(
+            "http://192.168.1.100/rpc/Shelly.GetComponents",
+            payload={
+                "components": [
+                    {"key": "switch:0", "status": {"output": True}, "config": {"id": 0}},
+                    {
+                        "key": "script:1",
+                        "status": {"id": 1, "running": True, "mem_used": 1024, "mem_free": 2048, "mem_peak": 1500},
+                        "config": {"id": 1, "name": "test1", "enable": True},
+                    },
+                    {
+                        "key": "script:2",
+                        "status": {"id": 2, "running": False, "errors": ["crashed"]},
+                        "config": {"id": 2, "name": "test2", "enable": False},
+                    },
+                ],
+                "offset": 0,
+                "total": 3,
+            },
+        )
+
+        data = await mock_coordinator._async_update_data()
+
+    assert [script["id"] for script in data["scripts"]] == [1, 2]
+    assert data["running_count"] == 1
+    assert data["enabled_count"] == 1
+    assert data["scripts"][0]["name"] == "test1"
+    assert data["scripts"][0]["mem_peak"] == 1500
+    assert data["scripts"][1]["errors"] == ["crashed"]
+
+
+async def test_coordinator_update_data_bulk_paginated(hass: HomeAssistant, mock_coordinator):
+    """Test that Shelly.GetComponents pages are followed via the offset."""
+    with aioresponses() as m:
+        m.post(
+            "http://192.168.1.100/rpc/Shelly.GetComponents",
+            payload={
+                "components": [
+                    {"key": "script:1", "status": {"running": True}, "config": {"id": 1, "name": "a", "enable": True}},
+                ],
+                "offset": 0,
+                "total": 2,
+            },
+        )
+        m.post(
+            "http://192.168.1.100/rpc/Shelly.GetComponents",
+            payload={
+                "components": [
+                    {
+                        "key": "script:2",
+                        "status": {"running": False},
+                        "config": {"id": 2, "name": "b", "enable": False},
+                    },
+                ],
+                "offset": 1,
+                "total": 2,
+            },
+        )
+
+        data = await mock_coordinator._async_update_data()
+
+        requests = [call.kwargs["json"] for key, calls in m.requests.items() for call in calls]
+
+    assert [script["name"] for script in data["scripts"]] == ["a", "b"]
+    assert [request["offset"] for request in requests] == [0, 1]
+
+
 async def test_coordinator_update_data(hass: HomeAssistant, mock_coordinator):
-    """Test full coordinator data update."""
+    """Test full coordinator data update on firmware without Shelly.GetComponents."""
     with aioresponses() as m:
+        m.post("http://192.168.1.100/rpc/Shelly.GetComponents", status=404)
         m.get(
             "http://192.168.1.100/rpc/Script.List",
             payload={
@@ -381,17 +1005,40 @@ async def test_coordinator_update_data(hass: HomeAssistant, mock_coordinator):
         assert data["enabled_count"] == 1
         assert data["scripts"][0]["running"] is True
 
+    # Unsupported firmware is remembered, later refreshes skip the bulk call
+    assert mock_coordinator._bulk_status_supported is False
+
 
 async def test_coordinator_update_failed(hass: HomeAssistant, mock_coordinator):
     """Test coordinator update failure."""
-    # Mock list_scripts to raise an exception
-    with patch.object(mock_coordinator, "list_scripts", side_effect=Exception("Network error")):
+    # Mock the device call to raise an exception
+    with patch.object(mock_coordinator, "_rpc_call", side_effect=Exception("Network error")):
         with pytest.raises(UpdateFailed, match="Error communicating with device"):
             await mock_coordinator._async_update_data()
 
 
+async def test_coordinator_update_script_list_fails(hass: HomeAssistant, mock_coordinator):
+    """Test a failed Script.List fails the refresh instead of forgetting every script."""
+    mock_coordinator._bulk_status_supported = False
+    mock_coordinator._code_hashes[1] = code_hash("code")
+
+    with (
+        patch.object(mock_coordinator, "_schedule_snapshot_save") as mock_save,
+        aioresponses() as m,
+    ):
+        m.get("http://192.168.1.100/rpc/Script.List", status=500)
+
+        with pytest.raises(UpdateFailed):
+            await mock_coordinator._async_update_data()
+
+    mock_save.assert_not_called()
+    assert mock_coordinator.get_code_hash(1) == code_hash("code")
+
+
 async def test_coordinator_update_with_status_exception(hass: HomeAssistant, mock_coordinator):
     """Test coordinator update with status exception."""
+    mock_coordinator._bulk_status_supported = False
+
     with aioresponses() as m:
         m.get(
             "http://192.168.1.100/rpc/Script.List",
@@ -444,7 +1091,7 @@ async def test_websocket_shutdown(hass: HomeAssistant, mock_coordinator):
     mock_coordinator._ws_task = task
 
     mock_session = AsyncMock()
-    mock_coordinator._ws_session = mock_session
+    mock_coordinator._session = mock_session
 
     await mock_coordinator.async_shutdown()
 
@@ -461,7 +1108,7 @@ async def test_websocket_shutdown_without_session(hass: HomeAssistant, mock_coor
 
     task = asyncio.create_task(dummy_task())
     mock_coordinator._ws_task = task
-    mock_coordinator._ws_session = None
+    mock_coordinator._session = None
 
     await mock_coordinator.async_shutdown()
 
@@ -473,12 +1120,10 @@ async def test_websocket_listener_reconnect(hass: HomeAssistant, mock_coordinato
     mock_ws = MagicMock()
     mock_ws.__aenter__ = AsyncMock(return_value=mock_ws)
     mock_ws.__aexit__ = AsyncMock()
+    mock_ws.send_json = AsyncMock()
 
     # Simulate connection error then cancel
-    async def mock_messages():
-        yield MagicMock(type=WSMsgType.ERROR)
-
-    mock_ws.__aiter__ = lambda self: mock_messages()
+    mock_ws.receive = AsyncMock(return_value=MagicMock(type=WSMsgType.ERROR))
 
     with patch("aiohttp.ClientSession") as mock_session_class:
         mock_session = MagicMock()
@@ -498,3 +1143,477 @@ async def test_websocket_listener_reconnect(hass: HomeAssistant, mock_coordinato
             await task
         except asyncio.CancelledError:
             pass
+
+        # Lost connection switches back to fast polling and requests a catch-up refresh
+        assert mock_coordinator.update_interval == timedelta(seconds=UPDATE_INTERVAL)
+        assert mock_coordinator.refresh_stats["requested"] == 1
+        await mock_coordinator.async_shutdown()
+
+
+# ===== JSON-RPC over WebSocket =====
+
+
+def _mock_ws_device(coordinator, results: dict):
+    """Attach a fake WebSocket that answers RPC frames like a Shelly device."""
+    ws = MagicMock()
+    ws.closed = False
+    sent = []
+
+    async def send_json(frame):
+        sent.append(frame)
+        reply = {"id": frame["id"], "src": "shelly", "dst": frame["src"]}
+        result = results[frame["method"]]
+        if isinstance(result, Exception):
+            reply["error"] = {"code": -105, "message": str(result)}
+        else:
+            reply["result"] = result
+        asyncio.get_running_loop().call_soon(coordinator._handle_ws_message, reply)
+
+    ws.send_json = send_json
+    coordinator._ws = ws
+    return sent
+
+
+async def test_rpc_call_uses_websocket(hass: HomeAssistant, mock_coordinator):
+    """Test that commands ride the open WebSocket instead of HTTP."""
+    sent = _mock_ws_device(mock_coordinator, {"Script.Start": {"was_running": False}})
+
+    with aioresponses():  # Any HTTP request would fail
+        result = await mock_coordinator.start_script(3)
+
+    assert result is True
+    assert sent[0]["method"] == "Script.Start"
+    assert sent[0]["params"] == {"id": 3}
+    assert sent[0]["src"] == mock_coordinator._ws_src
+    assert mock_coordinator._ws_pending == {}
+
+
+async def test_rpc_call_websocket_error(hass: HomeAssistant, mock_coordinator):
+    """Test that RPC errors on the WebSocket are reported as failures."""
+    _mock_ws_device(mock_coordinator, {"Script.Stop": Exception("Argument 'id', value 9 not found!")})
+
+    result = await mock_coordinator.stop_script(9)
+
+    assert result is False
+
+
+async def test_rpc_call_falls_back_to_http(hass: HomeAssistant, mock_coordinator):
+    """Test HTTP fallback when the WebSocket cannot send."""
+    ws = MagicMock()
+    ws.closed = False
+    ws.send_json = AsyncMock(side_effect=ConnectionResetError())
+    mock_coordinator._ws = ws
+
+    with aioresponses() as m:
+        m.post("http://192.168.1.100/rpc/Script.Start", payload={"was_running": False})
+
+        result = await mock_coordinator.start_script(1)
+
+    assert result is True
+    ws.send_json.assert_called_once()
+
+
+async def test_rpc_call_websocket_timeout(hass: HomeAssistant, mock_coordinator):
+    """Test that unanswered WebSocket calls time out and are cleaned up."""
+    ws = MagicMock()
+    ws.closed = False
+    ws.send_json = AsyncMock()
+    mock_coordinator._ws = ws
+
+    with pytest.raises(TimeoutError):
+        await mock_coordinator._rpc_call("Script.List", timeout=0.01)
+
+    assert mock_coordinator._ws_pending == {}
+
+
+async def test_pending_calls_fail_when_socket_closes(hass: HomeAssistant, mock_coordinator):
+    """Test that in-flight WebSocket calls fail when the connection drops."""
+    ws = MagicMock()
+    ws.closed = False
+    ws.send_json = AsyncMock()
+    mock_coordinator._ws = ws
+
+    task = asyncio.create_task(mock_coordinator._rpc_call("Script.List"))
+    await asyncio.sleep(0)
+    mock_coordinator._fail_pending_ws_calls()
+
+    with pytest.raises(ConnectionError):
+        await task
+
+
+# ===== WebSocket status deltas =====
+
+
+def _set_scripts(coordinator, scripts):
+    """Set coordinator data as if a refresh had loaded the given scripts."""
+    coordinator.data = coordinator._build_data(scripts)
+    coordinator._refresh_window = 0
+
+
+async def _run_scheduled_refreshes(hass: HomeAssistant) -> None:
+    """Let refreshes scheduled with a zero refresh window run."""
+    await asyncio.sleep(0)
+    await hass.async_block_till_done()
+
+
+async def test_notify_status_patches_script_in_place(hass: HomeAssistant, mock_coordinator):
+    """Test that NotifyStatus deltas update coordinator data without a refresh."""
+    _set_scripts(
+        mock_coordinator,
+        [
+            {"id": 1, "name": "a", "enabled": True, "running": True, "mem_used": 100, "mem_peak": 200},
+            {"id": 2, "name": "b", "enabled": False, "running": False, "mem_used": 0, "mem_peak": 0},
+        ],
+    )
+    listener = MagicMock()
+    remove_listener = mock_coordinator.async_add_listener(listener)
+
+    with patch.object(mock_coordinator, "async_refresh") as mock_refresh:
+        mock_coordinator._handle_ws_message(
+            {
+                "method": "NotifyStatus",
+                "params": {"ts": 1.0, "script:1": {"id": 1, "running": False, "errors": ["crashed"]}},
+            }
+        )
+        await _run_scheduled_refreshes(hass)
+
+    remove_listener()
+
+    mock_refresh.assert_not_called()
+    listener.assert_called()
+    script = mock_coordinator.data["scripts"][0]
+    assert script["running"] is False
+    assert script["errors"] == ["crashed"]
+    assert script["mem_peak"] == 200
+    assert script["name"] == "a"
+    assert mock_coordinator.data["running_count"] == 0
+
+
+async def test_notify_status_unknown_script_refreshes(hass: HomeAssistant, mock_coordinator):
+    """Test that a delta for an unknown script triggers a full refresh."""
+    _set_scripts(mock_coordinator, [{"id": 1, "name": "a", "running": False}])
+
+    with patch.object(mock_coordinator, "async_refresh") as mock_refresh:
+        mock_coordinator._handle_ws_message({"method": "NotifyStatus", "params": {"script:5": {"running": True}}})
+        await _run_scheduled_refreshes(hass)
+
+    mock_refresh.assert_called_once()
+    assert mock_coordinator.data["scripts"][0]["running"] is False
+
+
+async def test_notify_status_other_components_ignored(hass: HomeAssistant, mock_coordinator):
+    """Test that non-script status changes neither patch data nor refresh."""
+    _set_scripts(mock_coordinator, [{"id": 1, "name": "a", "running": True}])
+    data = mock_coordinator.data
+
+    with patch.object(mock_coordinator, "async_refresh") as mock_refresh:
+        mock_coordinator._handle_ws_message({"method": "NotifyStatus", "params": {"switch:0": {"apower": 12.5}}})
+        await _run_scheduled_refreshes(hass)
+
+    mock_refresh.assert_not_called()
+    assert mock_coordinator.data is data
+
+
+async def test_notify_event_script_created_refreshes(hass: HomeAssistant, mock_coordinator):
+    """Test that script table changes trigger a full refresh."""
+    _set_scripts(mock_coordinator, [])
+
+    with patch.object(mock_coordinator, "async_refresh") as mock_refresh:
+        mock_coordinator._handle_ws_message(
+            {
+                "method": "NotifyEvent",
+                "params": {"events": [{"component": "sys", "event": "component_added", "target": "script:3"}]},
+            }
+        )
+        await _run_scheduled_refreshes(hass)
+
+    mock_refresh.assert_called_once()
+
+
+# ===== Coalesced refresh scheduling =====
+
+
+async def test_refresh_requests_are_coalesced(hass: HomeAssistant, mock_coordinator):
+    """Test that a burst of refresh requests results in a single refresh."""
+    mock_coordinator._refresh_window = 0.05
+
+    with patch.object(mock_coordinator, "async_refresh") as mock_refresh:
+        for _ in range(5):
+            mock_coordinator.async_schedule_refresh()
+
+        mock_refresh.assert_not_called()
+        await asyncio.sleep(0.1)
+        await hass.async_block_till_done()
+
+    mock_refresh.assert_called_once()
+    assert mock_coordinator.refresh_stats == {"window": 0.05, "requested": 5, "suppressed": 4, "executed": 1}
+
+
+async def test_refresh_burst_does_not_block_reader(hass: HomeAssistant, mock_coordinator):
+    """Test that handling status frames never waits for a refresh."""
+    _set_scripts(mock_coordinator, [])
+    mock_coordinator._refresh_window = 10
+
+    refresh_started = asyncio.Event()
+
+    async def slow_refresh():
+        refresh_started.set()
+        await asyncio.sleep(100)
+
+    with patch.object(mock_coordinator, "async_refresh", side_effect=slow_refresh):
+        for script_id in range(3):
+            mock_coordinator._handle_ws_message({"method": "NotifyStatus", "params": {f"script:{script_id}": {}}})
+
+    assert not refresh_started.is_set()
+    assert mock_coordinator.refresh_stats["suppressed"] == 2
+
+    # Pending refreshes are dropped on shutdown
+    await mock_coordinator.async_shutdown()
+    assert mock_coordinator._pending_refresh is None
+
+
+# ===== Adaptive polling =====
+
+
+async def test_poll_interval_follows_websocket(hass: HomeAssistant, mock_coordinator):
+    """Test that polling slows down while the WebSocket is connected."""
+    assert mock_coordinator.update_interval == timedelta(seconds=UPDATE_INTERVAL)
+
+    ws = MagicMock()
+    ws.closed = False
+    mock_coordinator._ws = ws
+    mock_coordinator._update_poll_interval()
+    assert mock_coordinator.update_interval == timedelta(seconds=UPDATE_INTERVAL_CONNECTED)
+
+    ws.closed = True
+    mock_coordinator._update_poll_interval()
+    assert mock_coordinator.update_interval == timedelta(seconds=UPDATE_INTERVAL)
+
+
+async def test_poll_interval_backs_off_when_unreachable(hass: HomeAssistant, mock_coordinator):
+    """Test exponential polling backoff while the device is unreachable."""
+    intervals = []
+    with patch.object(mock_coordinator, "_rpc_call", side_effect=ConnectionError()):
+        for _ in range(6):
+            with pytest.raises(UpdateFailed):
+                await mock_coordinator._async_update_data()
+            intervals.append(mock_coordinator.update_interval.total_seconds())
+
+    assert intervals == [30, 60, 120, 240, POLL_INTERVAL_UNREACHABLE_MAX, POLL_INTERVAL_UNREACHABLE_MAX]
+
+    with patch.object(mock_coordinator, "get_script_components", return_value=[]):
+        await mock_coordinator._async_update_data()
+
+    assert mock_coordinator.update_interval == timedelta(seconds=UPDATE_INTERVAL)
+    assert mock_coordinator.poll_stats["consecutive_failures"] == 0
+
+
+async def test_poll_interval_from_options(hass: HomeAssistant):
+    """Test that polling intervals can be configured in the entry options."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={CONF_DEVICE_IP: "192.168.1.100", CONF_DEVICE_TYPE: "SNSW-001X16EU", "device_id": "test123"},
+        options={"poll_interval": 10, "poll_interval_connected": 900},
+    )
+    coordinator = ShABmanCoordinator(hass, entry)
+
+    assert coordinator.update_interval == timedelta(seconds=10)
+    coordinator._ws = MagicMock(closed=False)
+    coordinator._update_poll_interval()
+    assert coordinator.update_interval == timedelta(seconds=900)
+
+
+# ===== Circuit breaker =====
+
+
+async def test_circuit_breaker_fails_fast_when_offline(hass: HomeAssistant, mock_coordinator):
+    """Test that an offline device stops costing request timeouts."""
+    with aioresponses() as m:
+        m.post("http://192.168.1.100/rpc/Shelly.GetComponents", exception=ConnectionError(), repeat=True)
+        for _ in range(BREAKER_FAILURE_THRESHOLD):
+            with pytest.raises(UpdateFailed):
+                await mock_coordinator._async_update_data()
+
+        assert mock_coordinator.connection_stats["circuit"]["state"] == "open"
+        requests_while_closed = sum(len(calls) for calls in m.requests.values())
+
+        # Open circuit: no I/O at all, neither for polling nor for commands
+        with pytest.raises(UpdateFailed, match="Device unreachable"):
+            await mock_coordinator._async_update_data()
+        assert await mock_coordinator.start_script(1) is False
+        assert sum(len(calls) for calls in m.requests.values()) == requests_while_closed
+
+    # The next poll is the half-open probe
+    assert 0 < mock_coordinator.update_interval.total_seconds() <= BREAKER_RESET_TIMEOUT
+
+
+async def test_circuit_breaker_marks_entities_unavailable(hass: HomeAssistant, mock_coordinator):
+    """Test that opening the circuit immediately marks the data as failed."""
+    mock_coordinator.data = mock_coordinator._build_data([])
+    mock_coordinator.last_update_success = True
+
+    with aioresponses() as m:
+        m.post("http://192.168.1.100/rpc/Script.Start", exception=ConnectionError(), repeat=True)
+        for _ in range(BREAKER_FAILURE_THRESHOLD):
+            await mock_coordinator.start_script(1)
+
+    assert mock_coordinator.last_update_success is False
+
+
+async def test_circuit_breaker_closes_on_answer(hass: HomeAssistant, mock_coordinator):
+    """Test that RPC errors count as an answering device."""
+    mock_coordinator._breaker.record_failure()
+
+    with aioresponses() as m:
+        m.post("http://192.168.1.100/rpc/Script.Start", status=500)
+        await mock_coordinator.start_script(1)
+
+    assert mock_coordinator.connection_stats["circuit"]["failures"] == 0
+
+
+# ===== WebSocket liveness =====
+
+
+async def test_websocket_heartbeat_and_liveness_timeout(hass: HomeAssistant, mock_coordinator):
+    """Test that an idle socket is pinged and reconnected once it stops answering."""
+    mock_coordinator._liveness_timeout = 0.15
+    mock_coordinator._ws_backoff = MagicMock(next_delay=MagicMock(return_value=100), attempts=0)
+
+    sent = []
+    mock_ws = MagicMock()
+    mock_ws.closed = False
+    mock_ws.__aenter__ = AsyncMock(return_value=mock_ws)
+    mock_ws.__aexit__ = AsyncMock()
+
+    async def send_json(frame):
+        sent.append(frame["method"])
+
+    async def receive(timeout):
+        # Half-open connection: nothing ever arrives
+        await asyncio.sleep(timeout)
+        raise TimeoutError
+
+    mock_ws.send_json = send_json
+    mock_ws.receive = receive
+
+    session = MagicMock()
+    session.ws_connect.return_value = mock_ws
+
+    with (
+        patch.object(mock_coordinator, "_get_session", return_value=session),
+        patch.object(mock_coordinator, "async_refresh"),
+    ):
+        task = asyncio.create_task(mock_coordinator._websocket_listener())
+        await asyncio.sleep(0.3)
+
+        # Heartbeat pinged the idle socket, then the reader gave up and fell back to polling
+        assert "Sys.GetStatus" in sent
+        assert mock_coordinator._ws is None
+        assert mock_coordinator.update_interval == timedelta(seconds=UPDATE_INTERVAL)
+        assert mock_coordinator.connection_stats["circuit"]["failures"] == 1
+
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await mock_coordinator.async_shutdown()
+
+
+async def test_websocket_frames_keep_connection_alive(hass: HomeAssistant, mock_coordinator):
+    """Test that regular frames suppress heartbeat pings."""
+    mock_coordinator._liveness_timeout = 0.3
+    ws = MagicMock()
+    ws.closed = False
+    ws.send_json = AsyncMock()
+    mock_coordinator._ws_last_frame = time.monotonic() + 10  # Frames keep arriving
+
+    heartbeat = asyncio.create_task(mock_coordinator._websocket_heartbeat(ws))
+    await asyncio.sleep(0.25)
+    ws.closed = True
+    await heartbeat
+
+    ws.send_json.assert_not_called()
+
+
+# ===== WebSocket frame dispatch =====
+
+
+async def test_ws_text_ignores_untracked_components_without_parsing(hass: HomeAssistant, mock_coordinator):
+    """Test the early-out for power metering notifications."""
+    frame = '{"src":"shellypro4pm-1","dst":"x","method":"NotifyStatus","params":{"ts":1,"switch:0":{"apower":9.5}}}'
+
+    with patch("custom_components.shabman.coordinator.json_loads") as mock_loads:
+        mock_coordinator._handle_ws_text(frame)
+
+    mock_loads.assert_not_called()
+    assert mock_coordinator.connection_stats["websocket_frames"] == {"frames": 1, "ignored": 1}
+
+
+async def test_ws_text_routes_script_status(hass: HomeAssistant, mock_coordinator):
+    """Test that script components are routed to the delta handler."""
+    _set_scripts(mock_coordinator, [{"id": 1, "name": "a", "running": False}])
+
+    mock_coordinator._handle_ws_text(
+        '{"src":"shelly","method":"NotifyStatus","params":{"switch:0":{"output":true},"script:1":{"running":true}}}'
+    )
+
+    assert mock_coordinator.data["scripts"][0]["running"] is True
+    assert mock_coordinator.data["running_count"] == 1
+
+
+async def test_ws_text_resolves_responses_containing_notify_text(hass: HomeAssistant, mock_coordinator):
+    """Test that RPC responses are never dropped by the early-out."""
+    future = hass.loop.create_future()
+    mock_coordinator._ws_pending[7] = future
+
+    mock_coordinator._handle_ws_text(
+        '{"id":7,"src":"shelly","result":{"data":"emit(\\"method\\":\\"NotifyStatus\\")"}}'
+    )
+
+    assert future.result() == {"data": 'emit("method":"NotifyStatus")'}
+
+
+async def test_sys_config_revision_change_refreshes(hass: HomeAssistant, mock_coordinator):
+    """Test that configuration changes reported by sys trigger a refresh."""
+    _set_scripts(mock_coordinator, [])
+
+    with patch.object(mock_coordinator, "async_refresh") as mock_refresh:
+        mock_coordinator._handle_ws_text('{"method":"NotifyStatus","params":{"sys":{"cfg_rev":10}}}')
+        mock_coordinator._handle_ws_text('{"method":"NotifyStatus","params":{"sys":{"cfg_rev":10}}}')
+        await _run_scheduled_refreshes(hass)
+        mock_refresh.assert_not_called()
+
+        mock_coordinator._handle_ws_text('{"method":"NotifyStatus","params":{"sys":{"cfg_rev":11}}}')
+        await _run_scheduled_refreshes(hass)
+
+    mock_refresh.assert_called_once()
+
+
+# ===== Request scheduling =====
+
+
+async def test_switch_command_goes_ahead_of_polling(hass: HomeAssistant, mock_coordinator):
+    """Test that commands skip the queue of a polling burst."""
+    mock_coordinator._bulk_status_supported = False
+    order = []
+    release = asyncio.Event()
+
+    async def fake_http_call(method, params, timeout, http_get):
+        order.append(method)
+        if method == "Script.List":
+            return {"scripts": [{"id": i, "name": f"s{i}", "enable": False} for i in range(1, 7)]}
+        await release.wait()
+        return {"id": params["id"], "running": False} if method == "Script.GetStatus" else {}
+
+    with patch.object(mock_coordinator, "_http_call", side_effect=fake_http_call):
+        refresh = asyncio.create_task(mock_coordinator._async_update_data())
+        await asyncio.sleep(0.01)
+        toggle = asyncio.create_task(mock_coordinator.start_script(1))
+        await asyncio.sleep(0.01)
+
+        assert mock_coordinator.rpc_stats["queue_depth"] == 5
+        release.set()
+        await asyncio.gather(refresh, toggle)
+
+    # Only RPC_MAX_CONCURRENT status calls were in flight, the toggle came right after them
+    assert order.index("Script.Start") == 1 + RPC_MAX_CONCURRENT
+    assert mock_coordinator.rpc_stats["interactive"]["queued"] == 1
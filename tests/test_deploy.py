@@ -0,0 +1,356 @@
+# tests/test_deploy.py
+
+"""Test fleet deployments of shABman scripts."""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+from homeassistant.core import HomeAssistant
+
+from custom_components.shabman.backup import BackupStore
+from custom_components.shabman.const import EVENT_DEPLOY_PROGRESS
+from custom_components.shabman.deploy import (
+    DeployStatus,
+    async_deploy_script,
+    async_restore_script,
+    async_rollout_script,
+    plan_waves,
+    script_health_problem,
+)
+
+
+def _mock_coordinator(device_id: str, script: dict | None = None, unchanged: bool = False, ok: bool = True):
+    """Create a coordinator mock holding at most one script."""
+    coordinator = MagicMock()
+    coordinator.device_id = device_id
+    coordinator.deploy_lock = asyncio.Lock()
+    coordinator.find_script.return_value = script
+    coordinator.code_unchanged.return_value = unchanged
+    coordinator.upload_script = AsyncMock(return_value=ok)
+    coordinator.update_script = AsyncMock(return_value=ok)
+    coordinator.async_request_refresh = AsyncMock()
+    coordinator.get_script_code = AsyncMock(return_value="old code")
+    coordinator.get_script_source = AsyncMock(return_value="old code")
+    coordinator.get_script_status = AsyncMock(return_value=None)
+    coordinator.start_script = AsyncMock(return_value=True)
+    coordinator.delete_script = AsyncMock(return_value=True)
+    return coordinator
+
+
+async def test_deploy_script_results(hass: HomeAssistant):
+    """Test new, changed, unchanged and failing devices."""
+    new = _mock_coordinator("new")
+    changed = _mock_coordinator("changed", script={"id": 4, "name": "test"})
+    unchanged = _mock_coordinator("unchanged", script={"id": 2, "name": "test"}, unchanged=True)
+    failing = _mock_coordinator("failing", ok=False)
+
+    events = []
+    hass.bus.async_listen(EVENT_DEPLOY_PROGRESS, events.append)
+
+    results = await async_deploy_script(
+        hass, [new, changed, unchanged, failing], "test", "code", max_concurrent=2, deploy_id="abc"
+    )
+    await hass.async_block_till_done()
+
+    assert {result.device_id: result.status for result in results} == {
+        "new": DeployStatus.OK,
+        "changed": DeployStatus.OK,
+        "unchanged": DeployStatus.SKIPPED,
+        "failing": DeployStatus.FAILED,
+    }
+    assert results[0].bytes == 4
+    assert results[2].bytes == 0
+    assert results[3].error
+
+    new.upload_script.assert_called_once_with("test", "code")
+    changed.update_script.assert_called_once_with(4, "test", "code", force=True)
+    unchanged.update_script.assert_not_called()
+
+    assert len(events) == 4
+    assert {event.data["deploy_id"] for event in events} == {"abc"}
+    assert sorted(event.data["completed"] for event in events) == [1, 2, 3, 4]
+    assert {event.data["total"] for event in events} == {4}
+
+
+async def test_deploy_script_force(hass: HomeAssistant):
+    """Test force uploads to devices that already hold the code."""
+    coordinator = _mock_coordinator("device", script={"id": 2, "name": "test"}, unchanged=True)
+
+    results = await async_deploy_script(hass, [coordinator], "test", "code", force=True, max_concurrent=1)
+
+    assert results[0].status is DeployStatus.OK
+    coordinator.update_script.assert_called_once()
+
+
+async def test_deploy_script_concurrency_limit(hass: HomeAssistant):
+    """Test no more than max_concurrent devices are updated at once."""
+    active = 0
+    peak = 0
+
+    async def upload(name, code):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0)
+        active -= 1
+        return True
+
+    coordinators = [_mock_coordinator(f"device{i}") for i in range(6)]
+    for coordinator in coordinators:
+        coordinator.upload_script = AsyncMock(side_effect=upload)
+
+    results = await async_deploy_script(hass, coordinators, "test", "code", max_concurrent=2)
+
+    assert peak == 2
+    assert all(result.status is DeployStatus.OK for result in results)
+
+
+async def test_deploy_script_device_error(hass: HomeAssistant):
+    """Test an unexpected error on one device does not abort the others."""
+    broken = _mock_coordinator("broken")
+    broken.upload_script = AsyncMock(side_effect=RuntimeError("boom"))
+    healthy = _mock_coordinator("healthy")
+
+    results = await async_deploy_script(hass, [broken, healthy], "test", "code", max_concurrent=2)
+
+    assert results[0].status is DeployStatus.FAILED
+    assert results[0].error == "boom"
+    assert results[1].status is DeployStatus.OK
+
+
+# ===== Rollouts in Waves =====
+
+
+def test_plan_waves():
+    """Test the canary wave comes first and the rest is split by wave size."""
+    devices = list(range(10))
+
+    assert plan_waves(devices, 10, 4) == [[0], [1, 2, 3, 4], [5, 6, 7, 8], [9]]
+    assert plan_waves(devices, 1, None) == [[0], list(range(1, 10))]
+    assert plan_waves(devices, None, 5) == [list(range(5)), list(range(5, 10))]
+    assert plan_waves([], 10, 4) == []
+
+
+def test_script_health_problem():
+    """Test crashed, stopped and memory hungry scripts are reported."""
+    assert script_health_problem({"running": True, "mem_peak": 100}, True, 1000) is None
+    assert script_health_problem({"running": False}, False, None) is None
+    assert script_health_problem(None, False, None) == "script missing"
+    assert "errors" in script_health_problem({"running": False, "errors": ["crashed"]}, True, None)
+    assert script_health_problem({"running": False}, True, None) == "script stopped"
+    assert "mem_peak" in script_health_problem({"running": True, "mem_peak": 5000}, True, 1000)
+
+
+def _device(device_id: str, script: dict | None = None):
+    """Create a coordinator mock whose script can be changed by a deployment."""
+    coordinator = _mock_coordinator(device_id, script=script)
+    coordinator.script = script
+    coordinator.find_script.side_effect = lambda name: coordinator.script
+    return coordinator
+
+
+async def test_rollout_healthy(hass: HomeAssistant):
+    """Test a healthy rollout continues through all waves."""
+    devices = [_device(f"device{i}", {"id": 1, "name": "test", "running": True}) for i in range(3)]
+
+    rollout = await async_rollout_script(
+        hass, devices, "test", "code", max_concurrent=2, canary_percent=10, wave_size=2, soak_time=0.01
+    )
+
+    assert rollout.halted is False
+    assert [result.status for result in rollout.results] == [DeployStatus.OK] * 3
+    assert rollout.as_dict()["results"]["device0"]["status"] == "ok"
+
+
+async def test_rollout_halts_on_crashed_canary(hass: HomeAssistant):
+    """Test a crashing canary halts the rollout and is rolled back."""
+    canary = _device("canary", {"id": 1, "name": "test", "running": True})
+    others = [_device(f"device{i}", {"id": 1, "name": "test", "running": True}) for i in range(3)]
+
+    async def crash(script_id, name, code, force=False):
+        canary.script = {"id": 1, "name": "test", "running": code != "code", "errors": ["crashed"]}
+        return True
+
+    canary.update_script = AsyncMock(side_effect=crash)
+
+    rollout = await async_rollout_script(
+        hass, [canary, *others], "test", "code", max_concurrent=2, canary_percent=25, soak_time=0.01
+    )
+
+    assert rollout.halted is True
+    assert "canary" in rollout.reason
+    assert [result.status for result in rollout.results] == [DeployStatus.ROLLED_BACK] + [DeployStatus.CANCELLED] * 3
+    canary.update_script.assert_called_with(1, "test", "old code", force=True)
+    canary.start_script.assert_called_once_with(1)
+    for device in others:
+        device.update_script.assert_not_called()
+
+
+async def test_rollout_soak_reads_script_status(hass: HomeAssistant):
+    """Test the soak reads the memory usage from the device, the coordinator data may be old."""
+    canary = _device("canary", {"id": 1, "name": "test", "running": True, "mem_peak": 100})
+    other = _device("other", {"id": 1, "name": "test", "running": True, "mem_peak": 100})
+    canary.get_script_status = AsyncMock(
+        return_value={"id": 1, "running": True, "enabled": False, "mem_used": 9000, "mem_free": 0, "mem_peak": 9000}
+    )
+
+    rollout = await async_rollout_script(
+        hass, [canary, other], "test", "code", max_concurrent=2, canary_percent=50, soak_time=0.01, max_mem_peak=5000
+    )
+
+    assert rollout.halted is True
+    assert rollout.reason.endswith("canary: mem_peak 9000 above 5000")
+    canary.get_script_status.assert_called_with(1)
+    other.update_script.assert_not_called()
+
+
+async def test_rollout_halts_on_failed_wave(hass: HomeAssistant):
+    """Test a failed deployment rolls back all devices updated so far."""
+    canary = _device("canary")  # Script is new here and gets deleted on rollback
+    healthy = _device("healthy", {"id": 2, "name": "test", "running": False})
+    failing = _device("failing", {"id": 3, "name": "test", "running": False})
+    failing.update_script = AsyncMock(return_value=False)
+    cancelled = _device("cancelled")
+
+    async def create(name, code):
+        canary.script = {"id": 5, "name": name, "running": False}
+        return True
+
+    canary.upload_script = AsyncMock(side_effect=create)
+
+    rollout = await async_rollout_script(
+        hass,
+        [canary, healthy, failing, cancelled],
+        "test",
+        "code",
+        max_concurrent=2,
+        canary_percent=25,
+        wave_size=2,
+        soak_time=0,
+    )
+
+    assert rollout.halted is True
+    assert {result.device_id: result.status for result in rollout.results} == {
+        "canary": DeployStatus.ROLLED_BACK,
+        "healthy": DeployStatus.ROLLED_BACK,
+        "failing": DeployStatus.FAILED,
+        "cancelled": DeployStatus.CANCELLED,
+    }
+    canary.delete_script.assert_called_once_with(5)
+    healthy.update_script.assert_called_with(2, "test", "old code", force=True)
+    healthy.start_script.assert_not_called()
+    failing.update_script.assert_called_with(3, "test", "old code", force=True)  # Rollback attempted
+
+
+async def test_rollout_rolls_back_failed_device(hass: HomeAssistant):
+    """Test the device whose update failed is restored along with the rest of its wave."""
+    good = _device("good", {"id": 1, "name": "test", "running": True})
+    bad = _device("bad", {"id": 2, "name": "test", "running": True})
+    bad.update_script = AsyncMock(side_effect=[False, True])  # The deployment fails, the rollback works
+
+    rollout = await async_rollout_script(
+        hass, [good, bad], "test", "new", max_concurrent=2, canary_percent=100, soak_time=0
+    )
+
+    assert rollout.halted is True
+    assert {result.device_id: result.status for result in rollout.results} == {
+        "good": DeployStatus.ROLLED_BACK,
+        "bad": DeployStatus.ROLLED_BACK,
+    }
+    assert rollout.results[1].error  # The failure of the deployment is still reported
+    assert [call.args for call in bad.update_script.call_args_list] == [
+        (2, "test", "new"),
+        (2, "test", "old code"),
+    ]
+    bad.start_script.assert_called_once_with(2)
+
+
+async def test_deploy_script_backs_up_replaced_code(hass: HomeAssistant, tmp_path):
+    """Test the code of updated scripts is backed up before it is replaced."""
+    store = BackupStore(tmp_path)
+    changed = _mock_coordinator("changed", script={"id": 4, "name": "test"})
+    new = _mock_coordinator("new")
+    changed.hass = new.hass = hass
+
+    await async_deploy_script(hass, [changed, new], "test", "code", max_concurrent=2, backup_store=store)
+
+    backups = store.entries()
+    assert [(entry.device_id, entry.script_id, entry.name) for entry in backups] == [("changed", 4, "test")]
+    assert store.read(backups[0].hash) == "old code"
+
+
+async def test_restore_script(hass: HomeAssistant, tmp_path):
+    """Test a rollback restores the newest backup that differs from the device, a restore the chosen one."""
+    store = BackupStore(tmp_path)
+    for code in ("v1", "v2", "v3"):
+        store.add("device", 4, "test", code)
+    coordinator = _mock_coordinator("device", script={"id": 4, "name": "test"})
+    coordinator.hass = hass
+    coordinator.get_code_hash.return_value = None
+    coordinator.code_unchanged.side_effect = lambda script_id, code: code == "v3"
+
+    results = await async_restore_script([coordinator], store, "test", max_concurrent=1)
+
+    assert results[0].status is DeployStatus.OK
+    coordinator.get_script_code.assert_called_once_with(4)  # Learns the current hash
+    coordinator.update_script.assert_called_once_with(4, "test", "v2", force=True)
+
+    version = store.entries(name="test")[-1].hash[:8]
+    coordinator.update_script.reset_mock()
+    results = await async_restore_script([coordinator], store, "test", version=version, max_concurrent=1)
+
+    assert results[0].status is DeployStatus.OK
+    coordinator.update_script.assert_called_once_with(4, "test", "v1", force=True)
+
+
+def _device_holding(device_id: str, code: str, ok: bool = True):
+    """Create a coordinator mock whose script holds code, updated by successful update_script calls."""
+    coordinator = _mock_coordinator(device_id, script={"id": 4, "name": "test"})
+    coordinator.code = code
+    coordinator.code_unchanged.side_effect = lambda script_id, code: code == coordinator.code
+    coordinator.get_script_source = AsyncMock(side_effect=lambda script_id: coordinator.code)
+
+    async def update_script(script_id, name, code, force=False):
+        if ok:
+            coordinator.code = code
+        return ok
+
+    coordinator.update_script = AsyncMock(side_effect=update_script)
+    return coordinator
+
+
+async def test_rollback_script_twice(hass: HomeAssistant, tmp_path):
+    """Test running a rollback again only retries the devices that did not roll back."""
+    store = BackupStore(tmp_path)
+    done = _device_holding("done", "bad")
+    failing = _device_holding("failing", "bad", ok=False)
+    for coordinator in (done, failing):
+        coordinator.hass = hass
+        store.add(coordinator.device_id, 4, "test", "v1")
+        store.add(coordinator.device_id, 4, "test", "good")  # Backed up by the bad deployment
+
+    results = await async_restore_script([done, failing], store, "test", max_concurrent=2)
+
+    assert [result.status for result in results] == [DeployStatus.OK, DeployStatus.FAILED]
+    assert (done.code, failing.code) == ("good", "bad")
+    assert store.entries("done", 4)[0].by_restore is True
+
+    failing.update_script = AsyncMock(return_value=True)
+    done.update_script.reset_mock()
+    results = await async_restore_script([done, failing], store, "test", max_concurrent=2)
+
+    assert [result.status for result in results] == [DeployStatus.SKIPPED, DeployStatus.OK]
+    done.update_script.assert_not_called()
+    failing.update_script.assert_called_once_with(4, "test", "good", force=True)
+
+
+async def test_restore_script_without_backup(hass: HomeAssistant, tmp_path):
+    """Test devices without a matching backup fail without being touched."""
+    coordinator = _mock_coordinator("device", script={"id": 4, "name": "test"})
+    coordinator.hass = hass
+
+    results = await async_restore_script([coordinator], BackupStore(tmp_path), "test", max_concurrent=1)
+
+    assert results[0].status is DeployStatus.FAILED
+    assert results[0].error == "No backup to restore"
+    coordinator.update_script.assert_not_called()
@@ -0,0 +1,19 @@
+# tests/test_diagnostics.py
+
+"""Test the shABman diagnostics."""
+
+from homeassistant.core import HomeAssistant
+
+from custom_components.shabman.diagnostics import async_get_config_entry_diagnostics
+
+
+async def test_diagnostics(hass: HomeAssistant, setup_integration):
+    """Test diagnostics contain data and scheduler statistics."""
+    entry = setup_integration
+
+    diagnostics = await async_get_config_entry_diagnostics(hass, entry)
+
+    assert diagnostics["entry"]["data"]["device_ip"] == "192.168.1.100"
+    assert len(diagnostics["data"]["scripts"]) == 2
+    assert diagnostics["refresh"]["suppressed"] == 0
+    assert diagnostics["last_upload"] is None
@@ -2,9 +2,17 @@
 
 """ "Test the shABman component initialization."""
 
+import asyncio
+import uuid
+from unittest.mock import patch
+
+from homeassistant.config_entries import ConfigEntryState
 from homeassistant.core import HomeAssistant
+from homeassistant.helpers.update_coordinator import UpdateFailed
+from pytest_homeassistant_custom_component.common import MockConfigEntry
 
-from custom_components.shabman.const import DOMAIN
+from custom_components.shabman import async_remove_entry
+from custom_components.shabman.const import CONF_DEVICE_IP, CONF_DEVICE_TYPE, DOMAIN, SNAPSHOT_STORAGE_KEY
 
 
 async def test_async_setup_entry(hass: HomeAssistant, setup_integration):
@@ -22,6 +30,9 @@ async def test_async_setup_entry(hass: HomeAssistant, setup_integration):
     assert hass.services.has_service(DOMAIN, "upload_script")
     assert hass.services.has_service(DOMAIN, "delete_script")
     assert hass.services.has_service(DOMAIN, "list_scripts")
+    assert hass.services.has_service(DOMAIN, "deploy_script")
+    assert hass.services.has_service(DOMAIN, "restore_script")
+    assert hass.services.has_service(DOMAIN, "rollback_script")
 
     # Explicitly cancel websocket task before test ends
     if hasattr(coordinator, "_ws_task") and coordinator._ws_task:
@@ -32,3 +43,85 @@ async def test_async_setup_entry(hass: HomeAssistant, setup_integration):
             pass
 
     await hass.async_block_till_done()
+
+
+def _offline_entry(hass: HomeAssistant) -> MockConfigEntry:
+    """Add a config entry for a device that does not answer."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={CONF_DEVICE_IP: "192.168.1.100", CONF_DEVICE_TYPE: "SNSW-001X16EU", "device_id": "offline"},
+        unique_id=str(uuid.uuid4()),
+    )
+    entry.add_to_hass(hass)
+    return entry
+
+
+async def test_setup_offline_device_retries(hass: HomeAssistant):
+    """Test an unreachable device without saved state is retried instead of failing setup."""
+    entry = _offline_entry(hass)
+
+    with patch(
+        "custom_components.shabman.coordinator.ShABmanCoordinator._async_update_data",
+        side_effect=UpdateFailed("offline"),
+    ):
+        await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+    assert entry.state is ConfigEntryState.SETUP_RETRY
+    assert entry.entry_id not in hass.data[DOMAIN]
+
+
+async def test_setup_warm_start_from_snapshot(hass: HomeAssistant, hass_storage):
+    """Test entities are created from the saved state and refreshed in the background."""
+    entry = _offline_entry(hass)
+    hass_storage[f"{SNAPSHOT_STORAGE_KEY}.{entry.entry_id}"] = {
+        "version": 1,
+        "key": f"{SNAPSHOT_STORAGE_KEY}.{entry.entry_id}",
+        "data": {"scripts": [{"id": 1, "name": "heating", "enabled": True, "running": True}]},
+    }
+
+    device_answers = asyncio.Event()
+
+    async def update_data():
+        await device_answers.wait()
+        raise UpdateFailed("offline")
+
+    with (
+        patch(
+            "custom_components.shabman.coordinator.ShABmanCoordinator._async_update_data",
+            side_effect=update_data,
+        ) as mock_update,
+        patch("custom_components.shabman.coordinator.ShABmanCoordinator.async_start_websocket"),
+    ):
+        await hass.config_entries.async_setup(entry.entry_id)
+        coordinator = hass.data[DOMAIN][entry.entry_id]
+
+        # Created from the snapshot before the device answered
+        assert entry.state is ConfigEntryState.LOADED
+        assert coordinator.restored
+        assert hass.states.get("switch.shelly_script_manager_heating").attributes["restored"] is True
+
+        device_answers.set()
+        await hass.async_block_till_done()
+
+    mock_update.assert_called_once()
+    assert hass.states.get("switch.shelly_script_manager_heating").state == "unavailable"
+
+    await hass.config_entries.async_unload(entry.entry_id)
+    await hass.async_block_till_done()
+
+
+async def test_snapshot_saved_after_refresh(hass: HomeAssistant, hass_storage, setup_integration):
+    """Test the coordinator data is saved for the next start and removed with the entry."""
+    entry = setup_integration
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+    key = f"{SNAPSHOT_STORAGE_KEY}.{entry.entry_id}"
+
+    coordinator._schedule_snapshot_save()
+    await coordinator._snapshot._async_handle_write_data()
+
+    assert [script["id"] for script in hass_storage[key]["data"]["scripts"]] == [1, 2]
+
+    await async_remove_entry(hass, entry)
+
+    assert key not in hass_storage
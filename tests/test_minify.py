@@ -0,0 +1,88 @@
+# tests/test_minify.py
+
+"""Tests for the shABman script minifier."""
+
+import pytest
+
+from custom_components.shabman.minify import MinifyError, minify
+
+
+def test_minify_strips_comments_and_whitespace():
+    """Test comments and indentation are removed."""
+    code = """
+    /* Toggle the relay */
+    function toggle(on) {
+        // Switch it
+        Shelly.call("Switch.Set", { id: 0, on: on });
+    }
+    """
+
+    assert minify(code) == 'function toggle(on){Shelly.call("Switch.Set",{id:0,on:on});}'
+
+
+def test_minify_keeps_strings_and_regex():
+    """Test strings, templates and regular expressions are copied unchanged."""
+    code = "let s = 'a  // b';\nlet t = `x  /* y */`;\nlet r = /\\/\\/ +[/]/g;\nlet d = 4 / 2 / 1;"
+
+    assert minify(code) == "let s='a  // b';let t=`x  /* y */`;let r=/\\/\\/ +[/]/g;let d=4/2/1;"
+
+
+def test_minify_keeps_line_breaks_for_asi():
+    """Test line breaks that may end a statement are kept."""
+    code = "let a = 1\nlet b = a\n++b\nreturn\n(a)"
+
+    assert minify(code) == "let a=1\nlet b=a\n++b\nreturn\n(a)"
+
+
+def test_minify_keeps_tokens_apart():
+    """Test tokens that would merge are separated by a space."""
+    assert minify("let a = b + +c;") == "let a=b+ +c;"
+    assert minify("let s = 1 .toString();") == "let s=1 .toString();"
+    assert minify("let s = 1.5 .toFixed();") == "let s=1.5.toFixed();"
+    assert minify("typeof  x") == "typeof x"
+
+
+def test_minify_mangle():
+    """Test declared names are shortened, globals and property names are kept."""
+    code = """
+    let counter = 0;
+    let config = { interval: 1000 };
+    function increment(step) {
+        counter = counter + step;
+        print(config.interval);
+    }
+    Timer.set(config.interval, true, function () { increment(1); });
+    """
+
+    result = minify(code, mangle=True)
+
+    assert "counter" not in result
+    assert "increment" not in result
+    assert "config" not in result
+    assert "interval" in result
+    assert "Timer.set(" in result
+    assert "print(" in result
+    assert minify(code) != result
+
+
+def test_minify_mangle_skips_names_used_as_keys():
+    """Test names also used as object keys or in shorthand properties are not renamed."""
+    code = "let total = 1;\nlet state = { total };\nlet other = { total: total };"
+
+    result = minify(code, mangle=True)
+
+    assert "total" in result
+    assert "state" not in result
+
+
+def test_minify_mangle_skips_template_substitutions():
+    """Test nothing is renamed if a template literal references names."""
+    code = "let count = 1;\nprint(`${count}`);"
+
+    assert minify(code, mangle=True) == minify(code)
+
+
+def test_minify_error():
+    """Test code that cannot be tokenized raises MinifyError."""
+    with pytest.raises(MinifyError):
+        minify('let s = "unterminated;')
@@ -0,0 +1,86 @@
+# tests/test_scheduler.py
+
+"""Test the shABman per-device request scheduler."""
+
+import asyncio
+
+import pytest
+
+from custom_components.shabman.scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, RpcScheduler
+
+
+async def _request(scheduler: RpcScheduler, priority: int, name: str, order: list, release: asyncio.Event):
+    """Hold a slot until released and record the order slots were granted."""
+    async with scheduler.slot(priority):
+        order.append(name)
+        await release.wait()
+
+
+async def test_concurrency_cap():
+    """Test that no more than max_concurrent requests run at once."""
+    scheduler = RpcScheduler(max_concurrent=2)
+    order: list[str] = []
+    release = asyncio.Event()
+
+    tasks = [
+        asyncio.create_task(_request(scheduler, PRIORITY_BACKGROUND, f"poll{i}", order, release)) for i in range(5)
+    ]
+    await asyncio.sleep(0)
+
+    assert order == ["poll0", "poll1"]
+    assert scheduler.queue_depth == 3
+
+    release.set()
+    await asyncio.gather(*tasks)
+
+    assert order == ["poll0", "poll1", "poll2", "poll3", "poll4"]
+    stats = scheduler.as_dict()
+    assert stats["active"] == 0
+    assert stats["queue_depth"] == 0
+    assert stats["background"]["requests"] == 5
+    assert stats["background"]["queued"] == 3
+
+
+async def test_interactive_goes_ahead_of_polling():
+    """Test that queued interactive requests are served before queued polling."""
+    scheduler = RpcScheduler(max_concurrent=1)
+    order: list[str] = []
+    release = asyncio.Event()
+
+    tasks = [asyncio.create_task(_request(scheduler, PRIORITY_BACKGROUND, "poll0", order, release))]
+    await asyncio.sleep(0)
+    tasks += [
+        asyncio.create_task(_request(scheduler, PRIORITY_BACKGROUND, "poll1", order, release)),
+        asyncio.create_task(_request(scheduler, PRIORITY_BACKGROUND, "poll2", order, release)),
+        asyncio.create_task(_request(scheduler, PRIORITY_INTERACTIVE, "toggle", order, release)),
+    ]
+    await asyncio.sleep(0)
+
+    release.set()
+    await asyncio.gather(*tasks)
+
+    assert order == ["poll0", "toggle", "poll1", "poll2"]
+    assert scheduler.as_dict()["interactive"]["queued"] == 1
+
+
+async def test_cancelled_waiter_releases_nothing():
+    """Test that cancelled waiters do not leak or block slots."""
+    scheduler = RpcScheduler(max_concurrent=1)
+    order: list[str] = []
+    release = asyncio.Event()
+
+    first = asyncio.create_task(_request(scheduler, PRIORITY_BACKGROUND, "first", order, release))
+    await asyncio.sleep(0)
+    cancelled = asyncio.create_task(_request(scheduler, PRIORITY_INTERACTIVE, "cancelled", order, release))
+    last = asyncio.create_task(_request(scheduler, PRIORITY_BACKGROUND, "last", order, release))
+    await asyncio.sleep(0)
+
+    cancelled.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await cancelled
+
+    release.set()
+    await asyncio.gather(first, last)
+
+    assert order == ["first", "last"]
+    assert scheduler.as_dict()["active"] == 0
@@ -6,8 +6,11 @@ from unittest.mock import patch
 
 import pytest
 from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import HomeAssistantError
 
+from custom_components.shabman.backup import get_backup_store
 from custom_components.shabman.const import DOMAIN
+from custom_components.shabman.upload import code_hash
 
 
 async def test_service_upload_script(hass: HomeAssistant, setup_integration):
@@ -41,7 +44,28 @@ async def test_service_upload_script(hass: HomeAssistant, setup_integration):
         )
         await hass.async_block_till_done()
 
-        mock_upload.assert_called_once_with("test_script", "console.log('test');")
+        mock_upload.assert_called_once_with("test_script", "console.log('test');", force=False)
+
+
+async def test_service_upload_script_force(hass: HomeAssistant, setup_integration):
+    """Test upload_script service passes force to the coordinator."""
+    entry = setup_integration
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+
+    with patch.object(coordinator, "upload_script", return_value=True) as mock_upload:
+        await hass.services.async_call(
+            DOMAIN,
+            "upload_script",
+            {
+                "device_id": entry.data["device_id"],
+                "name": "test_script",
+                "code": "console.log('test');",
+                "force": True,
+            },
+            blocking=True,
+        )
+
+        mock_upload.assert_called_once_with("test_script", "console.log('test');", force=True)
 
 
 async def test_service_delete_script(hass: HomeAssistant, setup_integration):
@@ -87,3 +111,108 @@ async def test_service_list_scripts(hass: HomeAssistant, setup_integration):
         blocking=True,
     )
     await hass.async_block_till_done()
+
+
+async def test_service_deploy_script(hass: HomeAssistant, setup_integration):
+    """Test deploy_script service returns per-device results."""
+    entry = setup_integration
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+    device_id = entry.data["device_id"]
+
+    with patch.object(coordinator, "upload_script", return_value=True) as mock_upload:
+        response = await hass.services.async_call(
+            DOMAIN,
+            "deploy_script",
+            {"device_ids": [device_id, "unknown"], "name": "new_script", "code": "print(1);"},
+            blocking=True,
+            return_response=True,
+        )
+
+        mock_upload.assert_called_once_with("new_script", "print(1);")
+
+    assert response["results"][device_id]["status"] == "ok"
+    assert response["results"][device_id]["bytes"] == 9
+    assert response["results"]["unknown"]["status"] == "failed"
+
+
+async def test_service_deploy_script_by_type(hass: HomeAssistant, setup_integration):
+    """Test deploy_script service selects devices by type."""
+    entry = setup_integration
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+
+    with patch.object(coordinator, "update_script", return_value=True) as mock_update:
+        response = await hass.services.async_call(
+            DOMAIN,
+            "deploy_script",
+            {"device_type": "SNSW-001X16EU", "name": "BLU_Gateway", "code": "print(1);"},
+            blocking=True,
+            return_response=True,
+        )
+        # Existing script is updated in place
+        mock_update.assert_called_once_with(1, "BLU_Gateway", "print(1);", force=True)
+
+        response = await hass.services.async_call(
+            DOMAIN,
+            "deploy_script",
+            {"device_type": "other", "name": "BLU_Gateway", "code": "print(1);"},
+            blocking=True,
+            return_response=True,
+        )
+
+    assert response["results"] == {}
+
+
+async def test_service_deploy_script_unknown_include(hass: HomeAssistant, setup_integration):
+    """Test deploy_script fails before touching any device if an include cannot be resolved."""
+    entry = setup_integration
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+
+    with (
+        patch.object(coordinator, "upload_script", return_value=True) as mock_upload,
+        pytest.raises(HomeAssistantError, match="missing_module"),
+    ):
+        await hass.services.async_call(
+            DOMAIN,
+            "deploy_script",
+            {"all": True, "name": "new_script", "code": "// @include missing_module\nprint(1);"},
+            blocking=True,
+            return_response=True,
+        )
+
+    mock_upload.assert_not_called()
+
+
+async def test_service_rollback_script(hass: HomeAssistant, setup_integration):
+    """Test rollback_script restores the previous version and list_backups finds it."""
+    entry = setup_integration
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+    device_id = entry.data["device_id"]
+    store = get_backup_store(hass)
+    await hass.async_add_executor_job(store.add, device_id, 1, "BLU_Gateway", "print('good');")
+
+    with (
+        patch.object(coordinator, "get_script_source", return_value="print('bad');"),
+        patch.object(coordinator, "get_code_hash", return_value=code_hash("print('bad');")),
+        patch.object(coordinator, "update_script", return_value=True) as mock_update,
+    ):
+        response = await hass.services.async_call(
+            DOMAIN,
+            "rollback_script",
+            {"device_ids": [device_id, "unknown"], "name": "BLU_Gateway"},
+            blocking=True,
+            return_response=True,
+        )
+
+    mock_update.assert_called_once_with(1, "BLU_Gateway", "print('good');", force=True)
+    assert response["results"][device_id]["status"] == "ok"
+    assert response["results"]["unknown"]["status"] == "failed"
+
+    response = await hass.services.async_call(
+        DOMAIN, "list_backups", {"name": "gateway"}, blocking=True, return_response=True
+    )
+
+    # The replaced version was backed up as well, so the rollback can be undone
+    assert [backup["version"] for backup in response["backups"]] == [
+        code_hash("print('bad');"),
+        code_hash("print('good');"),
+    ]
@@ -340,3 +340,28 @@ async def test_switch_available_when_script_deleted(hass: HomeAssistant, setup_i
     state = hass.states.get(entity_id)
     assert state is not None
     assert state.state == "unavailable"
+
+
+async def test_switch_state_from_script_index(hass: HomeAssistant, setup_integration):
+    """Test the switches follow the id index built by the coordinator."""
+    entry = setup_integration
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+
+    scripts = [
+        {"id": 1, "name": "BLU_Gateway", "enabled": False, "running": False, "mem_used": 321},
+        {"id": 2, "name": "test_script", "enabled": True, "running": True},
+    ]
+    coordinator.async_set_updated_data(coordinator._build_data(scripts))
+    await hass.async_block_till_done()
+
+    state = hass.states.get("switch.shelly_script_manager_blu_gateway")
+    assert state.state == "off"
+    assert state.attributes["memory_used"] == 321
+    assert hass.states.get("switch.shelly_script_manager_test_script").state == "on"
+    assert hass.states.get("switch.shelly_script_manager_test_script_run_on_startup").state == "on"
+
+    # Removed scripts drop out of the index as well
+    coordinator.async_set_updated_data(coordinator._build_data(scripts[:1]))
+    await hass.async_block_till_done()
+
+    assert hass.states.get("switch.shelly_script_manager_test_script").state == "unavailable"
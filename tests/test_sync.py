@@ -0,0 +1,200 @@
+# tests/test_sync.py
+
+"""Test the declarative script sync."""
+
+import asyncio
+import os
+from unittest.mock import AsyncMock, MagicMock
+
+from custom_components.shabman.bundle import ScriptBundler
+from custom_components.shabman.sync import (
+    ScriptDirectoryIndex,
+    async_sync_device,
+    bundle_sources,
+    desired_scripts,
+    load_source,
+)
+from custom_components.shabman.upload import code_hash
+
+
+def test_load_source_directives():
+    """Test the desired state is read from the header comment only."""
+    source = load_source("test", "// Heating\n// shabman: enable=true running=FALSE\nlet a = 1;\n")
+    assert (source.enable, source.running) == (True, False)
+    assert source.hash == code_hash(source.code)
+
+    source = load_source("test", "let a = 1;\n// shabman: enable=true\n")
+    assert (source.enable, source.running) == (None, None)
+
+
+def test_directory_index_reads_only_changed_files(tmp_path):
+    """Test unchanged files are served from the index."""
+    (tmp_path / "_all").mkdir()
+    (tmp_path / "shellyplus1pm-1").mkdir()
+    (tmp_path / "_all" / "common.js").write_text("let common;")
+    (tmp_path / "shellyplus1pm-1" / "heating.js").write_text("let heating;")
+    (tmp_path / "shellyplus1pm-1" / "notes.txt").write_text("ignored")
+
+    index = ScriptDirectoryIndex(tmp_path)
+    folders = index.scan()
+
+    assert set(folders) == {"_all", "shellyplus1pm-1"}
+    assert set(folders["shellyplus1pm-1"]) == {"heating"}
+    assert index.stats["reads"] == 2
+
+    index.scan()
+    assert index.stats["reads"] == 2
+
+    heating = tmp_path / "shellyplus1pm-1" / "heating.js"
+    heating.write_text("let heating = true;")
+    os.utime(heating, ns=(1, 1))
+    (tmp_path / "_all" / "common.js").unlink()
+
+    folders = index.scan()
+    assert index.stats["reads"] == 3
+    assert folders["shellyplus1pm-1"]["heating"].code == "let heating = true;"
+    assert folders["_all"] == {}
+
+
+def test_directory_index_missing_root(tmp_path):
+    """Test a missing sync folder syncs nothing."""
+    assert ScriptDirectoryIndex(tmp_path / "missing").scan() == {}
+
+
+def test_desired_scripts_precedence():
+    """Test device folders override type folders, which override the group folder."""
+    folders = {
+        "_all": {"a": load_source("a", "all"), "b": load_source("b", "all")},
+        "SNSW-001P16EU": {"b": load_source("b", "type")},
+        "device": {"c": load_source("c", "device")},
+    }
+    coordinator = MagicMock(device_type="SNSW-001P16EU", device_id="device")
+
+    desired = desired_scripts(folders, coordinator)
+
+    assert {name: source.code for name, source in desired.items()} == {"a": "all", "b": "type", "c": "device"}
+
+
+def test_bundle_sources(tmp_path):
+    """Test includes of the sync scripts are inlined and unresolvable scripts are flagged."""
+    (tmp_path / "helpers.js").write_text("function helper() {}\n")
+    folders = {
+        "_all": {
+            "ok": load_source("ok", "// shabman: running=true\n// @include helpers\nhelper();\n"),
+            "broken": load_source("broken", "// @include missing\n"),
+        }
+    }
+
+    bundled = bundle_sources(folders, ScriptBundler(tmp_path))
+
+    ok = bundled["_all"]["ok"]
+    assert ok.code == "// shabman: running=true\nfunction helper() {}\n\nhelper();\n"
+    assert ok.hash == code_hash(ok.code)
+    assert ok.running is True
+    assert "not found" in bundled["_all"]["broken"].error
+    assert folders["_all"]["ok"].error is None  # The index entries are not modified
+
+
+def _mock_coordinator(scripts: list[dict], hashes: dict[int, str]):
+    """Create a coordinator mock holding the given scripts."""
+    coordinator = MagicMock()
+    coordinator.device_id = "device"
+    coordinator.deploy_lock = asyncio.Lock()
+    coordinator.data = {"scripts": scripts}
+    coordinator.find_script.side_effect = lambda name: next((s for s in scripts if s["name"] == name), None)
+    coordinator.get_code_hash.side_effect = hashes.get
+    coordinator.code_unchanged.side_effect = lambda script_id, code: hashes.get(script_id) == code_hash(code)
+    for method in (
+        "upload_script",
+        "update_script",
+        "delete_script",
+        "set_script_config",
+        "start_script",
+        "stop_script",
+        "get_script_code",
+        "async_request_refresh",
+        "async_refresh",
+    ):
+        setattr(coordinator, method, AsyncMock(return_value=True))
+    return coordinator
+
+
+async def test_sync_device():
+    """Test changed scripts are uploaded and unmanaged ones deleted."""
+    coordinator = _mock_coordinator(
+        [
+            {"id": 1, "name": "same", "enabled": True, "running": True},
+            {"id": 2, "name": "changed", "enabled": True, "running": True},
+            {"id": 3, "name": "stopped", "enabled": False, "running": False},
+            {"id": 4, "name": "unmanaged", "enabled": False, "running": False},
+        ],
+        {1: code_hash("same"), 2: code_hash("old"), 3: code_hash("stopped")},
+    )
+    desired = {
+        source.name: source
+        for source in (
+            load_source("same", "same"),
+            load_source("changed", "new"),
+            load_source("stopped", "// shabman: enable=true running=true\n"),
+            load_source("new", "new"),
+        )
+    }
+
+    result = await async_sync_device(coordinator, desired, delete_unmanaged=True)
+
+    assert result.as_dict() == {
+        "created": ["new"],
+        "updated": ["changed", "stopped"],
+        "deleted": ["unmanaged"],
+        "state_changed": ["stopped"],
+        "failed": [],
+        "unchanged": 1,
+    }
+    coordinator.upload_script.assert_called_once_with("new", "new")
+    coordinator.update_script.assert_any_call(2, "changed", "new", force=True)
+    coordinator.set_script_config.assert_called_once_with(3, True)
+    coordinator.start_script.assert_called_once_with(3)
+    coordinator.delete_script.assert_called_once_with(4)
+    coordinator.async_request_refresh.assert_called_once()
+
+
+async def test_sync_device_unchanged_is_free():
+    """Test a device in sync gets no calls, unknown hashes are learned from a download."""
+    hashes = {}
+    coordinator = _mock_coordinator([{"id": 1, "name": "same", "running": True}], hashes)
+    coordinator.get_script_code.side_effect = lambda script_id: hashes.update({1: code_hash("same")})
+
+    result = await async_sync_device(coordinator, {"same": load_source("same", "same")}, delete_unmanaged=True)
+
+    assert result.unchanged == 1
+    assert not result.changed
+    coordinator.get_script_code.assert_called_once_with(1)
+
+    await async_sync_device(coordinator, {"same": load_source("same", "same")}, delete_unmanaged=True)
+
+    coordinator.get_script_code.assert_called_once()
+    coordinator.update_script.assert_not_called()
+    coordinator.async_request_refresh.assert_not_called()
+
+
+async def test_sync_device_unbundled_script_fails():
+    """Test a script whose includes cannot be resolved fails and is not deleted as unmanaged."""
+    coordinator = _mock_coordinator([{"id": 1, "name": "broken"}], {})
+    source = load_source("broken", "// @include missing\n")
+    source.error = "Library module 'missing' not found"
+
+    result = await async_sync_device(coordinator, {"broken": source}, delete_unmanaged=True)
+
+    assert result.failed == ["broken"]
+    coordinator.update_script.assert_not_called()
+    coordinator.delete_script.assert_not_called()
+
+
+async def test_sync_device_without_folder_keeps_scripts():
+    """Test devices without sync folder are not cleaned up."""
+    coordinator = _mock_coordinator([{"id": 1, "name": "manual"}], {})
+
+    result = await async_sync_device(coordinator, {}, delete_unmanaged=True)
+
+    assert result.deleted == []
+    coordinator.delete_script.assert_not_called()
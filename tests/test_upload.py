@@ -0,0 +1,59 @@
+# tests/test_upload.py
+
+"""Test the shABman upload helpers."""
+
+from custom_components.shabman.upload import AdaptiveChunkSizer, UploadStats, next_chunk
+
+
+def test_next_chunk_ascii():
+    """Test chunks of ASCII code use the full chunk size."""
+    data = b"x" * 10
+
+    assert next_chunk(data, 0, 4) == ("xxxx", 4)
+    assert next_chunk(data, 8, 4) == ("xx", 10)
+
+
+def test_next_chunk_keeps_multibyte_characters():
+    """Test chunks never split a multibyte character."""
+    code = "a€b😀c" * 50
+    data = code.encode("utf-8")
+
+    chunks = []
+    offset = 0
+    while offset < len(data):
+        chunk, offset = next_chunk(data, offset, 5)
+        assert len(chunk.encode("utf-8")) <= 5
+        chunks.append(chunk)
+
+    assert "".join(chunks) == code
+
+
+def test_adaptive_chunk_sizer():
+    """Test the chunk size grows with fast and shrinks with slow or failed chunks."""
+    sizer = AdaptiveChunkSizer(512, 4096, 1.0)
+    assert sizer.size == 2048
+
+    sizer.record_latency(0.1)
+    assert sizer.size == 4096
+    sizer.record_latency(0.1)
+    assert sizer.size == 4096  # Device limit
+
+    sizer.record_latency(0.7)
+    assert sizer.size == 4096  # Within target
+
+    sizer.record_latency(2.0)
+    assert sizer.size == 2048
+
+    for _ in range(5):
+        sizer.record_failure()
+    assert sizer.size == 512
+
+
+def test_upload_stats():
+    """Test the upload throughput."""
+    assert UploadStats().throughput == 0.0
+
+    stats = UploadStats(bytes=1000, chunks=1, duration=0.5)
+
+    assert stats.throughput == 2000.0
+    assert stats.as_dict()["throughput"] == 2000.0